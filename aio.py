@@ -0,0 +1,156 @@
+"""asyncio front end for metadata extraction
+
+    record = await aio.extract(path)
+    async for record in aio.scan([root]):
+        ...
+
+Extraction blocks (file reads, PIL, EXIF parsing), so it runs on a
+bounded thread pool and the event loop only awaits the results. Regular
+files can't be polled for readiness, so the header reads happen on those
+threads too; the fast_reader path maps the file and only touches the
+pages holding headers and EXIF. Work is also limited per storage device
+(st_dev), so thousands of pending requests against one slow disk or
+network mount queue up instead of occupying every worker.
+"""
+import asyncio
+import contextvars
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from itertools import islice
+import metadata
+from batch import iter_image_files
+
+DEFAULT_WORKERS = min(32, (os.cpu_count() or 1) + 4)
+DEFAULT_DEVICE_LIMIT = 8
+# Paths taken from the directory walk per executor call
+WALK_BATCH = 256
+
+
+class Extractor:
+    """Shared executor and per-device limits for async extraction"""
+
+    def __init__(self, workers=DEFAULT_WORKERS, device_limit=DEFAULT_DEVICE_LIMIT, fast=True, executor=None):
+        self.executor = executor or ThreadPoolExecutor(max_workers=workers, thread_name_prefix='aio-extract')
+        self.owns_executor = executor is None
+        self.device_limit = device_limit
+        self.fast = fast
+        self.devices = {}
+        self.loop = None
+        # Directory -> st_dev, one stat per directory rather than per file
+        self.directory_devices = {}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self.owns_executor:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+
+    async def run(self, func, *args):
+        """Run a blocking call on the executor, keeping contextvars (tracing spans)"""
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(self.executor, partial(context.run, func, *args))
+
+    async def device_of(self, file_path):
+        directory = os.path.dirname(os.path.abspath(file_path))
+        device = self.directory_devices.get(directory)
+        if device is None:
+            try:
+                device = (await self.run(os.stat, directory)).st_dev
+            except OSError:
+                device = -1
+            self.directory_devices[directory] = device
+        return device
+
+    def limiter(self, device):
+        # asyncio primitives belong to one loop, start over under a new one
+        loop = asyncio.get_running_loop()
+        if loop is not self.loop:
+            self.loop = loop
+            self.devices = {}
+        semaphore = self.devices.get(device)
+        if semaphore is None:
+            semaphore = self.devices[device] = asyncio.Semaphore(self.device_limit)
+        return semaphore
+
+    async def extract(self, file_path):
+        """Extract one record without blocking the event loop
+
+        Raises OSError like metadata.extract when the file can't be read.
+        """
+        async with self.limiter(await self.device_of(file_path)):
+            return await self.run(metadata.extract, file_path, self.fast)
+
+    async def scan(self, paths, ordered=True, max_pending=None):
+        """Yield records for every image under paths
+
+        At most max_pending extractions are in flight, so the walk only
+        runs ahead of the consumer by that much. Files that vanish or
+        can't be read during the scan are skipped.
+        """
+        max_pending = max_pending or self.device_limit * 4
+        file_paths = iter_image_files(paths)
+        pending = []
+        try:
+            while True:
+                batch = await self.run(lambda: list(islice(file_paths, WALK_BATCH)))
+                if not batch:
+                    break
+                for file_path in batch:
+                    pending.append(asyncio.ensure_future(self.extract(file_path)))
+                    if len(pending) >= max_pending:
+                        pending, records = await self.collect(pending, ordered)
+                        for record in records:
+                            yield record
+            while pending:
+                pending, records = await self.collect(pending, ordered)
+                for record in records:
+                    yield record
+        finally:
+            for task in pending:
+                task.cancel()
+
+    @staticmethod
+    async def collect(pending, ordered):
+        """Wait for the oldest task (ordered) or any task; return (still pending, records)"""
+        if ordered:
+            done, rest = [pending[0]], pending[1:]
+            await asyncio.wait(done)
+        else:
+            finished, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            done = [task for task in pending if task in finished]
+            rest = [task for task in pending if task not in finished]
+        records = []
+        for task in done:
+            try:
+                records.append(task.result())
+            except OSError:
+                continue
+        return rest, records
+
+
+_default_extractor = None
+
+
+def default_extractor():
+    global _default_extractor
+    if _default_extractor is None:
+        _default_extractor = Extractor()
+    return _default_extractor
+
+
+async def extract(file_path):
+    """Extract one record on the shared default Extractor"""
+    return await default_extractor().extract(file_path)
+
+
+async def scan(paths, ordered=True):
+    """Yield records for every image under paths on the shared default Extractor"""
+    if isinstance(paths, (str, os.PathLike)):
+        paths = [paths]
+    async for record in default_extractor().scan(paths, ordered):
+        yield record
@@ -0,0 +1,268 @@
+"""Pixel statistics over the decoded image
+
+Per-channel histograms, mean and standard deviation, dominant colours,
+sharpness (variance of the Laplacian of luma), exposure clipping and
+whether the alpha channel is actually used. Everything is accumulated
+tile by tile (bands of rows) with NumPy, so the temporary arrays stay
+bounded however large the image is. PIL images are decoded once and
+converted band by band; 16-bit grayscale keeps its full range.
+"""
+import numpy as np
+from PIL import Image
+import metadata
+
+# Pixels per tile; a band of rows is read at a time
+TILE_PIXELS = 4 * 1024 * 1024
+# Dominant colours are counted on 4 bits per channel
+COLOR_BITS = 4
+DOMINANT_COLORS = 5
+# Luma at or below / at or above these counts as clipped
+SHADOW_CLIP = 2
+HIGHLIGHT_CLIP = 253
+
+# 8-bit modes analysed as they are; everything else is converted first
+ANALYSIS_MODES = {'L': ('L',), 'LA': ('L', 'A'), 'RGB': ('R', 'G', 'B'), 'RGBA': ('R', 'G', 'B', 'A')}
+# Integer grayscale analysed as 16 bits instead of being clipped to L
+WIDE_MODES = ('I', 'I;16', 'I;16L', 'I;16B', 'I;16N')
+WIDE_LEVELS = 1 << 16
+LUMA_WEIGHTS = np.array([299, 587, 114], dtype=np.uint32)
+
+
+def analysis_mode(pil_image):
+    """Mode to convert an image to before analysis, 'I;16' for 16-bit grayscale"""
+    mode = pil_image.mode
+    if mode in ANALYSIS_MODES:
+        return mode
+    has_alpha = 'A' in pil_image.getbands() or 'transparency' in pil_image.info
+    if mode in WIDE_MODES and not has_alpha:
+        return 'I;16'
+    if mode in ('1', 'F') and not has_alpha:
+        return 'L'
+    return 'RGBA' if has_alpha else 'RGB'
+
+
+def tile_rows(width):
+    return max(1, TILE_PIXELS // max(1, width))
+
+
+class StatsAccumulator:
+    """Running sums for one image, fed one band of rows at a time
+
+    levels is 256 for uint8 bands and WIDE_LEVELS for uint16 grayscale.
+    """
+
+    def __init__(self, bands, levels=256):
+        self.bands = bands
+        self.levels = levels
+        self.color_bands = len([band for band in bands if band != 'A'])
+        self.histograms = np.zeros((len(bands), levels), dtype=np.int64)
+        self.luma_histogram = np.zeros(levels, dtype=np.int64)
+        self.colors = np.zeros(1 << (3 * COLOR_BITS), dtype=np.int64) if self.color_bands == 3 else None
+        self.laplacian_sum = 0.0
+        self.laplacian_squares = 0.0
+        self.laplacian_count = 0
+
+    def luma(self, pixels):
+        if self.color_bands == 1:
+            return pixels[..., 0]
+        # Integer matmul has no BLAS path, sum the weighted channels instead.
+        # Widen first: NumPy 1.x would keep uint8 * scalar in uint16 and wrap
+        weighted = pixels[..., 0].astype(np.uint32) * LUMA_WEIGHTS[0]
+        weighted += pixels[..., 1].astype(np.uint32) * LUMA_WEIGHTS[1]
+        weighted += pixels[..., 2].astype(np.uint32) * LUMA_WEIGHTS[2]
+        weighted += 500
+        return (weighted // 1000).astype(np.uint8)
+
+    def add(self, pixels, top, bottom):
+        """Account rows top..bottom of a (rows, width, bands) uint8 or uint16 array
+
+        Rows outside top..bottom are neighbours for the Laplacian only.
+        """
+        body = pixels[top:bottom]
+        for index in range(len(self.bands)):
+            self.histograms[index] += np.bincount(body[..., index].ravel(), minlength=self.levels)
+
+        luma = self.luma(pixels)
+        self.luma_histogram += np.bincount(luma[top:bottom].ravel(), minlength=self.levels)
+
+        if self.colors is not None:
+            shift = 8 - COLOR_BITS
+            quantized = (body[..., :3] >> shift).astype(np.uint32)
+            packed = (quantized[..., 0] << (2 * COLOR_BITS)) | (quantized[..., 1] << COLOR_BITS) | quantized[..., 2]
+            self.colors += np.bincount(packed.ravel(), minlength=len(self.colors))
+
+        # 4-neighbour Laplacian at interior pixels whose rows fall in top..bottom
+        first, last = max(top, 1), min(bottom, len(luma) - 1)
+        if last > first and luma.shape[1] > 2:
+            # 8 bits: |Laplacian| <= 1020 fits int16, its square int32; 16 bits need int32 and int64
+            wide = self.levels > 256
+            center = luma.astype(np.int32 if wide else np.int16)
+            laplacian = (4 * center[first:last, 1:-1]
+                         - center[first - 1:last - 1, 1:-1] - center[first + 1:last + 1, 1:-1]
+                         - center[first:last, :-2] - center[first:last, 2:])
+            self.laplacian_sum += float(laplacian.sum(dtype=np.int64))
+            squares = np.square(laplacian, dtype=np.int64 if wide else np.int32)
+            self.laplacian_squares += float(squares.sum(dtype=np.int64))
+            self.laplacian_count += laplacian.size
+
+    def result(self):
+        values = np.arange(self.levels, dtype=np.float64)
+        # Clipping thresholds and the reported histograms are on the 8-bit scale
+        scale = self.levels // 256
+        shadows = self.luma_histogram[:(SHADOW_CLIP + 1) * scale].sum()
+        highlights = self.luma_histogram[HIGHLIGHT_CLIP * scale:].sum()
+        pixel_count = int(self.histograms[0].sum())
+        channels = {}
+        for band, histogram in zip(self.bands, self.histograms):
+            mean = float(histogram @ values) / pixel_count if pixel_count else 0.0
+            variance = float(histogram @ np.square(values)) / pixel_count - mean * mean if pixel_count else 0.0
+            channels[band] = {
+                'mean': mean,
+                'stddev': float(np.sqrt(max(variance, 0.0))),
+                'min': int(np.flatnonzero(histogram)[0]) if pixel_count else None,
+                'max': int(np.flatnonzero(histogram)[-1]) if pixel_count else None,
+                'histogram': histogram.reshape(256, scale).sum(axis=1).tolist(),
+            }
+
+        stats = {
+            'pixels': pixel_count,
+            'channels': channels,
+            'bits': 16 if self.levels > 256 else 8,
+            'clipped_shadows': float(shadows) / pixel_count if pixel_count else 0.0,
+            'clipped_highlights': float(highlights) / pixel_count if pixel_count else 0.0,
+            'sharpness': None,
+            'dominant_colors': [],
+            'alpha': None,
+        }
+        if self.laplacian_count:
+            mean = self.laplacian_sum / self.laplacian_count
+            stats['sharpness'] = self.laplacian_squares / self.laplacian_count - mean * mean
+
+        if self.colors is not None and pixel_count:
+            top = np.argsort(self.colors)[::-1][:DOMINANT_COLORS]
+            mask = (1 << COLOR_BITS) - 1
+            half = 1 << (7 - COLOR_BITS)
+            for index in top:
+                if not self.colors[index]:
+                    break
+                index = int(index)
+                # Centre of the quantization cell
+                rgb = [((index >> shift) & mask) << (8 - COLOR_BITS) | half
+                       for shift in (2 * COLOR_BITS, COLOR_BITS, 0)]
+                stats['dominant_colors'].append({
+                    'color': '#{:02x}{:02x}{:02x}'.format(*rgb),
+                    'share': float(self.colors[index]) / pixel_count,
+                })
+
+        if 'A' in self.bands:
+            alpha = self.histograms[self.bands.index('A')]
+            stats['alpha'] = {
+                'used': bool(pixel_count and alpha[255] < pixel_count),
+                'transparent': float(alpha[0]) / pixel_count if pixel_count else 0.0,
+                'translucent': float(alpha[1:255].sum()) / pixel_count if pixel_count else 0.0,
+            }
+        return stats
+
+
+def analyze_rows(read_rows, width, height, bands, levels=256):
+    """Run the accumulator over a source that returns rows a..b as (rows, width, bands) uint8 (or uint16)"""
+    accumulator = StatsAccumulator(bands, levels)
+    step = tile_rows(width)
+    for start in range(0, height, step):
+        end = min(height, start + step)
+        # One row of context on each side for the Laplacian
+        first, last = max(0, start - 1), min(height, end + 1)
+        pixels = read_rows(first, last)
+        accumulator.add(pixels.reshape(last - first, width, len(bands)), start - first, end - first)
+    stats = accumulator.result()
+    stats['width'], stats['height'] = width, height
+    return stats
+
+
+def analyze_pil(pil_image):
+    """Pixel statistics of a PIL image
+
+    The source is decoded once; each band of rows is cropped from it and
+    converted on its own, so no converted copy of the whole image is made.
+    """
+    mode = analysis_mode(pil_image)
+    pil_image.load()
+    width, height = pil_image.size
+
+    def read_rows(first, last):
+        band = pil_image.crop((0, first, width, last))
+        if mode == 'I;16':
+            # I holds 32-bit ints, I;16B big-endian words: normalize to native uint16
+            return np.clip(np.asarray(band), 0, WIDE_LEVELS - 1).astype(np.uint16)
+        if band.mode != mode:
+            band = band.convert(mode)
+        return np.asarray(band)
+
+    if mode == 'I;16':
+        return analyze_rows(read_rows, width, height, ('L',), WIDE_LEVELS)
+    return analyze_rows(read_rows, width, height, ANALYSIS_MODES[mode])
+
+
+def analyze_file(file_path):
+    """Pixel statistics of an image file, or {'error': ...}"""
+    try:
+        with Image.open(file_path) as img:
+            stats = analyze_pil(img)
+    except Exception as e:
+        return {'error': str(e)}
+    stats['error'] = None
+    return stats
+
+
+def analyze_tiff(tiff):
+    """Pixel statistics of a tiled.TiledTiff, read tile by tile, or {'error': ...}"""
+    page = tiff.pages[0]
+
+    def read_rows(first, last):
+        return tiff.read_region(page, 0, first, tiff.width, last - first)
+
+    try:
+        stats = analyze_rows(read_rows, tiff.width, tiff.height, ANALYSIS_MODES[tiff.mode])
+    except Exception as e:
+        return {'error': str(e)}
+    stats['error'] = None
+    return stats
+
+
+def extract(file_path):
+    """metadata.extract plus a pixel_stats entry"""
+    record = metadata.extract(file_path)
+    record['pixel_stats'] = analyze_file(file_path) if not record['error'] else None
+    return record
+
+
+def extract_chunk(file_paths):
+    """Worker entry point like parallel.extract_chunk, with pixel statistics"""
+    records = metadata.extract_many(file_paths)
+    for record in records:
+        record['pixel_stats'] = analyze_file(record['path']) if not record['error'] else None
+    return records
+
+
+def format_stats(stats):
+    """Text lines for the viewer's info pane"""
+    lines = []
+    depth = " (16-bit)" if stats.get('bits') == 16 else ""
+    for band, channel in stats['channels'].items():
+        lines.append(f"• {band}{depth}: mean {channel['mean']:.1f}, stddev {channel['stddev']:.1f}, "
+                     f"range {channel['min']}–{channel['max']}")
+    if stats['sharpness'] is not None:
+        lines.append(f"• Sharpness (Laplacian variance): {stats['sharpness']:.1f}")
+    lines.append(f"• Clipped shadows: {stats['clipped_shadows'] * 100:.2f}%")
+    lines.append(f"• Clipped highlights: {stats['clipped_highlights'] * 100:.2f}%")
+    if stats['dominant_colors']:
+        lines.append("• Dominant colors: " + ", ".join(
+            f"{color['color']} ({color['share'] * 100:.1f}%)" for color in stats['dominant_colors']))
+    if stats['alpha'] is not None:
+        alpha = stats['alpha']
+        if alpha['used']:
+            lines.append(f"• Alpha used: {alpha['transparent'] * 100:.1f}% transparent, "
+                         f"{alpha['translucent'] * 100:.1f}% translucent")
+        else:
+            lines.append("• Alpha used: No (fully opaque)")
+    return "".join(line + "\n" for line in lines)
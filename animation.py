@@ -0,0 +1,230 @@
+"""Streaming frame walker for GIF, APNG and animated WebP
+
+Frame timing, placement and disposal live in small control blocks between
+the compressed frames, so the walker steps over pixel data without
+decoding it. Files are mapped rather than read and frames are yielded one
+at a time, so memory use doesn't grow with the frame count.
+"""
+import bisect
+import mmap
+import struct
+
+# Frames listed individually in read_animation summaries
+FRAME_DETAIL_LIMIT = 50
+# Upper bounds (ms) of the frame duration histogram, longer frames share a last bucket
+DURATION_BUCKETS = (0, 20, 50, 100, 200, 500, 1000)
+
+# GIF disposal 0 (unspecified) behaves like 1 (do not dispose)
+GIF_DISPOSAL = {0: 'none', 1: 'none', 2: 'background', 3: 'previous'}
+APNG_DISPOSAL = {0: 'none', 1: 'background', 2: 'previous'}
+APNG_BLEND = {0: 'source', 1: 'over'}
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+WEBP_ANIMATION_FLAG = 0x02
+
+
+def frame(index, x, y, width, height, duration, disposal, blend):
+    return {
+        'index': index, 'x': x, 'y': y, 'width': width, 'height': height,
+        'duration': duration, 'disposal': disposal, 'blend': blend,
+    }
+
+
+def skip_sub_blocks(buf, position):
+    """Step over a chain of GIF data sub-blocks"""
+    size = buf[position]
+    while size:
+        position += size + 1
+        size = buf[position]
+    return position + 1
+
+
+def walk_gif(buf, info):
+    info['format'] = 'GIF'
+    info['width'], info['height'], flags = struct.unpack_from('<HHB', buf, 6)
+    position = 13
+    if flags & 0x80:
+        position += 3 << ((flags & 0x07) + 1)
+
+    index = 0
+    control = None
+    while position < len(buf):
+        block = buf[position]
+        if block == 0x3B:
+            break
+        if block == 0x21:
+            label = buf[position + 1]
+            position += 2
+            if label == 0xF9 and buf[position] >= 4:
+                packed, delay = struct.unpack_from('<BH', buf, position + 1)
+                control = (delay * 10, GIF_DISPOSAL.get((packed >> 2) & 0x07, 'none'))
+            elif label == 0xFF and buf[position] == 11 and buf[position + 1:position + 12] in (b'NETSCAPE2.0', b'ANIMEXTS1.0'):
+                sub_block = position + 12
+                if buf[sub_block] >= 3 and buf[sub_block + 1] == 1:
+                    info['loop_count'] = struct.unpack_from('<H', buf, sub_block + 2)[0]
+            position = skip_sub_blocks(buf, position)
+        elif block == 0x2C:
+            x, y, width, height, flags = struct.unpack_from('<HHHHB', buf, position + 1)
+            position += 10
+            if flags & 0x80:
+                position += 3 << ((flags & 0x07) + 1)
+            # LZW minimum code size, then the image data
+            position = skip_sub_blocks(buf, position + 1)
+            duration, disposal = control or (0, 'none')
+            yield frame(index, x, y, width, height, duration, disposal, None)
+            index += 1
+            control = None
+        else:
+            raise ValueError(f"Unexpected GIF block 0x{block:02x}")
+
+
+def walk_png(buf, info):
+    info['format'] = 'PNG'
+    position = 8
+    index = 0
+    while position + 8 <= len(buf):
+        length, chunk_type = struct.unpack_from('>I4s', buf, position)
+        data = position + 8
+        if chunk_type == b'IHDR':
+            info['width'], info['height'] = struct.unpack_from('>II', buf, data)
+        elif chunk_type == b'acTL':
+            info['format'] = 'APNG'
+            info['declared_frames'], info['loop_count'] = struct.unpack_from('>II', buf, data)
+        elif chunk_type == b'fcTL':
+            (_, width, height, x, y, delay_num, delay_den,
+             dispose_op, blend_op) = struct.unpack_from('>IIIIIHHBB', buf, data)
+            duration = delay_num * 1000 / (delay_den or 100)
+            yield frame(index, x, y, width, height, duration,
+                        APNG_DISPOSAL.get(dispose_op, 'none'), APNG_BLEND.get(blend_op, 'source'))
+            index += 1
+        elif chunk_type == b'IDAT' and 'declared_frames' not in info:
+            # Plain PNG, the image itself is the only frame
+            yield frame(0, 0, 0, info['width'], info['height'], 0, 'none', None)
+            return
+        elif chunk_type == b'IEND':
+            return
+        # Length, type, data and CRC
+        position = data + length + 4
+
+
+def walk_webp(buf, info):
+    info['format'] = 'WEBP'
+    position = 12
+    index = 0
+    animated = False
+    while position + 8 <= len(buf):
+        chunk_type, length = struct.unpack_from('<4sI', buf, position)
+        data = position + 8
+        if chunk_type == b'VP8X':
+            flags = buf[data]
+            animated = bool(flags & WEBP_ANIMATION_FLAG)
+            info['width'] = int.from_bytes(buf[data + 4:data + 7], 'little') + 1
+            info['height'] = int.from_bytes(buf[data + 7:data + 10], 'little') + 1
+        elif chunk_type == b'ANIM':
+            info['loop_count'] = struct.unpack_from('<H', buf, data + 4)[0]
+        elif chunk_type == b'ANMF':
+            fields = bytes(buf[data:data + 16])
+            x = int.from_bytes(fields[0:3], 'little') * 2
+            y = int.from_bytes(fields[3:6], 'little') * 2
+            width = int.from_bytes(fields[6:9], 'little') + 1
+            height = int.from_bytes(fields[9:12], 'little') + 1
+            duration = int.from_bytes(fields[12:15], 'little')
+            flags = fields[15]
+            yield frame(index, x, y, width, height, duration,
+                        'background' if flags & 0x01 else 'none', 'source' if flags & 0x02 else 'over')
+            index += 1
+        elif chunk_type in (b'VP8 ', b'VP8L') and not animated:
+            if 'width' not in info:
+                info['width'], info['height'] = webp_bitstream_size(buf, chunk_type, data)
+            yield frame(0, 0, 0, info['width'], info['height'], 0, 'none', None)
+            return
+        # Chunks are padded to an even size
+        position = data + length + (length & 1)
+
+
+def webp_bitstream_size(buf, chunk_type, data):
+    if chunk_type == b'VP8 ':
+        width, height = struct.unpack_from('<HH', buf, data + 6)
+        return width & 0x3FFF, height & 0x3FFF
+    bits = struct.unpack_from('<I', buf, data + 1)[0]
+    return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+
+
+def walk_buffer(buf, info):
+    signature = bytes(buf[:12])
+    if signature[:6] in (b'GIF87a', b'GIF89a'):
+        return walk_gif(buf, info)
+    if signature[:8] == PNG_SIGNATURE:
+        return walk_png(buf, info)
+    if signature[:4] == b'RIFF' and signature[8:12] == b'WEBP':
+        return walk_webp(buf, info)
+    raise ValueError("Not a GIF, PNG or WebP file")
+
+
+def iter_frames(file_path, info=None):
+    """Yield frame dicts in file order without decoding pixels
+
+    Each frame has index, x, y, width, height, duration (ms), disposal
+    and blend. The info dict, if given, receives format, width, height and
+    loop_count as they are parsed. Raises ValueError for other formats or
+    damaged files.
+    """
+    info = info if info is not None else {}
+    with open(file_path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            try:
+                yield from walk_buffer(mapped, info)
+            except (struct.error, IndexError) as e:
+                raise ValueError(f"Truncated or damaged file: {str(e)}") from None
+
+
+def read_animation(file_path, frame_limit=FRAME_DETAIL_LIMIT):
+    """Summarize frame timing and layout in one pass
+
+    Returns None when the file isn't a GIF, PNG or WebP or can't be
+    parsed. Only the first frame_limit frames are kept in full; the other
+    durations only feed min/max and a histogram over DURATION_BUCKETS,
+    so the summary has a fixed size. loop_count is 0 for endless playback
+    and None when the file doesn't say (played once).
+    """
+    info = {'loop_count': None}
+    summary = {
+        'frame_count': 0, 'total_duration': 0, 'min_duration': None, 'max_duration': None,
+        'duration_histogram': [0] * (len(DURATION_BUCKETS) + 1),
+        'disposal': {}, 'blend': {}, 'frames': [],
+    }
+    try:
+        for current in iter_frames(file_path, info):
+            duration = current['duration']
+            summary['frame_count'] += 1
+            summary['total_duration'] += duration
+            if summary['min_duration'] is None or duration < summary['min_duration']:
+                summary['min_duration'] = duration
+            if summary['max_duration'] is None or duration > summary['max_duration']:
+                summary['max_duration'] = duration
+            summary['duration_histogram'][bisect.bisect_left(DURATION_BUCKETS, duration)] += 1
+            summary['disposal'][current['disposal']] = summary['disposal'].get(current['disposal'], 0) + 1
+            if current['blend'] is not None:
+                summary['blend'][current['blend']] = summary['blend'].get(current['blend'], 0) + 1
+            if len(summary['frames']) < frame_limit:
+                summary['frames'].append(current)
+    except (OSError, ValueError):
+        return None
+
+    summary.update(info)
+    summary['animated'] = summary['frame_count'] > 1
+    return summary
+
+
+def format_duration_histogram(histogram):
+    """Non-empty duration buckets, e.g. "≤20 ms: 3, >1000 ms: 1" """
+    labels = [f"≤{bound} ms" for bound in DURATION_BUCKETS] + [f">{DURATION_BUCKETS[-1]} ms"]
+    return ", ".join(f"{label}: {count}" for label, count in zip(labels, histogram) if count)
+
+
+def format_loop_count(loop_count):
+    if loop_count is None:
+        return "once"
+    if loop_count == 0:
+        return "infinite"
+    return f"{loop_count} times"
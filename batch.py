@@ -0,0 +1,248 @@
+"""Headless batch metadata extraction over files and directory trees
+
+Usage: python batch.py [-o OUTPUT] [-f FORMAT] [-j JOBS] [--unordered] [--cache DB]
+                       [--incremental] [--watch] [--trace FILE] [--metrics FILE] [--pixel-stats]
+                       [--sort FIELD [--reverse]] PATH [PATH ...]
+
+--trace writes the per-stage timing spans of every file as Chrome
+trace-event JSON, --metrics writes them as Prometheus histograms.
+--pixel-stats decodes every image and adds a pixel_stats entry (see
+analysis.py) to the JSON Lines output. --sort holds the whole result set
+in a records.RecordBatch before writing it out in order. Both pull in
+NumPy, so analysis and records are only imported with their option.
+"""
+import argparse
+import os
+import sys
+from functools import partial
+import export
+import incremental
+import metadata
+import parallel
+import tracing
+from cache import MetadataCache, lookup_or_extract_chunk
+
+
+def iter_image_files(paths):
+    """Yield image file paths, walking directories recursively"""
+    for path in paths:
+        if not os.path.isdir(path):
+            # Files given explicitly are taken as is
+            if os.path.isfile(path):
+                yield path
+            continue
+
+        pending = [path]
+        while pending:
+            try:
+                entries = os.scandir(pending.pop())
+            except OSError:
+                continue
+            with entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            pending.append(entry.path)
+                        elif entry.is_file() and metadata.is_image_file(entry.name):
+                            yield entry.path
+                    except OSError:
+                        continue
+
+
+def extract_parallel(file_paths, jobs, ordered, worker=parallel.extract_chunk, tracer=None):
+    """parallel.extract_parallel, with worker spans merged into tracer if given"""
+    if tracer is None:
+        yield from parallel.extract_parallel(file_paths, workers=jobs, ordered=ordered, worker=worker)
+        return
+    traced = partial(tracing.traced_chunk, worker)
+    for item, spans in parallel.extract_parallel(file_paths, workers=jobs, ordered=ordered, worker=traced):
+        tracer.extend(spans)
+        yield item
+
+
+def scan(paths, jobs=1, ordered=True, cache=None, tracer=None, pixel_stats=False):
+    """Stream metadata records for every image under the given paths
+
+    With jobs > 1 extraction runs in a process pool; ordered=False yields
+    records as soon as they are ready instead of in walk order. Passing a
+    MetadataCache serves unchanged files without opening them. Stage
+    timings go to tracer when one is given. pixel_stats adds pixel
+    statistics to each record; cached records don't hold them.
+    """
+    if cache is not None:
+        # Cache keys must not depend on how the paths were spelled, see incremental.diff_tree
+        paths = [os.path.abspath(path) for path in paths]
+    file_paths = iter_image_files(paths)
+
+    if cache is None:
+        if pixel_stats:
+            import analysis
+            extract, worker = analysis.extract, analysis.extract_chunk
+        else:
+            extract, worker = metadata.extract, parallel.extract_chunk
+        if jobs > 1:
+            yield from extract_parallel(file_paths, jobs, ordered, worker, tracer)
+        elif tracer is None:
+            # Chunks still convert GPS coordinates in bulk
+            for chunk in parallel.iter_chunks(file_paths, parallel.DEFAULT_CHUNK_SIZE):
+                yield from worker(chunk)
+        else:
+            for file_path in file_paths:
+                yield traced_extract(extract, file_path, tracer)
+        return
+
+    if jobs > 1:
+        # Workers read committed rows, new records are written here
+        cache.commit()
+        worker = partial(lookup_or_extract_chunk, cache.db_path)
+        for record, hit in extract_parallel(file_paths, jobs, ordered, worker, tracer):
+            yield record if hit else cache.put(record)
+    elif tracer is None:
+        for chunk in parallel.iter_chunks(file_paths, parallel.DEFAULT_CHUNK_SIZE):
+            yield from cache.extract_many(chunk)
+    else:
+        for file_path in file_paths:
+            yield traced_extract(cache.extract, file_path, tracer)
+    cache.commit()
+
+
+def traced_extract(extract, file_path, tracer):
+    if tracer is None:
+        return extract(file_path)
+    with tracer.activate(), tracing.span('extract'):
+        return extract(file_path)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Extract image metadata without the GUI")
+    parser.add_argument("paths", nargs="+", help="image files or directories to scan")
+    parser.add_argument("-o", "--output", help="output file (default: stdout)")
+    parser.add_argument("-f", "--format", choices=export.FORMATS,
+                        help="output format (default: from the output extension, else jsonl)")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="number of worker processes, 0 for one per CPU (default: 1)")
+    parser.add_argument("--unordered", action="store_true",
+                        help="emit records as they complete instead of in walk order")
+    parser.add_argument("--cache", metavar="DB",
+                        help="SQLite metadata cache; unchanged files are not re-read")
+    parser.add_argument("--incremental", action="store_true",
+                        help="with --cache: output only new and changed files and drop deleted ones")
+    parser.add_argument("--watch", action="store_true",
+                        help="after an incremental pass, keep following changes until Ctrl+C")
+    parser.add_argument("--trace", metavar="FILE",
+                        help="write per-stage timings as Chrome trace-event JSON")
+    parser.add_argument("--metrics", metavar="FILE",
+                        help="write file counters and stage histograms in Prometheus text format")
+    parser.add_argument("--pixel-stats", action="store_true",
+                        help="decode images and add histograms, colour and sharpness statistics (JSON Lines)")
+    # Checked against records.SORT_KEYS in main, after importing it
+    parser.add_argument("--sort", metavar="FIELD",
+                        help="write records sorted by FIELD (path, size, modified, width, height, "
+                             "taken, latitude, ...); files missing it go last")
+    parser.add_argument("--reverse", action="store_true", help="with --sort: descending order")
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    jobs = args.jobs or os.cpu_count() or 1
+    if (args.incremental or args.watch) and not args.cache:
+        parser.error("--incremental and --watch need --cache")
+    if (args.incremental or args.watch) and (args.trace or args.metrics):
+        parser.error("--trace and --metrics only apply to full scans")
+    if args.pixel_stats and args.cache:
+        parser.error("--pixel-stats can't be combined with --cache")
+    if args.sort and (args.incremental or args.watch):
+        parser.error("--sort only applies to full scans")
+    if args.reverse and not args.sort:
+        parser.error("--reverse needs --sort")
+    if args.sort:
+        from records import SORT_KEYS
+        if args.sort not in SORT_KEYS:
+            parser.error(f"argument --sort: invalid choice: {args.sort!r} (choose from {', '.join(SORT_KEYS)})")
+
+    try:
+        writer = export.open_writer(args.output, args.format, stream=sys.stdout)
+    except (RuntimeError, ValueError) as e:
+        print(f"Export error: {str(e)}", file=sys.stderr)
+        return 1
+
+    cache = MetadataCache(args.cache) if args.cache else None
+    if args.incremental or args.watch:
+        return run_incremental(args, cache, writer, jobs)
+
+    metrics = tracing.Metrics() if args.metrics else None
+    tracer = tracing.Tracer(metrics, keep=bool(args.trace)) if args.trace or args.metrics else None
+    records = scan(args.paths, jobs=jobs, ordered=not args.unordered, cache=cache, tracer=tracer,
+                   pixel_stats=args.pixel_stats)
+    if metrics is not None:
+        records = count_records(records, metrics)
+    if args.sort:
+        records = sort_records(records, args.sort, args.reverse)
+    try:
+        count = export.write_records(records, writer)
+    finally:
+        if cache:
+            cache.close()
+
+    print(f"Processed {count} files", file=sys.stderr)
+    if args.trace:
+        tracer.write_chrome_trace(args.trace)
+    if metrics is not None:
+        metrics.write(args.metrics)
+    return 0
+
+
+def count_records(records, metrics):
+    for record in records:
+        metrics.inc('files')
+        if record.get('error'):
+            metrics.inc('errors')
+        yield record
+
+
+def sort_records(records, key, reverse):
+    """Collect every record in a compact RecordBatch, then yield them sorted by key"""
+    from records import RecordBatch
+    batch = RecordBatch(records)
+    for row in batch.order(key, reverse):
+        yield batch.record(row)
+
+
+def print_stats(stats):
+    print(", ".join(f"{stats.get(status, 0)} {status}" for status in
+                    (incremental.ADDED, incremental.MODIFIED, incremental.DELETED, incremental.UNCHANGED)),
+          file=sys.stderr)
+
+
+def run_incremental(args, cache, writer, jobs):
+    """Write records of new and changed files, then optionally keep watching"""
+    stats = {}
+    directories = []
+    try:
+        for record in incremental.rescan(cache, args.paths, jobs=jobs, ordered=not args.unordered,
+                                         stats=stats, directories=directories):
+            writer.write(record)
+        print_stats(stats)
+
+        if args.watch:
+            writer.flush()
+            print(f"Watching {len(directories)} directories", file=sys.stderr)
+
+            def on_changes(changes):
+                writer.flush()
+                counts = {}
+                for status, _ in changes:
+                    counts[status] = counts.get(status, 0) + 1
+                print_stats(counts)
+
+            incremental.watch(cache, directories, writer.write, jobs=jobs, on_changes=on_changes)
+    finally:
+        writer.close()
+        cache.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,397 @@
+"""Benchmark harness with a reproducible synthetic corpus
+
+Usage: python benchmark.py generate CORPUS [--max-size SIZE] [--seed N]
+       python benchmark.py run CORPUS [-s STAGE ...] [-r REPEAT] [-o RESULTS] [--baseline RESULTS]
+       python benchmark.py startup FILE [--db DB] [-r REPEAT]
+
+generate writes every format of the viewer's open dialog at sizes from
+64 px to 100 MP (12 MP for BMP, GIF and TIFF), with and without EXIF and
+GPS, plus animated GIFs, and a manifest.json describing them. HEIC is
+skipped since Pillow can't write it. The same seed gives the same files.
+
+run times each stage in its own process so peak RSS is per stage, and
+reports files/s and latency percentiles. With --baseline, stages that got
+slower than the threshold make it exit with status 1.
+
+startup times cold starts in fresh interpreters, wall clock from launch
+to exit: img_info.py --info on FILE, the viewer until its window is shown
+and, with --db, a catalog count.
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+import numpy as np
+from PIL import Image
+
+MANIFEST = 'manifest.json'
+
+# (name, width, height)
+SIZES = [
+    ('64px', 64, 64),
+    ('vga', 640, 480),
+    ('fullhd', 1920, 1080),
+    ('12mp', 4000, 3000),
+    ('100mp', 10000, 10000),
+]
+# Pillow format and extension for every writable entry of IMAGE_EXTENSIONS
+FORMATS = [
+    ('BMP', '.bmp'),
+    ('PNG', '.png'),
+    ('JPEG', '.jpg'),
+    ('JPEG', '.jpeg'),
+    ('GIF', '.gif'),
+    ('WEBP', '.webp'),
+    ('TIFF', '.tiff'),
+]
+EXIF_FORMATS = ('JPEG', 'PNG', 'WEBP', 'TIFF')
+# WebP can't go past 16383 px per side; uncompressed BMP and TIFF or GIF at
+# 100 MP would mostly measure the disk
+SIZE_LIMITS = {'WEBP': 16383 * 16383, 'BMP': 4000 * 3000, 'GIF': 4000 * 3000, 'TIFF': 4000 * 3000}
+ANIMATED_FRAMES = (10, 100, 1000)
+
+PREVIEW_WIDTH = 400
+PREVIEW_HEIGHT = 350
+DEFAULT_REPEAT = 3
+DEFAULT_THRESHOLD = 0.2
+PERCENTILES = (50, 90, 99)
+
+
+def synthetic_pixels(width, height, rng):
+    """Gradient plus noise, so encoders see something photo-like"""
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    pixels = np.empty((height, width, 3), dtype=np.uint8)
+    # Row bands keep the float intermediates small at 100 MP
+    for top in range(0, height, 1024):
+        rows = y[top:top + 1024]
+        noise = rng.integers(0, 32, (len(rows), width, 3), dtype=np.uint8)
+        pixels[top:top + 1024, :, 0] = (x + rows) / 2
+        pixels[top:top + 1024, :, 1] = x[::-1] * 0.5 + rows * 0.5
+        pixels[top:top + 1024, :, 2] = np.abs(x - rows)
+        pixels[top:top + 1024] += noise
+    return pixels
+
+
+def make_exif(with_gps):
+    exif = Image.Exif()
+    exif[0x010F] = "Benchmark"
+    exif[0x0110] = "Synthetic"
+    exif[0x0132] = "2024:01:01 12:00:00"
+    exif[0x0112] = 1
+    exif.get_ifd(0x8769)[0x9003] = "2024:01:01 12:00:00"
+    if with_gps:
+        gps = exif.get_ifd(0x8825)
+        gps[1] = 'N'
+        gps[2] = (55.0, 45.0, 12.34)
+        gps[3] = 'E'
+        gps[4] = (37.0, 37.0, 0.0)
+    return exif.tobytes()
+
+
+def save_image(image, path, fmt, exif=None):
+    # TIFF stays uncompressed: libtiff, used for every compression, can't write EXIF sub-IFDs
+    options = {}
+    if fmt == 'JPEG':
+        options['quality'] = 90
+    elif fmt == 'WEBP':
+        options['quality'] = 80
+    elif fmt == 'GIF':
+        image = image.quantize(64)
+    if exif is not None:
+        options['exif'] = exif
+    image.save(path, fmt, **options)
+
+
+def generate(corpus, max_pixels=None, seed=0):
+    """Write the corpus and its manifest, returning the manifest entries"""
+    os.makedirs(corpus, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    entries = []
+
+    for size_name, width, height in SIZES:
+        if max_pixels and width * height > max_pixels:
+            continue
+        image = Image.fromarray(synthetic_pixels(width, height, rng))
+        for fmt, extension in FORMATS:
+            if width * height > SIZE_LIMITS.get(fmt, width * height):
+                continue
+            variants = [('plain', None)]
+            if fmt in EXIF_FORMATS:
+                variants += [('exif', make_exif(False)), ('gps', make_exif(True))]
+            for variant, exif in variants:
+                name = f"{size_name}_{variant}{extension}"
+                save_image(image, os.path.join(corpus, name), fmt, exif)
+                entries.append({
+                    'file': name, 'format': fmt, 'width': width, 'height': height,
+                    'exif': variant != 'plain', 'gps': variant == 'gps', 'frames': 1,
+                })
+            print(f"{size_name} {extension}", file=sys.stderr)
+        del image
+
+    for frames in ANIMATED_FRAMES:
+        pixels = synthetic_pixels(320, 240, rng)
+        images = [Image.fromarray(np.roll(pixels, index * 4, axis=1)).quantize(64) for index in range(frames)]
+        name = f"animated_{frames}.gif"
+        images[0].save(os.path.join(corpus, name), save_all=True, append_images=images[1:],
+                       duration=40, loop=0)
+        entries.append({
+            'file': name, 'format': 'GIF', 'width': 320, 'height': 240,
+            'exif': False, 'gps': False, 'frames': frames,
+        })
+
+    with open(os.path.join(corpus, MANIFEST), 'w', encoding='utf-8') as f:
+        json.dump({'seed': seed, 'files': entries}, f, indent=1)
+    return entries
+
+
+def load_manifest(corpus):
+    with open(os.path.join(corpus, MANIFEST), encoding='utf-8') as f:
+        return json.load(f)['files']
+
+
+# Stages: name -> (description, file filter). The callables are built in
+# stage_function so each child process only imports what its stage needs.
+STAGES = {
+    'probe_fast': ("metadata.extract, mmap header reader", lambda entry: True),
+    'probe_pil': ("metadata.extract(fast=False)", lambda entry: True),
+    'probe_qt': ("loader.probe_image (QImageReader)", lambda entry: True),
+    'exif': ("get_exif_data on an open image", lambda entry: entry['exif']),
+    'gps': ("parse_gps_info on a read GPS IFD", lambda entry: entry['gps']),
+    'preview': ("preview.load_preview, reduced-size decode", lambda entry: True),
+    'preview_qt': ("loader.read_preview (QImageReader scaled)", lambda entry: True),
+    'loader': ("ImageLoader.run, the work behind display_image_info", lambda entry: True),
+    'animation': ("animation.read_animation", lambda entry: entry['format'] in ('GIF', 'PNG', 'WEBP')),
+}
+
+
+def stage_function(name):
+    """Return (prepare, run) for a stage; prepare's result is passed to run untimed"""
+    import metadata
+    if name == 'probe_fast':
+        return None, metadata.extract
+    if name == 'probe_pil':
+        return None, lambda path: metadata.extract(path, fast=False)
+    if name == 'exif':
+        return Image.open, metadata.get_exif_data
+    if name == 'gps':
+        return (lambda path: Image.open(path).getexif().get_ifd(0x8825)), metadata.parse_gps_info
+    if name == 'preview':
+        import preview
+        return None, lambda path: preview.load_preview(path, PREVIEW_WIDTH, PREVIEW_HEIGHT)
+    if name == 'animation':
+        import animation
+        return None, animation.read_animation
+
+    import loader
+    if name == 'probe_qt':
+        return None, loader.probe_image
+    if name == 'preview_qt':
+        return None, lambda path: loader.read_preview(path, PREVIEW_WIDTH, PREVIEW_HEIGHT)
+    if name == 'loader':
+        return None, lambda path: loader.ImageLoader(0, path, PREVIEW_WIDTH, PREVIEW_HEIGHT).run()
+    raise ValueError(f"Unknown stage: {name}")
+
+
+# Shows the viewer window and exits as soon as it has been painted
+WINDOW_PROBE = """
+import os, sys
+from PyQt6.QtWidgets import QApplication
+import viewer
+app = QApplication(sys.argv[:1])
+window = viewer.ImageInfoApp()
+window.show()
+viewer.preload()
+app.processEvents()
+os._exit(0)
+"""
+
+
+def startup_commands(file_path, db=None):
+    """(name, argv) of the cold starts to time"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    commands = [
+        ('python', [sys.executable, '-c', 'pass']),
+        ('info', [sys.executable, os.path.join(here, 'img_info.py'), '--info', file_path]),
+        ('window', [sys.executable, '-c', WINDOW_PROBE]),
+    ]
+    if db:
+        commands.append(('catalog', [sys.executable, os.path.join(here, 'catalog.py'), db, 'count']))
+    return commands
+
+
+def time_startup(argv, repeat=DEFAULT_REPEAT):
+    """Wall-clock milliseconds of each of repeat runs of argv"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, QT_QPA_PLATFORM=os.environ.get('QT_QPA_PLATFORM', 'offscreen'))
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter_ns()
+        subprocess.run(argv, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, env=env, cwd=here, check=True)
+        timings.append((time.perf_counter_ns() - start) / 1e6)
+    return timings
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def run_stage(name, corpus, repeat=DEFAULT_REPEAT):
+    """Time one stage over the matching corpus files in this process"""
+    _, wanted = STAGES[name]
+    paths = [os.path.join(corpus, entry['file']) for entry in load_manifest(corpus) if wanted(entry)]
+    prepare, function = stage_function(name)
+    baseline_rss = peak_rss_mb()
+
+    latencies = []
+    total = 0
+    for path in paths:
+        for _ in range(repeat):
+            argument = prepare(path) if prepare else path
+            start = time.perf_counter_ns()
+            function(argument)
+            elapsed = time.perf_counter_ns() - start
+            latencies.append(elapsed)
+            total += elapsed
+
+    result = {
+        'stage': name,
+        'files': len(paths),
+        'calls': len(latencies),
+        'files_per_s': len(latencies) / (total / 1e9) if total else None,
+        'peak_rss_mb': peak_rss_mb(),
+        'import_rss_mb': baseline_rss,
+    }
+    if latencies:
+        milliseconds = np.array(latencies) / 1e6
+        for percentile in PERCENTILES:
+            result[f'p{percentile}_ms'] = float(np.percentile(milliseconds, percentile))
+        result['max_ms'] = float(milliseconds.max())
+    return result
+
+
+def run(corpus, stages, repeat=DEFAULT_REPEAT):
+    """Run each stage in a fresh interpreter and collect the results"""
+    results = []
+    for name in stages:
+        completed = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), 'stage', name, corpus, '-r', str(repeat)],
+            capture_output=True, text=True,
+            env=dict(os.environ, QT_QPA_PLATFORM=os.environ.get('QT_QPA_PLATFORM', 'offscreen'))
+        )
+        if completed.returncode != 0:
+            error = completed.stderr.strip().splitlines()[-1:] or ["failed"]
+            print(f"{name}: {error[0]}", file=sys.stderr)
+            continue
+        results.append(json.loads(completed.stdout))
+    return results
+
+
+def format_results(results):
+    header = f"{'stage':<12} {'files':>6} {'files/s':>10} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9} {'peak MB':>8}"
+    lines = [header, '-' * len(header)]
+    for result in results:
+        if not result['calls']:
+            lines.append(f"{result['stage']:<12} {0:>6}")
+            continue
+        lines.append(
+            f"{result['stage']:<12} {result['files']:>6} {result['files_per_s']:>10.1f} "
+            f"{result['p50_ms']:>9.2f} {result['p90_ms']:>9.2f} {result['p99_ms']:>9.2f} "
+            f"{result['max_ms']:>9.2f} {result['peak_rss_mb']:>8.1f}"
+        )
+    return "\n".join(lines)
+
+
+def regressions(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """Stages whose median latency grew by more than threshold over the baseline"""
+    previous = {result['stage']: result for result in baseline}
+    slower = []
+    for result in results:
+        before = previous.get(result['stage'])
+        if not before or not before.get('p50_ms') or not result.get('p50_ms'):
+            continue
+        ratio = result['p50_ms'] / before['p50_ms']
+        if ratio > 1 + threshold:
+            slower.append((result['stage'], before['p50_ms'], result['p50_ms'], ratio))
+    return slower
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Benchmark metadata, preview and loader stages")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    generate_parser = commands.add_parser("generate", help="write the synthetic corpus")
+    generate_parser.add_argument("corpus", help="output directory")
+    generate_parser.add_argument("--max-size", choices=[name for name, _, _ in SIZES],
+                                 help="largest size to generate (default: all, up to 100 MP)")
+    generate_parser.add_argument("--seed", type=int, default=0)
+
+    run_parser = commands.add_parser("run", help="time stages over a generated corpus")
+    run_parser.add_argument("corpus")
+    run_parser.add_argument("-s", "--stage", action="append", choices=list(STAGES),
+                            help="stage to run, repeatable (default: all)")
+    run_parser.add_argument("-r", "--repeat", type=int, default=DEFAULT_REPEAT,
+                            help=f"calls per file (default: {DEFAULT_REPEAT})")
+    run_parser.add_argument("-o", "--output", help="write results as JSON")
+    run_parser.add_argument("--baseline", help="earlier results to compare against")
+    run_parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                            help="allowed median slowdown before failing (default: 0.2)")
+
+    startup_parser = commands.add_parser("startup", help="time cold starts of the CLI and the viewer")
+    startup_parser.add_argument("file", help="image for img_info.py --info")
+    startup_parser.add_argument("--db", help="metadata cache for a catalog.py count")
+    startup_parser.add_argument("-r", "--repeat", type=int, default=10, help="runs per command (default: 10)")
+
+    # Internal: one stage in this process, JSON on stdout
+    stage_parser = commands.add_parser("stage")
+    stage_parser.add_argument("name", choices=list(STAGES))
+    stage_parser.add_argument("corpus")
+    stage_parser.add_argument("-r", "--repeat", type=int, default=DEFAULT_REPEAT)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    if args.command == "generate":
+        max_pixels = None
+        if args.max_size:
+            max_pixels = next(width * height for name, width, height in SIZES if name == args.max_size)
+        entries = generate(args.corpus, max_pixels, args.seed)
+        print(f"Generated {len(entries)} files", file=sys.stderr)
+        return 0
+
+    if args.command == "startup":
+        print(f"{'command':<12} {'p50 ms':>9} {'min ms':>9}")
+        for name, argv in startup_commands(args.file, args.db):
+            timings = np.array(time_startup(argv, args.repeat))
+            print(f"{name:<12} {np.median(timings):>9.1f} {timings.min():>9.1f}")
+        return 0
+
+    if args.command == "stage":
+        print(json.dumps(run_stage(args.name, args.corpus, args.repeat)))
+        return 0
+
+    results = run(args.corpus, args.stage or list(STAGES), args.repeat)
+    print(format_results(results))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=1)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            slower = regressions(results, json.load(f), args.threshold)
+        for stage, before, after, ratio in slower:
+            print(f"REGRESSION {stage}: p50 {before:.2f} ms -> {after:.2f} ms ({ratio:.2f}x)", file=sys.stderr)
+        if slower:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,284 @@
+"""Folder browser with a virtualized thumbnail grid
+
+The model only holds file paths. Thumbnails are requested when the view asks
+for an item's icon, which QListView does for visible items only, plus one
+screen before and after the viewport as prefetch. Decoding runs on a
+dedicated QThreadPool through the persistent thumbnail cache, and queued
+jobs for rows that scrolled far away are skipped. A QFileSystemWatcher
+keeps the list in step with files added to or removed from the folder.
+"""
+import os
+from collections import OrderedDict
+from PyQt6.QtWidgets import QListView, QVBoxLayout, QWidget, QLabel, QAbstractItemView
+from PyQt6.QtGui import QImage, QPixmap, QIcon
+from PyQt6.QtCore import (Qt, QAbstractListModel, QModelIndex, QObject, QRunnable,
+                          QThreadPool, QSize, QPoint, QTimer, QFileSystemWatcher, pyqtSignal)
+import metadata
+
+THUMBNAIL_SIZE = 128
+# Decoded thumbnails kept in memory as pixmaps
+PIXMAP_CACHE_SIZE = 2000
+
+
+def list_image_files(folder):
+    """Sorted image files directly inside a folder"""
+    with os.scandir(folder) as entries:
+        files = [entry.path for entry in entries
+                 if entry.is_file() and metadata.is_image_file(entry.name)]
+    files.sort(key=lambda path: os.path.basename(path).lower())
+    return files
+
+
+class ThumbnailSignals(QObject):
+    # row, file path, thumbnail (null when decoding failed)
+    loaded = pyqtSignal(int, str, QImage)
+    # row, file path
+    skipped = pyqtSignal(int, str)
+
+
+class ThumbnailJob(QRunnable):
+    def __init__(self, model, row, file_path, thumbnail_cache):
+        super().__init__()
+        self.model = model
+        self.row = row
+        self.file_path = file_path
+        self.thumbnail_cache = thumbnail_cache
+        self.signals = ThumbnailSignals()
+
+    def run(self):
+        # The user may have scrolled on while the job sat in the queue
+        if not self.model.is_wanted(self.row):
+            self.signals.skipped.emit(self.row, self.file_path)
+            return
+        try:
+            data = self.thumbnail_cache.get_or_create(self.file_path, THUMBNAIL_SIZE, THUMBNAIL_SIZE)
+            image = QImage.fromData(data)
+        except Exception:
+            image = QImage()
+        self.signals.loaded.emit(self.row, self.file_path, image)
+
+
+class FolderModel(QAbstractListModel):
+    def __init__(self, thumbnail_cache, parent=None):
+        super().__init__(parent)
+        self.thumbnail_cache = thumbnail_cache
+        self.folder = None
+        self.files = []
+        self.pixmaps = OrderedDict()
+        self.failed = set()
+        self.pending = set()
+        self.wanted_range = (0, -1)
+
+        self.thread_pool = QThreadPool()
+        self.thread_pool.setMaxThreadCount(max(2, (os.cpu_count() or 2) - 1))
+
+        placeholder = QPixmap(THUMBNAIL_SIZE, THUMBNAIL_SIZE)
+        placeholder.fill(Qt.GlobalColor.lightGray)
+        self.placeholder = QIcon(placeholder)
+
+    def set_folder(self, folder):
+        self.set_files(list_image_files(folder), folder)
+
+    def set_files(self, files, folder=None):
+        """Show the given paths; without a folder there is nothing to re-list"""
+        self.beginResetModel()
+        self.thread_pool.clear()
+        self.folder = folder
+        self.files = list(files)
+        self.pixmaps.clear()
+        self.failed.clear()
+        self.pending.clear()
+        self.wanted_range = (0, -1)
+        self.endResetModel()
+
+    def refresh(self):
+        """Re-list the folder, removing and inserting only the rows that changed"""
+        if self.folder is None:
+            return
+        try:
+            files = list_image_files(self.folder)
+        except OSError:
+            files = []
+        if files == self.files:
+            return
+
+        present = set(files)
+        # Bottom up so earlier row numbers stay valid
+        for row in range(len(self.files) - 1, -1, -1):
+            file_path = self.files[row]
+            if file_path not in present:
+                self.beginRemoveRows(QModelIndex(), row, row)
+                del self.files[row]
+                self.pixmaps.pop(file_path, None)
+                self.failed.discard(file_path)
+                self.endRemoveRows()
+
+        # What is left is in the same order as the new listing
+        known = set(self.files)
+        for row, file_path in enumerate(files):
+            if file_path not in known:
+                self.beginInsertRows(QModelIndex(), row, row)
+                self.files.insert(row, file_path)
+                self.endInsertRows()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.files)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        file_path = self.files[index.row()]
+
+        if role == Qt.ItemDataRole.DisplayRole:
+            return os.path.basename(file_path)
+        if role == Qt.ItemDataRole.ToolTipRole:
+            return file_path
+        if role == Qt.ItemDataRole.UserRole:
+            return file_path
+        if role == Qt.ItemDataRole.DecorationRole:
+            pixmap = self.pixmaps.get(file_path)
+            if pixmap is not None:
+                self.pixmaps.move_to_end(file_path)
+                return QIcon(pixmap)
+            self.request(index.row())
+            return self.placeholder
+        return None
+
+    def is_wanted(self, row):
+        first, last = self.wanted_range
+        return first <= row <= last
+
+    def set_visible_range(self, first, last):
+        """Mark rows first..last as visible and prefetch a screen either side"""
+        page = last - first + 1
+        self.wanted_range = (max(0, first - page), min(len(self.files) - 1, last + page))
+        for row in range(first, last + 1):
+            self.request(row)
+        # Next screen first, previous screen second
+        for row in range(last + 1, self.wanted_range[1] + 1):
+            self.request(row)
+        for row in range(first - 1, self.wanted_range[0] - 1, -1):
+            self.request(row)
+
+    def request(self, row):
+        if row < 0 or row >= len(self.files):
+            return
+        file_path = self.files[row]
+        if file_path in self.pixmaps or file_path in self.pending or file_path in self.failed:
+            return
+        self.pending.add(file_path)
+        job = ThumbnailJob(self, row, file_path, self.thumbnail_cache)
+        job.signals.loaded.connect(self.on_thumbnail_loaded)
+        job.signals.skipped.connect(self.on_thumbnail_skipped)
+        self.thread_pool.start(job)
+
+    def on_thumbnail_skipped(self, row, file_path):
+        self.pending.discard(file_path)
+        # The range may have moved back over this row in the meantime
+        if self.is_wanted(row):
+            self.request(row)
+
+    def on_thumbnail_loaded(self, row, file_path, image):
+        self.pending.discard(file_path)
+        if row >= len(self.files) or self.files[row] != file_path:
+            return
+        if image.isNull():
+            self.failed.add(file_path)
+            return
+
+        self.pixmaps[file_path] = QPixmap.fromImage(image)
+        while len(self.pixmaps) > PIXMAP_CACHE_SIZE:
+            self.pixmaps.popitem(last=False)
+
+        index = self.index(row)
+        self.dataChanged.emit(index, index, [Qt.ItemDataRole.DecorationRole])
+
+
+class FolderBrowser(QWidget):
+    file_selected = pyqtSignal(str)
+
+    def __init__(self, thumbnail_cache, parent=None):
+        super().__init__(parent)
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+
+        self.folder_label = QLabel()
+        layout.addWidget(self.folder_label)
+
+        self.model = FolderModel(thumbnail_cache, self)
+        self.view = QListView()
+        self.view.setViewMode(QListView.ViewMode.IconMode)
+        self.view.setResizeMode(QListView.ResizeMode.Adjust)
+        self.view.setMovement(QListView.Movement.Static)
+        self.view.setIconSize(QSize(THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+        self.view.setGridSize(QSize(THUMBNAIL_SIZE + 24, THUMBNAIL_SIZE + 36))
+        # Uniform sizes let the view lay out 100k items without querying each one
+        self.view.setUniformItemSizes(True)
+        self.view.setLayoutMode(QListView.LayoutMode.Batched)
+        self.view.setSelectionMode(QAbstractItemView.SelectionMode.SingleSelection)
+        self.view.setModel(self.model)
+        layout.addWidget(self.view)
+
+        self.view.selectionModel().currentChanged.connect(self.on_current_changed)
+        self.view.verticalScrollBar().valueChanged.connect(self.schedule_prefetch)
+
+        # Coalesce scroll events into one prefetch per event loop pass
+        self.prefetch_timer = QTimer(self)
+        self.prefetch_timer.setSingleShot(True)
+        self.prefetch_timer.setInterval(50)
+        self.prefetch_timer.timeout.connect(self.prefetch_visible)
+
+        self.watcher = QFileSystemWatcher(self)
+        self.watcher.directoryChanged.connect(self.schedule_refresh)
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.setSingleShot(True)
+        self.refresh_timer.setInterval(200)
+        self.refresh_timer.timeout.connect(self.refresh)
+
+    def set_folder(self, folder):
+        self.folder_label.setText(folder)
+        if self.watcher.directories():
+            self.watcher.removePaths(self.watcher.directories())
+        self.watcher.addPath(folder)
+        self.model.set_folder(folder)
+        self.schedule_prefetch()
+
+    def set_files(self, files, title):
+        """Show a fixed list of images, such as catalog query results"""
+        self.folder_label.setText(title)
+        if self.watcher.directories():
+            self.watcher.removePaths(self.watcher.directories())
+        self.model.set_files(files)
+        self.schedule_prefetch()
+
+    def schedule_refresh(self):
+        self.refresh_timer.start()
+
+    def refresh(self):
+        self.model.refresh()
+        self.schedule_prefetch()
+
+    def schedule_prefetch(self):
+        self.prefetch_timer.start()
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.schedule_prefetch()
+
+    def prefetch_visible(self):
+        if not self.model.rowCount():
+            return
+        viewport = self.view.viewport().rect()
+        grid = self.view.gridSize()
+        first = self.view.indexAt(viewport.topLeft() + QPoint(grid.width() // 2, grid.height() // 2))
+        first_row = first.row() if first.isValid() else 0
+
+        # Grid cells are uniform, so the visible count follows from the viewport size
+        per_row = max(1, viewport.width() // grid.width())
+        visible_rows = viewport.height() // grid.height() + 2
+        last_row = min(self.model.rowCount() - 1, first_row + per_row * visible_rows - 1)
+        self.model.set_visible_range(first_row, last_row)
+
+    def on_current_changed(self, current, previous):
+        if current.isValid():
+            self.file_selected.emit(current.data(Qt.ItemDataRole.UserRole))
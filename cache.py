@@ -0,0 +1,341 @@
+"""Persistent metadata cache
+
+Records are stored in SQLite (WAL mode) keyed by path and validated against
+(size, mtime_ns, inode) on every lookup, so a changed file never gets a
+stale record. A bounded in-memory LRU sits in front of the database.
+
+Coordinates of geotagged records are mirrored into an R*Tree index
+(location_index) for the spatial queries in spatial.py, and the main
+EXIF fields into indexed catalog columns plus an FTS5 index over the
+remaining tags for catalog.py. Content and
+perceptual hashes (hashes.py) are kept in their own table under the same
+validation key, since they need a full read of the file.
+"""
+import json
+import os
+import pathlib
+import sqlite3
+from collections import OrderedDict
+import metadata
+import tracing
+
+DEFAULT_MEMORY_SIZE = 10000
+COMMIT_EVERY = 1000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    inode INTEGER NOT NULL,
+    record TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS locations (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    latitude REAL NOT NULL,
+    longitude REAL NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS location_index USING rtree(
+    id, min_lat, max_lat, min_lon, max_lon
+);
+CREATE TABLE IF NOT EXISTS hashes (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    inode INTEGER NOT NULL,
+    content_hash TEXT NOT NULL,
+    dhash INTEGER,
+    phash INTEGER
+);
+CREATE TABLE IF NOT EXISTS catalog (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    make TEXT COLLATE NOCASE,
+    model TEXT COLLATE NOCASE,
+    taken TEXT,
+    width INTEGER,
+    height INTEGER,
+    pixels INTEGER,
+    format TEXT COLLATE NOCASE,
+    size INTEGER,
+    gps INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS catalog_make ON catalog (make, model);
+CREATE INDEX IF NOT EXISTS catalog_model ON catalog (model);
+CREATE INDEX IF NOT EXISTS catalog_taken ON catalog (taken);
+CREATE INDEX IF NOT EXISTS catalog_pixels ON catalog (pixels);
+CREATE INDEX IF NOT EXISTS catalog_format ON catalog (format);
+"""
+
+# Full-text index over the other EXIF tags; rowid is catalog.id. Kept apart
+# since SQLite may be built without FTS5.
+TEXT_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS catalog_text USING fts5(tags);
+"""
+
+
+def to_sqlite_int(value):
+    """Store an unsigned 64-bit hash in SQLite's signed INTEGER"""
+    if value is None:
+        return None
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def from_sqlite_int(value):
+    if value is None:
+        return None
+    return value + (1 << 64) if value < 0 else value
+
+
+def file_key(file_path):
+    """Return the (size, mtime_ns, inode) triple used to validate cache rows"""
+    stat = os.stat(file_path)
+    return (stat.st_size, stat.st_mtime_ns, stat.st_ino)
+
+
+class MetadataCache:
+    def __init__(self, db_path, memory_size=DEFAULT_MEMORY_SIZE, readonly=False):
+        self.db_path = db_path
+        self.memory_size = memory_size
+        self.readonly = readonly
+        self.memory = OrderedDict()
+        self.pending_writes = 0
+
+        if readonly:
+            # as_uri() quotes '?', '#' and '%' in the path
+            self.conn = sqlite3.connect(pathlib.Path(db_path).resolve().as_uri() + "?mode=ro", uri=True)
+            self.has_text_index = self.table_exists('catalog_text')
+        else:
+            self.conn = sqlite3.connect(db_path)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            has_locations = self.table_exists('locations')
+            has_catalog = self.table_exists('catalog')
+            self.conn.executescript(SCHEMA)
+            try:
+                self.conn.executescript(TEXT_SCHEMA)
+            except sqlite3.OperationalError:
+                pass
+            self.has_text_index = self.table_exists('catalog_text')
+            # Databases created before the spatial index or the catalog get them filled from stored records
+            if not has_locations:
+                self.rebuild_locations()
+            if not has_catalog:
+                self.rebuild_catalog()
+            self.conn.commit()
+
+    def table_exists(self, name):
+        return self.conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (name,)).fetchone() is not None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _remember(self, path, key, record):
+        self.memory[path] = (key, record)
+        self.memory.move_to_end(path)
+        while len(self.memory) > self.memory_size:
+            self.memory.popitem(last=False)
+
+    def get(self, file_path, key=None):
+        """Return the cached record for a file, or None if missing or stale"""
+        if key is None:
+            try:
+                key = file_key(file_path)
+            except OSError:
+                return None
+
+        cached = self.memory.get(file_path)
+        if cached is not None:
+            if cached[0] == key:
+                self.memory.move_to_end(file_path)
+                return cached[1]
+            del self.memory[file_path]
+
+        row = self.conn.execute(
+            "SELECT size, mtime_ns, inode, record FROM records WHERE path = ?",
+            (file_path,)
+        ).fetchone()
+        if row is None:
+            return None
+        if tuple(row[:3]) != key:
+            self.invalidate(file_path)
+            return None
+
+        record = json.loads(row[3])
+        self._remember(file_path, key, record)
+        return record
+
+    def put(self, record):
+        """Store an extracted record and return its cached form"""
+        record = metadata.to_jsonable(record)
+        if 'mtime_ns' not in record:
+            # The file couldn't be stat'ed, there is nothing to key it on
+            return record
+        key = (record['size'], record['mtime_ns'], record['inode'])
+        self._remember(record['path'], key, record)
+        if self.readonly:
+            return record
+
+        self.conn.execute(
+            "INSERT OR REPLACE INTO records (path, size, mtime_ns, inode, record) VALUES (?, ?, ?, ?, ?)",
+            (record['path'], *key, json.dumps(record, ensure_ascii=False))
+        )
+        self._set_location(record['path'], metadata.record_location(record))
+        self._set_catalog(record['path'], record)
+        self.pending_writes += 1
+        if self.pending_writes >= COMMIT_EVERY:
+            self.commit()
+        return record
+
+    def invalidate(self, file_path):
+        """Drop a file from both cache layers"""
+        self.memory.pop(file_path, None)
+        if not self.readonly:
+            self.conn.execute("DELETE FROM records WHERE path = ?", (file_path,))
+            self._set_location(file_path, None)
+            self._set_catalog(file_path, None)
+            self.conn.execute("DELETE FROM hashes WHERE path = ?", (file_path,))
+            self.pending_writes += 1
+
+    def _set_location(self, file_path, location):
+        """Replace a file's row in the spatial index, None removes it"""
+        row = self.conn.execute("SELECT id FROM locations WHERE path = ?", (file_path,)).fetchone()
+        if row is not None:
+            self.conn.execute("DELETE FROM location_index WHERE id = ?", row)
+            self.conn.execute("DELETE FROM locations WHERE id = ?", row)
+        if location is None:
+            return
+
+        latitude, longitude = location
+        cursor = self.conn.execute(
+            "INSERT INTO locations (path, latitude, longitude) VALUES (?, ?, ?)",
+            (file_path, latitude, longitude)
+        )
+        self.conn.execute(
+            "INSERT INTO location_index VALUES (?, ?, ?, ?, ?)",
+            (cursor.lastrowid, latitude, latitude, longitude, longitude)
+        )
+
+    def rebuild_locations(self):
+        """Refill the spatial index from the stored records"""
+        self.conn.execute("DELETE FROM location_index")
+        self.conn.execute("DELETE FROM locations")
+        for path, record in self.conn.execute("SELECT path, record FROM records"):
+            self._set_location(path, metadata.record_location(json.loads(record)))
+        self.conn.commit()
+
+    def _set_catalog(self, file_path, record):
+        """Replace a file's catalog row, None (or a failed record) removes it"""
+        row = self.conn.execute("SELECT id FROM catalog WHERE path = ?", (file_path,)).fetchone()
+        if row is not None:
+            if self.has_text_index:
+                self.conn.execute("DELETE FROM catalog_text WHERE rowid = ?", row)
+            self.conn.execute("DELETE FROM catalog WHERE id = ?", row)
+        if record is None or record.get('error'):
+            return
+
+        entry = metadata.catalog_entry(record)
+        cursor = self.conn.execute(
+            "INSERT INTO catalog (path, make, model, taken, width, height, pixels, format, size, gps) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (file_path, entry['make'], entry['model'], entry['taken'], entry['width'], entry['height'],
+             entry['pixels'], entry['format'], entry['size'], int(entry['gps']))
+        )
+        if self.has_text_index and entry['tags']:
+            self.conn.execute("INSERT INTO catalog_text (rowid, tags) VALUES (?, ?)",
+                              (cursor.lastrowid, entry['tags']))
+
+    def rebuild_catalog(self):
+        """Refill the catalog from the stored records"""
+        if self.has_text_index:
+            self.conn.execute("DELETE FROM catalog_text")
+        self.conn.execute("DELETE FROM catalog")
+        for path, record in self.conn.execute("SELECT path, record FROM records"):
+            self._set_catalog(path, json.loads(record))
+        self.conn.commit()
+
+    def extract(self, file_path):
+        """Return a cached record, extracting and storing it on a miss"""
+        with tracing.span('cache_get'):
+            record = self.get(file_path)
+        if record is None:
+            record = metadata.extract(file_path)
+            with tracing.span('cache_put'):
+                record = self.put(record)
+        return record
+
+    def extract_many(self, file_paths):
+        """extract() for a list of files, the misses go through metadata.extract_many"""
+        with tracing.span('cache_get'):
+            records = [self.get(file_path) for file_path in file_paths]
+        misses = [file_path for file_path, record in zip(file_paths, records) if record is None]
+        if not misses:
+            return records
+        extracted = iter(metadata.extract_many(misses))
+        with tracing.span('cache_put'):
+            return [record if record is not None else self.put(next(extracted)) for record in records]
+
+    def get_hashes(self, file_path, key=None):
+        """Return cached hashes for a file, or None if missing or stale"""
+        if key is None:
+            try:
+                key = file_key(file_path)
+            except OSError:
+                return None
+        row = self.conn.execute(
+            "SELECT size, mtime_ns, inode, content_hash, dhash, phash FROM hashes WHERE path = ?",
+            (file_path,)
+        ).fetchone()
+        if row is None or tuple(row[:3]) != key:
+            return None
+        return {'content_hash': row[3], 'dhash': from_sqlite_int(row[4]), 'phash': from_sqlite_int(row[5])}
+
+    def put_hashes(self, file_path, key, hashes):
+        """Store the hashes computed for a file with the key it had then"""
+        if self.readonly:
+            return
+        self.conn.execute(
+            "INSERT OR REPLACE INTO hashes (path, size, mtime_ns, inode, content_hash, dhash, phash) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (file_path, *key, hashes['content_hash'],
+             to_sqlite_int(hashes['dhash']), to_sqlite_int(hashes['phash']))
+        )
+        self.pending_writes += 1
+        if self.pending_writes >= COMMIT_EVERY:
+            self.commit()
+
+    def commit(self):
+        if not self.readonly and self.pending_writes:
+            self.conn.commit()
+            self.pending_writes = 0
+
+    def close(self):
+        self.commit()
+        self.conn.close()
+
+
+# One read-only connection per worker process, see lookup_or_extract_chunk
+_worker_caches = {}
+
+
+def lookup_or_extract_chunk(db_path, file_paths):
+    """Worker entry point: serve hits from the cache, extract the misses
+
+    Returns (record, hit) pairs; the parent process stores the misses since
+    SQLite allows a single writer.
+    """
+    cache = _worker_caches.get(db_path)
+    if cache is None:
+        cache = _worker_caches[db_path] = MetadataCache(db_path, readonly=True)
+
+    with tracing.span('cache_get'):
+        records = [cache.get(file_path) for file_path in file_paths]
+    # Misses are extracted together so their GPS coordinates convert in one call
+    misses = [file_path for file_path, record in zip(file_paths, records) if record is None]
+    extracted = iter(metadata.extract_many(misses))
+    return [(record, True) if record is not None else (metadata.to_jsonable(next(extracted)), False)
+            for record in records]
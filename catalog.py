@@ -0,0 +1,226 @@
+"""Filter and aggregate queries over the metadata catalog
+
+MetadataCache mirrors every record into the catalog table: camera make
+and model, capture time (DateTimeOriginal, else DateTimeDigitized or
+DateTime), dimensions, pixel count, format, file size and whether it is
+geotagged, each with its own index, plus an FTS5 index over the remaining
+EXIF tags. Queries only touch those indexes, never the stored JSON.
+
+Usage: python catalog.py DB query [FILTERS] [--order FIELD] [--desc] [--limit N] [--paths]
+       python catalog.py DB count [FILTERS]
+       python catalog.py DB stats --by {make,model,format,year} [FILTERS]
+       python catalog.py DB reindex
+
+FILTERS: --make M --model M --format F --year Y --after DATE --before DATE
+         --min-mp MP --max-mp MP --min-width PX --min-height PX --gps/--no-gps
+         --text QUERY (FTS5 syntax, e.g. 'LensModel 70mm' or '"Software Photoshop"')
+"""
+import argparse
+import json
+import shlex
+import sqlite3
+import sys
+from cache import MetadataCache
+
+COLUMNS = ('path', 'make', 'model', 'taken', 'width', 'height', 'format', 'size', 'gps')
+ORDER_FIELDS = ('path', 'taken', 'pixels', 'size', 'make', 'model', 'format')
+# Aggregation key -> SQL expression
+GROUPS = {
+    'make': "c.make",
+    'model': "c.model",
+    'format': "c.format",
+    'year': "substr(c.taken, 1, 4)",
+}
+
+
+def where_clause(make=None, model=None, format=None, year=None, after=None, before=None,
+                 min_megapixels=None, max_megapixels=None, min_width=None, min_height=None,
+                 gps=None, text=None):
+    """FROM and WHERE clauses and their parameters for the given filters; None means any
+
+    Make, model and format compare case-insensitively. after is inclusive,
+    before exclusive, both as 'YYYY-MM-DD[ HH:MM:SS]'.
+    """
+    tables, conditions, params = "catalog c", [], []
+    for column, value in (('make', make), ('model', model), ('format', format)):
+        if value is not None:
+            conditions.append(f"c.{column} = ?")
+            params.append(value)
+    if year is not None:
+        conditions.append("c.taken >= ? AND c.taken < ?")
+        params += [f"{year:04d}", f"{year + 1:04d}"]
+    if after is not None:
+        conditions.append("c.taken >= ?")
+        params.append(after)
+    if before is not None:
+        conditions.append("c.taken < ?")
+        params.append(before)
+    if min_megapixels is not None:
+        conditions.append("c.pixels >= ?")
+        params.append(round(min_megapixels * 1e6))
+    if max_megapixels is not None:
+        conditions.append("c.pixels <= ?")
+        params.append(round(max_megapixels * 1e6))
+    if min_width is not None:
+        conditions.append("c.width >= ?")
+        params.append(min_width)
+    if min_height is not None:
+        conditions.append("c.height >= ?")
+        params.append(min_height)
+    if gps is not None:
+        conditions.append("c.gps = ?")
+        params.append(int(gps))
+    if text is not None:
+        # A join lets SQLite pick between the FTS match and the column indexes
+        tables += " JOIN catalog_text t ON t.rowid = c.id"
+        conditions.append("catalog_text MATCH ?")
+        params.append(text)
+    return tables, " AND ".join(conditions) or "1", params
+
+
+class Catalog:
+    def __init__(self, cache):
+        self.conn = cache.conn
+        self.has_text_index = cache.has_text_index
+
+    def execute(self, sql, params, filters):
+        if filters.get('text') is not None and not self.has_text_index:
+            raise ValueError("This SQLite build has no FTS5, --text is unavailable")
+        try:
+            return self.conn.execute(sql, params)
+        except sqlite3.OperationalError as e:
+            # Malformed FTS5 queries and catalogs from before the catalog existed
+            raise ValueError(str(e)) from None
+
+    def query(self, order='path', descending=False, limit=None, offset=0, **filters):
+        """Matching catalog rows as dicts"""
+        if order not in ORDER_FIELDS:
+            raise ValueError(f"Can't order by {order}")
+        tables, where, params = where_clause(**filters)
+        sql = (f"SELECT {', '.join('c.' + column for column in COLUMNS)} FROM {tables} WHERE {where} "
+               f"ORDER BY c.{order} {'DESC' if descending else 'ASC'} LIMIT ? OFFSET ?")
+        rows = self.execute(sql, params + [-1 if limit is None else limit, offset], filters)
+        return [dict(zip(COLUMNS, row), gps=bool(row[-1])) for row in rows]
+
+    def paths(self, order='path', descending=False, limit=None, **filters):
+        """Paths of the matching images, for the viewer's file list"""
+        return [row['path'] for row in self.query(order, descending, limit, **filters)]
+
+    def count(self, **filters):
+        tables, where, params = where_clause(**filters)
+        return self.execute(f"SELECT COUNT(*) FROM {tables} WHERE {where}", params, filters).fetchone()[0]
+
+    def aggregate(self, by, **filters):
+        """(value, count) pairs of the matching images grouped by a GROUPS key, largest first"""
+        if by not in GROUPS:
+            raise ValueError(f"Can't group by {by}")
+        tables, where, params = where_clause(**filters)
+        expression = GROUPS[by]
+        sql = (f"SELECT {expression}, COUNT(*) FROM {tables} WHERE {where} "
+               f"GROUP BY {expression} ORDER BY COUNT(*) DESC, {expression}")
+        return [tuple(row) for row in self.execute(sql, params, filters)]
+
+
+class QueryParser(argparse.ArgumentParser):
+    """Raises ValueError instead of exiting, for queries typed in the viewer"""
+
+    def error(self, message):
+        raise ValueError(message)
+
+
+def add_filter_arguments(parser):
+    parser.add_argument("--make", help="camera make (EXIF Make)")
+    parser.add_argument("--model", help="camera model (EXIF Model)")
+    parser.add_argument("--format", help="file format as PIL names it (JPEG, PNG, TIFF, ...)")
+    parser.add_argument("--year", type=int, help="taken in this year")
+    parser.add_argument("--after", metavar="DATE", help="taken on or after DATE (YYYY-MM-DD)")
+    parser.add_argument("--before", metavar="DATE", help="taken before DATE (YYYY-MM-DD)")
+    parser.add_argument("--min-mp", type=float, dest="min_megapixels", help="at least this many megapixels")
+    parser.add_argument("--max-mp", type=float, dest="max_megapixels", help="at most this many megapixels")
+    parser.add_argument("--min-width", type=int)
+    parser.add_argument("--min-height", type=int)
+    gps = parser.add_mutually_exclusive_group()
+    gps.add_argument("--gps", action="store_const", const=True, dest="gps", help="geotagged only")
+    gps.add_argument("--no-gps", action="store_const", const=False, dest="gps", help="without GPS only")
+    parser.add_argument("--text", help="full-text query over the other EXIF tags (FTS5 syntax)")
+
+
+FILTER_NAMES = ('make', 'model', 'format', 'year', 'after', 'before', 'min_megapixels', 'max_megapixels',
+                'min_width', 'min_height', 'gps', 'text')
+
+
+def filters_from_args(args):
+    return {name: getattr(args, name) for name in FILTER_NAMES}
+
+
+def parse_filters(text):
+    """Filters from a command-line style string such as '--model "EOS 5D" --year 2023'
+
+    Raises ValueError when it doesn't parse.
+    """
+    parser = QueryParser(prog="filters", add_help=False)
+    add_filter_arguments(parser)
+    return filters_from_args(parser.parse_args(shlex.split(text)))
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Query the metadata catalog of a cache database")
+    parser.add_argument("db", help="SQLite metadata cache written by batch.py --cache")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    query = commands.add_parser("query", help="list matching images")
+    add_filter_arguments(query)
+    query.add_argument("--order", choices=ORDER_FIELDS, default="path")
+    query.add_argument("--desc", action="store_true", help="descending order")
+    query.add_argument("--limit", type=int, help="at most this many rows")
+    query.add_argument("--paths", action="store_true", help="print paths only")
+
+    count = commands.add_parser("count", help="count matching images")
+    add_filter_arguments(count)
+
+    stats = commands.add_parser("stats", help="count matching images per make, model, format or year")
+    stats.add_argument("--by", choices=list(GROUPS), required=True)
+    add_filter_arguments(stats)
+
+    commands.add_parser("reindex", help="rebuild the catalog from cached records")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    try:
+        cache = MetadataCache(args.db, readonly=args.command != "reindex")
+    except sqlite3.Error as e:
+        print(f"Query error: {args.db}: {str(e)}", file=sys.stderr)
+        return 1
+
+    with cache:
+        if args.command == "reindex":
+            cache.rebuild_catalog()
+            print(f"Indexed {Catalog(cache).count()} images", file=sys.stderr)
+            return 0
+
+        catalog = Catalog(cache)
+        filters = filters_from_args(args)
+        try:
+            if args.command == "count":
+                print(catalog.count(**filters))
+                return 0
+            if args.command == "stats":
+                for value, count in catalog.aggregate(args.by, **filters):
+                    print(f"{count}\t{value if value is not None else '(unknown)'}")
+                return 0
+            rows = catalog.query(args.order, args.desc, args.limit, **filters)
+        except ValueError as e:
+            print(f"Query error: {str(e)}", file=sys.stderr)
+            return 1
+
+    for row in rows:
+        print(row['path'] if args.paths else json.dumps(row, ensure_ascii=False))
+    print(f"Found {len(rows)} images", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,112 @@
+"""Find duplicate and near-duplicate images
+
+Usage: python duplicates.py [--cache DB] [-j JOBS] [--hash {dhash,phash}] [-r RADIUS] PATH [PATH ...]
+
+Prints one JSON line per group: byte-identical files ("exact", by content
+hash) and visually similar ones ("similar", perceptual hashes within
+RADIUS bits). With --cache the hashes are stored next to the metadata and
+unchanged files are not read again.
+"""
+import argparse
+import json
+import os
+import sys
+import numpy as np
+import hashes
+import parallel
+from batch import iter_image_files
+from cache import MetadataCache, file_key
+
+
+def collect_hashes(paths, jobs=1, cache=None):
+    """Return (file paths, hash dicts) for every image under paths"""
+    file_paths = []
+    results = []
+    misses = []
+    if cache is not None:
+        # Same keys as batch.scan stores
+        paths = [os.path.abspath(path) for path in paths]
+    for file_path in iter_image_files(paths):
+        cached = None
+        if cache is not None:
+            try:
+                cached = cache.get_hashes(file_path, file_key(file_path))
+            except OSError:
+                continue
+        if cached is not None:
+            file_paths.append(file_path)
+            results.append(cached)
+        else:
+            misses.append(file_path)
+
+    if jobs > 1 and len(misses) > 1:
+        computed = parallel.extract_parallel(misses, workers=jobs, ordered=False, worker=hashes.hash_chunk)
+    else:
+        computed = hashes.hash_chunk(misses)
+    for file_path, key, result in computed:
+        if cache is not None:
+            cache.put_hashes(file_path, key, result)
+        file_paths.append(file_path)
+        results.append(result)
+
+    if cache is not None:
+        cache.commit()
+    return file_paths, results
+
+
+def exact_groups(file_paths, results):
+    """Lists of paths sharing a content hash"""
+    by_hash = {}
+    for file_path, result in zip(file_paths, results):
+        by_hash.setdefault(result['content_hash'], []).append(file_path)
+    return [(content_hash, sorted(group)) for content_hash, group in by_hash.items() if len(group) > 1]
+
+
+def similar_groups(file_paths, results, hash_type='dhash', radius=hashes.DEFAULT_RADIUS):
+    """Lists of paths whose perceptual hashes are linked within radius bits"""
+    decoded = [(file_path, result[hash_type]) for file_path, result in zip(file_paths, results)
+               if result[hash_type] is not None]
+    if not decoded:
+        return []
+    values = np.fromiter((value for _, value in decoded), dtype=np.uint64, count=len(decoded))
+    groups = hashes.near_duplicate_groups(values, radius)
+    return [sorted(decoded[i][0] for i in group) for group in groups]
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Find duplicate and near-duplicate images")
+    parser.add_argument("paths", nargs="+", help="image files or directories to scan")
+    parser.add_argument("--cache", metavar="DB", help="SQLite metadata cache to keep hashes in")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="number of worker processes, 0 for one per CPU (default: 1)")
+    parser.add_argument("--hash", choices=hashes.HASH_TYPES, default="dhash",
+                        help="perceptual hash for near duplicates (default: dhash)")
+    parser.add_argument("-r", "--radius", type=int, default=hashes.DEFAULT_RADIUS,
+                        help=f"maximum differing bits for near duplicates (default: {hashes.DEFAULT_RADIUS})")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    jobs = args.jobs or os.cpu_count() or 1
+
+    cache = MetadataCache(args.cache) if args.cache else None
+    try:
+        file_paths, results = collect_hashes(args.paths, jobs, cache)
+    finally:
+        if cache:
+            cache.close()
+
+    exact = exact_groups(file_paths, results)
+    for content_hash, group in exact:
+        print(json.dumps({'kind': 'exact', 'content_hash': content_hash, 'paths': group}, ensure_ascii=False))
+    similar = similar_groups(file_paths, results, args.hash, args.radius)
+    for group in similar:
+        print(json.dumps({'kind': 'similar', 'paths': group}, ensure_ascii=False))
+
+    print(f"Hashed {len(file_paths)} files: {len(exact)} exact, {len(similar)} similar groups", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
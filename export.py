@@ -0,0 +1,209 @@
+"""Streaming exporters for batch metadata records
+
+Each writer takes one record at a time and keeps at most one buffered batch
+in memory. JSON Lines keeps the full nested record; CSV, Parquet and Arrow
+use the flat typed schema in COLUMNS. Parquet and Arrow need pyarrow.
+"""
+import csv
+import json
+import os
+import metadata
+
+# Flat column schema: (name, arrow type name)
+COLUMNS = [
+    ('path', 'string'),
+    ('name', 'string'),
+    ('size', 'int64'),
+    ('created', 'float64'),
+    ('modified', 'float64'),
+    ('accessed', 'float64'),
+    ('mtime_ns', 'int64'),
+    ('inode', 'int64'),
+    ('width', 'int64'),
+    ('height', 'int64'),
+    ('depth', 'int64'),
+    ('format', 'string'),
+    ('mode', 'string'),
+    ('alpha', 'bool_'),
+    ('dpi_x', 'float64'),
+    ('dpi_y', 'float64'),
+    ('icc_profile', 'bool_'),
+    ('make', 'string'),
+    ('model', 'string'),
+    ('datetime', 'string'),
+    ('orientation', 'int64'),
+    ('gps_latitude', 'float64'),
+    ('gps_longitude', 'float64'),
+    ('exif', 'string'),
+    ('error', 'string'),
+]
+COLUMN_NAMES = [name for name, _ in COLUMNS]
+
+# EXIF tags promoted to their own columns
+PROMOTED_TAGS = {
+    'make': 'Make',
+    'model': 'Model',
+    'datetime': 'DateTime',
+    'orientation': 'Orientation',
+}
+
+FORMATS = ('jsonl', 'csv', 'parquet', 'arrow')
+EXTENSION_FORMATS = {
+    '.jsonl': 'jsonl',
+    '.ndjson': 'jsonl',
+    '.json': 'jsonl',
+    '.csv': 'csv',
+    '.parquet': 'parquet',
+    '.arrow': 'arrow',
+    '.feather': 'arrow',
+}
+
+BUFFER_SIZE = 1024 * 1024
+BATCH_SIZE = 10000
+
+
+def flatten_record(record):
+    """Turn a nested record into a flat row matching COLUMNS"""
+    record = metadata.to_jsonable(record)
+    row = {name: record.get(name) for name in COLUMN_NAMES}
+
+    dpi = record.get('dpi')
+    row['dpi_x'], row['dpi_y'] = (dpi[0], dpi[1]) if dpi else (None, None)
+
+    exif = record.get('exif') or {}
+    for column, tag in PROMOTED_TAGS.items():
+        row[column] = exif.get(tag)
+    if not isinstance(row['orientation'], int):
+        row['orientation'] = None
+    gps = exif.get('GPSInfo')
+    if isinstance(gps, dict):
+        row['gps_latitude'] = gps.get('Latitude')
+        row['gps_longitude'] = gps.get('Longitude')
+    row['exif'] = json.dumps(exif, ensure_ascii=False) if exif else None
+    return row
+
+
+def detect_format(path):
+    """Guess the export format from a file extension"""
+    return EXTENSION_FORMATS.get(os.path.splitext(path)[1].lower(), 'jsonl')
+
+
+class JsonLinesWriter:
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, record):
+        self.stream.write(json.dumps(metadata.to_jsonable(record), ensure_ascii=False))
+        self.stream.write("\n")
+
+    def flush(self):
+        self.stream.flush()
+
+    def close(self):
+        self.flush()
+
+
+class CsvWriter:
+    def __init__(self, stream):
+        self.stream = stream
+        self.writer = csv.DictWriter(stream, fieldnames=COLUMN_NAMES)
+        self.writer.writeheader()
+
+    def write(self, record):
+        self.writer.writerow(flatten_record(record))
+
+    def flush(self):
+        self.stream.flush()
+
+    def close(self):
+        self.flush()
+
+
+class ArrowWriter:
+    """Parquet or Arrow IPC file writer, flushing every batch_size rows"""
+
+    def __init__(self, path, fmt='parquet', batch_size=BATCH_SIZE):
+        try:
+            import pyarrow
+        except ImportError:
+            raise RuntimeError(f"{fmt} export requires pyarrow (pip install pyarrow)") from None
+
+        self.pa = pyarrow
+        self.schema = pyarrow.schema([(name, getattr(pyarrow, type_name)()) for name, type_name in COLUMNS])
+        self.batch_size = batch_size
+        self.rows = {name: [] for name in COLUMN_NAMES}
+        self.count = 0
+
+        if fmt == 'parquet':
+            import pyarrow.parquet
+            self.writer = pyarrow.parquet.ParquetWriter(path, self.schema)
+        else:
+            import pyarrow.ipc
+            self.writer = pyarrow.ipc.new_file(path, self.schema)
+
+    def write(self, record):
+        row = flatten_record(record)
+        for name in COLUMN_NAMES:
+            self.rows[name].append(row[name])
+        self.count += 1
+        if self.count >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.count:
+            return
+        batch = self.pa.RecordBatch.from_pydict(self.rows, schema=self.schema)
+        self.writer.write_batch(batch)
+        self.rows = {name: [] for name in COLUMN_NAMES}
+        self.count = 0
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+
+class FileWriter:
+    """Wrap a text writer so closing it also closes the file"""
+
+    def __init__(self, writer_class, path, **open_args):
+        self.file = open(path, 'w', encoding='utf-8', buffering=BUFFER_SIZE, **open_args)
+        self.writer = writer_class(self.file)
+
+    def write(self, record):
+        self.writer.write(record)
+
+    def flush(self):
+        self.writer.flush()
+
+    def close(self):
+        self.writer.close()
+        self.file.close()
+
+
+def open_writer(path=None, fmt=None, stream=None):
+    """Create a record writer for a path (or a text stream for jsonl/csv)"""
+    fmt = fmt or (detect_format(path) if path else 'jsonl')
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+
+    if fmt in ('parquet', 'arrow'):
+        if not path:
+            raise ValueError(f"{fmt} export needs an output file")
+        return ArrowWriter(path, fmt)
+
+    writer_class = JsonLinesWriter if fmt == 'jsonl' else CsvWriter
+    if path:
+        return FileWriter(writer_class, path, newline='' if fmt == 'csv' else None)
+    return writer_class(stream)
+
+
+def write_records(records, writer):
+    """Stream records into a writer and close it, returning the count"""
+    count = 0
+    try:
+        for record in records:
+            writer.write(record)
+            count += 1
+    finally:
+        writer.close()
+    return count
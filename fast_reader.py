@@ -0,0 +1,498 @@
+"""Minimal-read header and EXIF parser for JPEG, TIFF, PNG and WebP
+
+Walks the container structure over an mmap and only touches the bytes that
+hold headers and EXIF; pixel data is never read or decoded. Values come out
+the way PIL's getexif() returns them, so the decoding in metadata.py works
+on either source. Anything unrecognised, truncated or corrupt returns None
+and callers fall back to PIL.
+"""
+import functools
+import mmap
+import re
+import struct
+import zlib
+
+
+@functools.cache
+def pil_tiff():
+    """PIL's TiffTags and IFDRational, imported with the first EXIF tag
+
+    TiffImagePlugin pulls in PIL.Image, which files without EXIF never need.
+    """
+    from PIL import TiffTags
+    from PIL.TiffImagePlugin import IFDRational
+    return TiffTags, IFDRational
+
+
+# TIFF field type: (unit size, struct format or None for special handling)
+TIFF_TYPES = {
+    1: (1, None),    # BYTE
+    2: (1, None),    # ASCII
+    3: (2, 'H'),     # SHORT
+    4: (4, 'L'),     # LONG
+    5: (8, None),    # RATIONAL
+    6: (1, 'b'),     # SBYTE
+    7: (1, None),    # UNDEFINED
+    8: (2, 'h'),     # SSHORT
+    9: (4, 'l'),     # SLONG
+    10: (8, None),   # SRATIONAL
+    11: (4, 'f'),    # FLOAT
+    12: (8, 'd'),    # DOUBLE
+    13: (4, 'L'),    # IFD
+}
+
+EXIF_HEADER = b'Exif\x00\x00'
+XMP_HEADER = b'http://ns.adobe.com/xap/1.0/\x00'
+XMP_ORIENTATION = re.compile(rb'tiff:Orientation(="|>)([0-9])')
+ORIENTATION = 0x0112
+
+# JPEG start-of-frame markers (DHT, JPG and DAC share the range)
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+JPEG_MODES = {1: 'L', 3: 'RGB', 4: 'CMYK'}
+
+# (bit depth, colour type) -> PIL mode
+PNG_MODES = {
+    (1, 0): '1', (2, 0): 'L', (4, 0): 'L', (8, 0): 'L',
+    (8, 2): 'RGB', (16, 2): 'RGB',
+    (1, 3): 'P', (2, 3): 'P', (4, 3): 'P', (8, 3): 'P',
+    (8, 4): 'LA', (16, 4): 'LA',
+    (8, 6): 'RGBA', (16, 6): 'RGBA',
+}
+
+# (photometric, samples per pixel, bits per sample) -> PIL mode
+TIFF_MODES = {
+    (0, 1, 1): '1', (1, 1, 1): '1',
+    (0, 1, 8): 'L', (1, 1, 8): 'L',
+    (2, 3, 8): 'RGB',
+    (3, 1, 8): 'P',
+    (5, 4, 8): 'CMYK',
+}
+# ExtraSamples value -> mode for 4-sample RGB
+TIFF_RGB_EXTRA = {0: 'RGBX', 1: 'RGBa', 2: 'RGBA'}
+
+
+class ExifData:
+    """Read-only EXIF mapping over a TIFF block, mirroring PIL's Exif"""
+
+    def __init__(self, data):
+        if data[:6] == EXIF_HEADER:
+            data = data[6:]
+        if data[:2] == b'II':
+            self.endian = '<'
+        elif data[:2] == b'MM':
+            self.endian = '>'
+        else:
+            raise ValueError("Not a TIFF header")
+        if struct.unpack_from(self.endian + 'H', data, 2)[0] != 42:
+            raise ValueError("Unsupported TIFF variant")
+
+        self.data = data
+        self.ifds = {}
+        offset = struct.unpack_from(self.endian + 'L', data, 4)[0]
+        self.tags, self.next_offset = self.read_ifd(offset)
+
+    def read_ifd(self, offset, group=None):
+        """Parse one IFD, returning (tags, next IFD offset)"""
+        data = self.data
+        endian = self.endian
+        tags = {}
+        if offset < 8 or offset + 2 > len(data):
+            return tags, 0
+
+        count = struct.unpack_from(endian + 'H', data, offset)[0]
+        position = offset + 2
+        for _ in range(count):
+            if position + 12 > len(data):
+                raise ValueError("Truncated IFD")
+            tag, field_type, value_count = struct.unpack_from(endian + 'HHL', data, position)
+            field = TIFF_TYPES.get(field_type)
+            if field is not None:
+                size = field[0] * value_count
+                if size > 4:
+                    value_offset = struct.unpack_from(endian + 'L', data, position + 8)[0]
+                    raw = data[value_offset:value_offset + size]
+                else:
+                    raw = data[position + 8:position + 8 + size]
+                # PIL gives up on the rest of an IFD here, so leave the file to PIL
+                if len(raw) != size:
+                    raise ValueError("IFD field past the end of the data")
+                # Same as PIL: empty fields are dropped
+                if size:
+                    tags[tag] = self.convert(tag, field_type, field[1], value_count, raw, group)
+            position += 12
+
+        next_offset = 0
+        if position + 4 <= len(data):
+            next_offset = struct.unpack_from(endian + 'L', data, position)[0]
+        return tags, next_offset
+
+    def convert(self, tag, field_type, fmt, count, raw, group):
+        TiffTags, IFDRational = pil_tiff()
+        if field_type in (1, 7):
+            values = (bytes(raw),)
+        elif field_type == 2:
+            raw = bytes(raw)
+            if raw.endswith(b'\0'):
+                raw = raw[:-1]
+            values = (raw.decode('latin-1', 'replace'),)
+        elif field_type in (5, 10):
+            parts = struct.unpack(f"{self.endian}{count * 2}{'L' if field_type == 5 else 'l'}", raw)
+            values = tuple(IFDRational(parts[i], parts[i + 1]) for i in range(0, len(parts), 2))
+        else:
+            values = struct.unpack(f"{self.endian}{count}{fmt}", raw)
+
+        # PIL stores single values and spec'd single-value tags as scalars
+        if len(values) == 1 or TiffTags.lookup(tag, group).length == 1:
+            return values[0]
+        return values
+
+    def detach(self):
+        """Parse the sub-IFDs now and drop the reference to the file buffer"""
+        for tag in (0x8769, 0x8825, 0xA005, -1):
+            self.get_ifd(tag)
+        self.data = None
+
+    def get_ifd(self, tag):
+        """Return a sub-IFD (Exif, GPS, Interop) or IFD1 (-1) as a dict"""
+        if tag not in self.ifds:
+            if self.data is None:
+                return {}
+            if tag == -1:
+                offset, group = self.next_offset, None
+            elif tag == 0xA005:
+                offset, group = self.get_ifd(0x8769).get(tag), tag
+            else:
+                offset, group = self.tags.get(tag), tag
+            ifd = {}
+            if isinstance(offset, int) and offset:
+                ifd, _ = self.read_ifd(offset, group)
+            self.ifds[tag] = ifd
+        return self.ifds[tag]
+
+    # Mapping interface used by metadata.exif_entries
+    def __iter__(self):
+        return iter(self.tags)
+
+    def __len__(self):
+        return len(self.tags)
+
+    def __contains__(self, tag):
+        return tag in self.tags
+
+    def __getitem__(self, tag):
+        return self.tags[tag]
+
+    def get(self, tag, default=None):
+        return self.tags.get(tag, default)
+
+    def keys(self):
+        return list(iter(self))
+
+    def items(self):
+        return [(tag, self.tags[tag]) for tag in self]
+
+
+def apply_xmp_orientation(exif, xmp):
+    """PIL fills a missing EXIF orientation from XMP, do the same"""
+    if xmp is None or (exif is not None and ORIENTATION in exif.tags):
+        return exif
+    match = XMP_ORIENTATION.search(xmp)
+    if not match:
+        return exif
+    if exif is None:
+        # Empty little-endian TIFF block: header plus an IFD with no entries
+        exif = ExifData(b'II*\x00\x08\x00\x00\x00\x00\x00\x00\x00\x00\x00')
+    exif.tags[ORIENTATION] = int(match[2])
+    return exif
+
+
+def read_jpeg(buf):
+    size = len(buf)
+    position = 2
+    header = {'format': 'JPEG', 'alpha': False, 'icc_profile': False}
+    exif_data = xmp = None
+    jfif_dpi = None
+    frame = None
+
+    while position + 4 <= size:
+        if buf[position] != 0xFF:
+            return None
+        marker = buf[position + 1]
+        if marker == 0xFF:
+            position += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+            position += 2
+            continue
+        if marker in (0xD9, 0xDA):
+            break
+
+        length = struct.unpack_from('>H', buf, position + 2)[0]
+        segment = buf[position + 4:position + 2 + length]
+        if marker == 0xE0 and segment[:5] == b'JFIF\x00' and len(segment) >= 12:
+            unit = segment[7]
+            density = struct.unpack_from('>HH', segment, 8)
+            if unit == 1:
+                jfif_dpi = density
+            elif unit == 2:
+                jfif_dpi = (density[0] * 2.54, density[1] * 2.54)
+        elif marker == 0xE1 and segment[:6] == EXIF_HEADER and exif_data is None:
+            exif_data = segment
+        elif marker == 0xE1 and segment[:len(XMP_HEADER)] == XMP_HEADER and xmp is None:
+            xmp = bytes(segment[len(XMP_HEADER):])
+        elif marker == 0xE2 and segment[:12] == b'ICC_PROFILE\x00':
+            header['icc_profile'] = True
+        elif marker in JPEG_SOF_MARKERS:
+            frame = (segment[0],) + struct.unpack_from('>HHB', segment, 1)
+        position += 2 + length
+
+    if frame is None:
+        return None
+    precision, height, width, components = frame
+    mode = JPEG_MODES.get(components)
+    if precision != 8 or mode is None:
+        return None
+
+    exif = ExifData(exif_data) if exif_data is not None else None
+    header.update(width=width, height=height, mode=mode)
+
+    # PIL prefers JFIF density, then EXIF resolution, then 72 DPI
+    header['dpi'] = jfif_dpi
+    if jfif_dpi is None and exif is not None:
+        try:
+            dpi = float(exif[0x011A])
+            if dpi != dpi:
+                raise ValueError
+            if exif[0x0128] == 3:
+                dpi *= 2.54
+            header['dpi'] = (dpi, dpi)
+        except (KeyError, TypeError, ValueError, ZeroDivisionError):
+            header['dpi'] = (72, 72)
+
+    header['exif'] = apply_xmp_orientation(exif, xmp)
+    return header
+
+
+def read_png_text(chunk_type, data):
+    """Return (keyword, text) from a tEXt, zTXt or iTXt chunk"""
+    keyword, _, rest = bytes(data).partition(b'\x00')
+    if chunk_type == b'tEXt':
+        text = rest
+    elif chunk_type == b'zTXt':
+        text = zlib.decompress(rest[1:])
+    else:
+        compressed, rest = rest[0], rest[2:]
+        _, _, rest = rest.partition(b'\x00')
+        _, _, text = rest.partition(b'\x00')
+        if compressed:
+            text = zlib.decompress(text)
+        return keyword.decode('latin-1'), text.decode('utf-8', 'replace')
+    return keyword.decode('latin-1'), text.decode('latin-1', 'replace')
+
+
+def read_png(buf):
+    size = len(buf)
+    position = 8
+    header = {'format': 'PNG', 'dpi': None, 'icc_profile': False}
+    ihdr = None
+    transparency = False
+    exif_data = raw_profile = xmp = None
+
+    while position + 8 <= size:
+        length, chunk_type = struct.unpack_from('>L4s', buf, position)
+        data = buf[position + 8:position + 8 + length]
+        if chunk_type == b'IHDR':
+            ihdr = struct.unpack_from('>LLBB', data)
+        elif chunk_type == b'tRNS':
+            transparency = True
+        elif chunk_type == b'pHYs':
+            px, py, unit = struct.unpack_from('>LLB', data)
+            if unit == 1:
+                header['dpi'] = (px * 0.0254, py * 0.0254)
+        elif chunk_type == b'iCCP':
+            header['icc_profile'] = True
+        elif chunk_type == b'eXIf':
+            exif_data = data
+        elif chunk_type in (b'tEXt', b'zTXt', b'iTXt'):
+            try:
+                keyword, text = read_png_text(chunk_type, data)
+            except (zlib.error, IndexError):
+                keyword, text = None, None
+            if keyword == 'Raw profile type exif':
+                raw_profile = text
+            elif keyword == 'XML:com.adobe.xmp':
+                xmp = text.encode('utf-8')
+        elif chunk_type == b'IEND':
+            break
+        # IDAT chunks are skipped without being read
+        position += 12 + length
+
+    if ihdr is None:
+        return None
+    width, height, bit_depth, colour_type = ihdr
+    mode = PNG_MODES.get((bit_depth, colour_type))
+    if mode is None:
+        return None
+
+    exif = None
+    if exif_data is not None:
+        exif = ExifData(exif_data)
+    elif raw_profile is not None:
+        exif = ExifData(bytes.fromhex("".join(raw_profile.split("\n")[3:])))
+
+    header.update(
+        width=width,
+        height=height,
+        mode=mode,
+        alpha=mode in ('LA', 'RGBA') or transparency,
+        exif=apply_xmp_orientation(exif, xmp),
+    )
+    return header
+
+
+def read_webp(buf):
+    size = len(buf)
+    position = 12
+    header = {'format': 'WEBP', 'dpi': None, 'icc_profile': False}
+    dimensions = None
+    alpha = False
+    exif_data = xmp = None
+
+    while position + 8 <= size:
+        chunk_type, length = struct.unpack_from('<4sL', buf, position)
+        data = buf[position + 8:position + 8 + length]
+        if chunk_type == b'VP8X':
+            alpha = alpha or bool(data[0] & 0x10)
+            dimensions = (1 + int.from_bytes(data[4:7], 'little'), 1 + int.from_bytes(data[7:10], 'little'))
+        elif chunk_type == b'VP8 ' and dimensions is None:
+            if data[3:6] != b'\x9d\x01\x2a':
+                return None
+            width, height = struct.unpack_from('<HH', data, 6)
+            dimensions = (width & 0x3FFF, height & 0x3FFF)
+        elif chunk_type == b'VP8L' and dimensions is None:
+            if data[0] != 0x2F:
+                return None
+            bits = struct.unpack_from('<L', data, 1)[0]
+            dimensions = ((bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1)
+            alpha = alpha or bool((bits >> 28) & 1)
+        elif chunk_type == b'ALPH':
+            alpha = True
+        elif chunk_type == b'ICCP':
+            header['icc_profile'] = True
+        elif chunk_type == b'EXIF':
+            exif_data = data
+        elif chunk_type == b'XMP ':
+            xmp = bytes(data)
+        # Chunks are padded to an even size
+        position += 8 + length + (length & 1)
+
+    if dimensions is None:
+        return None
+    exif = ExifData(exif_data) if exif_data is not None else None
+    header.update(
+        width=dimensions[0],
+        height=dimensions[1],
+        mode='RGBA' if alpha else 'RGB',
+        alpha=alpha,
+        exif=apply_xmp_orientation(exif, xmp),
+    )
+    return header
+
+
+def read_tiff(buf):
+    exif = ExifData(buf)
+    tags = exif.tags
+    if 256 not in tags or 257 not in tags:
+        return None
+
+    bits = tags.get(258, 1)
+    if isinstance(bits, tuple):
+        bits = bits[0]
+    samples = tags.get(277, 1)
+    photometric = tags.get(262)
+    sample_format = tags.get(339, 1)
+    if isinstance(sample_format, tuple):
+        sample_format = sample_format[0]
+    if sample_format != 1:
+        # Signed or floating point samples
+        return None
+
+    if photometric == 2 and samples == 4 and bits == 8:
+        extra = tags.get(338, 0)
+        mode = TIFF_RGB_EXTRA.get(extra[0] if isinstance(extra, tuple) else extra)
+    else:
+        mode = TIFF_MODES.get((photometric, samples, bits))
+    if mode is None:
+        return None
+
+    # Same defaults as PIL's TIFF plugin
+    dpi = None
+    x_resolution = tags.get(282, 1)
+    y_resolution = tags.get(283, 1)
+    if x_resolution and y_resolution:
+        unit = tags.get(296)
+        if unit == 2 or unit is None:
+            dpi = (float(x_resolution), float(y_resolution))
+        elif unit == 3:
+            dpi = (float(x_resolution) * 2.54, float(y_resolution) * 2.54)
+
+    # PIL reports the displayed size for rotated orientations
+    width, height = tags[256], tags[257]
+    if tags.get(ORIENTATION) in (5, 6, 7, 8):
+        width, height = height, width
+
+    return {
+        'format': 'TIFF',
+        'width': width,
+        'height': height,
+        'mode': mode,
+        'alpha': mode in ('RGBA', 'RGBa'),
+        'dpi': dpi,
+        'icc_profile': 34675 in tags,
+        'exif': exif,
+    }
+
+
+def read_header(file_path):
+    """Read format, dimensions, mode, DPI and EXIF without decoding pixels
+
+    Returns a dict with the same image fields as metadata.get_image_metadata
+    plus 'exif' (an ExifData or None), or None when the file isn't a
+    supported JPEG, PNG, WebP or TIFF.
+    """
+    try:
+        with open(file_path, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        # Unreadable or empty (zero-length files can't be mapped)
+        return None
+
+    try:
+        return read_buffer(memoryview(mapped))
+    except (ValueError, struct.error, IndexError, zlib.error):
+        return None
+    finally:
+        try:
+            mapped.close()
+        except BufferError:
+            # A slice is still referenced, the map closes once it's collected
+            pass
+
+
+def read_buffer(buf):
+    """Dispatch on the file signature"""
+    signature = bytes(buf[:12])
+    if signature[:3] == b'\xff\xd8\xff':
+        header = read_jpeg(buf)
+    elif signature[:8] == b'\x89PNG\r\n\x1a\n':
+        header = read_png(buf)
+    elif signature[:4] == b'RIFF' and signature[8:12] == b'WEBP':
+        header = read_webp(buf)
+    elif signature[:4] in (b'II*\x00', b'MM\x00*'):
+        header = read_tiff(buf)
+    else:
+        header = None
+
+    if header is not None and header.get('exif') is not None:
+        header['exif'].detach()
+    return header
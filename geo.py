@@ -0,0 +1,98 @@
+"""Bulk GPS coordinate conversion with NumPy
+
+metadata.dms_to_decimal converts one coordinate at a time, which is fine
+for the viewer. Geotagging a large collection instead gathers the raw
+rationals of all files into arrays and does the arithmetic in one call
+(see metadata.extract_many).
+"""
+import numpy as np
+
+# Tag ids inside the GPS IFD
+GPS_LATITUDE_REF = 0x0001
+GPS_LATITUDE = 0x0002
+GPS_LONGITUDE_REF = 0x0003
+GPS_LONGITUDE = 0x0004
+
+NEGATIVE_REFS = ['S', 'W']
+
+# Mean Earth radius (IUGG)
+EARTH_RADIUS_KM = 6371.0088
+
+
+def dms_to_decimal_array(dms, refs=None):
+    """Convert DMS values to signed decimal degrees
+
+    dms is an (N, 3) array of degrees, minutes and seconds, or an
+    (N, 3, 2) array of numerator/denominator pairs as stored in EXIF.
+    refs is an optional length-N sequence of 'N', 'S', 'E' or 'W'; 'S' and
+    'W' make the result negative. Zero denominators give NaN.
+    """
+    values = np.asarray(dms, dtype=np.float64)
+    if values.ndim == 3:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            values = values[..., 0] / values[..., 1]
+        values[~np.isfinite(values)] = np.nan
+
+    # Same operations as metadata.dms_to_decimal, so both give identical floats
+    decimal = values[:, 0] + values[:, 1] / 60 + values[:, 2] / 3600
+    if refs is not None:
+        negative = np.isin(np.asarray(refs, dtype=str), NEGATIVE_REFS)
+        decimal = np.where(negative, -decimal, decimal)
+    return decimal
+
+
+def rational_pairs(value):
+    """(numerator, denominator) pairs of a 3-value EXIF coordinate, or None"""
+    if not isinstance(value, tuple) or len(value) != 3:
+        return None
+    try:
+        return [(v.numerator, v.denominator) if hasattr(v, 'numerator') else (v, 1) for v in value]
+    except Exception:
+        return None
+
+
+def gps_coordinates(gps_ifds):
+    """Decimal latitude and longitude arrays for many GPS IFDs
+
+    gps_ifds yields tag id -> value mappings as returned by
+    Exif.get_ifd(0x8825), or None for files without GPS. The Python loop
+    only copies numerators, denominators and refs; missing or malformed
+    coordinates come out as NaN. Missing refs count as 'N' and 'E'.
+    """
+    gps_ifds = list(gps_ifds)
+    count = len(gps_ifds)
+    # NaN / 1 for rows that never get filled in
+    latitudes = np.full((count, 3, 2), np.nan)
+    longitudes = np.full((count, 3, 2), np.nan)
+    latitudes[..., 1] = longitudes[..., 1] = 1
+    latitude_refs = ['N'] * count
+    longitude_refs = ['E'] * count
+
+    for row, gps_ifd in enumerate(gps_ifds):
+        if not isinstance(gps_ifd, dict):
+            continue
+        latitude = rational_pairs(gps_ifd.get(GPS_LATITUDE))
+        longitude = rational_pairs(gps_ifd.get(GPS_LONGITUDE))
+        if latitude is None or longitude is None:
+            continue
+        try:
+            latitudes[row] = latitude
+            longitudes[row] = longitude
+        except (TypeError, ValueError, OverflowError):
+            latitudes[row] = longitudes[row] = np.nan
+            continue
+        latitude_refs[row] = str(gps_ifd.get(GPS_LATITUDE_REF, 'N'))
+        longitude_refs[row] = str(gps_ifd.get(GPS_LONGITUDE_REF, 'E'))
+
+    return (dms_to_decimal_array(latitudes, latitude_refs),
+            dms_to_decimal_array(longitudes, longitude_refs))
+
+
+def haversine_km(latitude, longitude, latitudes, longitudes):
+    """Great-circle distances in km from one point to arrays of points"""
+    lat1 = np.radians(latitude)
+    lat2 = np.radians(np.asarray(latitudes, dtype=np.float64))
+    dlat = lat2 - lat1
+    dlon = np.radians(np.asarray(longitudes, dtype=np.float64) - longitude)
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
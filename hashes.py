@@ -0,0 +1,296 @@
+"""Content and perceptual hashes for duplicate detection
+
+content_hash is BLAKE2b over the file bytes, so only byte-identical files
+match. dhash and phash describe the picture itself from a tiny grayscale
+decode and survive re-encoding, resizing and small edits; near duplicates
+are hashes a few bits apart. Both perceptual hashes work on stacks of
+images at once.
+
+HashIndex finds all pairs within a Hamming radius with multi-index
+hashing: the 64 bits are split into chunks, and by pigeonhole two hashes
+within radius r have some chunk within r // chunks bits of each other.
+Only hashes sharing such a chunk are compared, which keeps clustering far
+from quadratic.
+"""
+import hashlib
+import itertools
+import math
+import numpy as np
+from PIL import Image
+import preview
+from cache import file_key
+
+READ_SIZE = 1024 * 1024
+# dHash compares neighbours in a 9x8 image, pHash keeps 8x8 DCT coefficients of a 32x32 one
+HASH_SIZE = 8
+PHASH_INPUT_SIZE = 32
+HASH_TYPES = ('dhash', 'phash')
+
+DEFAULT_RADIUS = 4
+# Queries handled per vectorized step of HashIndex.pairs
+BLOCK_SIZE = 65536
+# Chunks up to this width get a direct bucket table instead of binary search
+MAX_TABLE_BITS = 24
+
+POPCOUNT_TABLE = np.array([bin(value).count('1') for value in range(256)], dtype=np.uint8)
+
+
+def content_hash(file_path):
+    """BLAKE2b-128 hex digest of the file contents"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(READ_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_gray(file_path):
+    """Decode a file as a PHASH_INPUT_SIZE square grayscale array"""
+    with Image.open(file_path) as img:
+        preview.reduce_decoding(img, PHASH_INPUT_SIZE, PHASH_INPUT_SIZE)
+        gray = img.convert('L').resize((PHASH_INPUT_SIZE, PHASH_INPUT_SIZE), Image.Resampling.LANCZOS)
+    return np.asarray(gray, dtype=np.float32)
+
+
+def resize_stack(pixels, width, height):
+    """Area-average a (..., H, W) stack down to height × width"""
+    rows = np.linspace(0, pixels.shape[-2], height + 1).astype(int)
+    columns = np.linspace(0, pixels.shape[-1], width + 1).astype(int)
+    summed = np.add.reduceat(np.add.reduceat(pixels, rows[:-1], axis=-2), columns[:-1], axis=-1)
+    counts = np.outer(np.diff(rows), np.diff(columns))
+    return summed / counts
+
+
+def pack_bits(bits):
+    """Pack (..., 64) booleans into uint64 values, first bit most significant"""
+    packed = np.ascontiguousarray(np.packbits(bits, axis=-1))
+    return packed.view('>u8')[..., 0].astype(np.uint64)
+
+
+def dhash(pixels):
+    """Difference hashes of a (..., H, W) grayscale stack"""
+    small = resize_stack(pixels, HASH_SIZE + 1, HASH_SIZE)
+    bits = small[..., 1:] > small[..., :-1]
+    return pack_bits(bits.reshape(bits.shape[:-2] + (HASH_SIZE * HASH_SIZE,)))
+
+
+def dct_matrix(size):
+    """Orthonormal DCT-II matrix"""
+    k = np.arange(size)[:, None]
+    n = np.arange(size)[None, :]
+    matrix = np.cos(np.pi * (2 * n + 1) * k / (2 * size)) * math.sqrt(2 / size)
+    matrix[0] /= math.sqrt(2)
+    return matrix
+
+
+DCT = dct_matrix(PHASH_INPUT_SIZE)
+
+
+def phash(pixels):
+    """DCT hashes of a (..., 32, 32) grayscale stack"""
+    coefficients = DCT @ pixels @ DCT.T
+    low = coefficients[..., :HASH_SIZE, :HASH_SIZE].reshape(pixels.shape[:-2] + (HASH_SIZE * HASH_SIZE,))
+    # The DC term only carries the mean brightness
+    median = np.median(low[..., 1:], axis=-1, keepdims=True)
+    return pack_bits(low > median)
+
+
+def file_hashes(file_path):
+    """Content hash plus dHash and pHash of one file
+
+    The perceptual hashes are None when the file can't be decoded.
+    """
+    result = {'content_hash': content_hash(file_path), 'dhash': None, 'phash': None}
+    try:
+        pixels = load_gray(file_path)
+    except Exception:
+        return result
+    result['dhash'] = int(dhash(pixels))
+    result['phash'] = int(phash(pixels))
+    return result
+
+
+def hash_chunk(file_paths):
+    """Worker entry point: (path, key, hashes) for a chunk of files
+
+    The key is taken before reading so a file changing meanwhile is hashed
+    again next time. Decoded files are stacked so both perceptual hashes
+    take one NumPy call per chunk. Unreadable files are left out.
+    """
+    results = []
+    stack = []
+    for file_path in file_paths:
+        try:
+            key = file_key(file_path)
+            result = {'content_hash': content_hash(file_path), 'dhash': None, 'phash': None}
+        except OSError:
+            continue
+        try:
+            stack.append((len(results), load_gray(file_path)))
+        except Exception:
+            pass
+        results.append((file_path, key, result))
+
+    if stack:
+        pixels = np.stack([gray for _, gray in stack])
+        for (position, _), d, p in zip(stack, dhash(pixels), phash(pixels)):
+            results[position][2]['dhash'] = int(d)
+            results[position][2]['phash'] = int(p)
+    return results
+
+
+def format_hash(value):
+    return f"{value:016x}" if value is not None else None
+
+
+def popcount(values):
+    """Number of set bits in each uint64"""
+    values = np.ascontiguousarray(values, dtype=np.uint64)
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(values)
+    return POPCOUNT_TABLE[values.view(np.uint8)].reshape(values.shape + (8,)).sum(axis=-1)
+
+
+def hamming_distance(a, b):
+    return popcount(np.bitwise_xor(np.asarray(a, dtype=np.uint64), np.asarray(b, dtype=np.uint64)))
+
+
+def chunk_widths(chunks):
+    return [64 // chunks + (1 if k < 64 % chunks else 0) for k in range(chunks)]
+
+
+def flip_masks(width, radius):
+    """All masks of at most radius set bits within width bits"""
+    masks = [0]
+    for bits in range(1, radius + 1):
+        for positions in itertools.combinations(range(width), bits):
+            masks.append(sum(1 << position for position in positions))
+    return np.array(masks, dtype=np.uint64)
+
+
+def default_chunks(count, radius):
+    """Chunk count with the fewest expected lookups plus random candidates"""
+    best, best_cost = 1, None
+    for chunks in range(1, 9):
+        cost = 0
+        for width in chunk_widths(chunks):
+            variants = sum(math.comb(width, bits) for bits in range(radius // chunks + 1))
+            cost += variants * (1 + count / 2 ** width)
+        if best_cost is None or cost < best_cost:
+            best, best_cost = chunks, cost
+    return best
+
+
+class HashIndex:
+    """Multi-index hashing over 64-bit perceptual hashes"""
+
+    def __init__(self, hashes, radius=DEFAULT_RADIUS, chunks=None):
+        self.hashes = np.ascontiguousarray(hashes, dtype=np.uint64)
+        self.radius = radius
+        self.chunks = chunks or default_chunks(len(self.hashes), radius)
+        self.tables = []
+        shift = 0
+        for width in chunk_widths(self.chunks):
+            values = (self.hashes >> np.uint64(shift)) & np.uint64((1 << width) - 1)
+            order = np.argsort(values, kind='stable')
+            sorted_values = values[order]
+            if width <= MAX_TABLE_BITS:
+                # buckets[v]:buckets[v + 1] is the slice of order holding chunk value v
+                bucket_sizes = np.bincount(values.astype(np.int64), minlength=1 << width)
+                buckets = np.concatenate(([0], np.cumsum(bucket_sizes)))
+            else:
+                # Too wide for a bucket table, binary search sorted_values instead
+                buckets = None
+            masks = flip_masks(width, radius // self.chunks)
+            self.tables.append((shift, width, values, sorted_values, buckets, order, masks))
+            shift += width
+
+    def lookup(self, sorted_values, buckets, order, keys):
+        """For each key, the indices whose chunk equals it, as (query row, index) arrays"""
+        if buckets is None:
+            start = np.searchsorted(sorted_values, keys, side='left')
+            counts = np.searchsorted(sorted_values, keys, side='right') - start
+        else:
+            keys = keys.astype(np.int64)
+            start = buckets[keys]
+            counts = buckets[keys + 1] - start
+        rows = np.repeat(np.arange(len(keys)), counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        return rows, order[np.repeat(start, counts) + offsets]
+
+    def query(self, value):
+        """Indices and distances of hashes within the radius of value"""
+        value = np.uint64(value)
+        found = []
+        for shift, width, _, sorted_values, buckets, order, masks in self.tables:
+            chunk = (value >> np.uint64(shift)) & np.uint64((1 << width) - 1)
+            found.append(self.lookup(sorted_values, buckets, order, chunk ^ masks)[1])
+        candidates = np.unique(np.concatenate(found))
+        distances = popcount(self.hashes[candidates] ^ value)
+        keep = distances <= self.radius
+        return candidates[keep], distances[keep]
+
+    def pairs(self, block_size=BLOCK_SIZE):
+        """Yield (i, j, distance) arrays of all pairs i < j within the radius"""
+        count = len(self.hashes)
+        for start in range(0, count, block_size):
+            queries = np.arange(start, min(count, start + block_size))
+            found_i, found_j = [], []
+            for _, _, values, sorted_values, buckets, order, masks in self.tables:
+                block_values = values[queries]
+                for mask in masks:
+                    rows, j = self.lookup(sorted_values, buckets, order, block_values ^ mask)
+                    i = queries[rows]
+                    keep = i < j
+                    found_i.append(i[keep])
+                    found_j.append(j[keep])
+
+            i = np.concatenate(found_i)
+            j = np.concatenate(found_j)
+            distances = popcount(self.hashes[i] ^ self.hashes[j])
+            keep = distances <= self.radius
+            i, j, distances = i[keep], j[keep], distances[keep]
+            # The same pair can turn up through several chunks
+            _, first = np.unique(i.astype(np.uint64) * np.uint64(count) + j.astype(np.uint64), return_index=True)
+            yield i[first], j[first], distances[first]
+
+
+def connected_components(count, i, j):
+    """Component label (smallest member index) for every node of an edge list"""
+    labels = np.arange(count)
+    while True:
+        low = np.minimum(labels[i], labels[j])
+        updated = labels.copy()
+        np.minimum.at(updated, i, low)
+        np.minimum.at(updated, j, low)
+        # Pointer jumping so long chains collapse in a few rounds
+        while True:
+            jumped = updated[updated]
+            if np.array_equal(jumped, updated):
+                break
+            updated = jumped
+        if np.array_equal(updated, labels):
+            return labels
+        labels = updated
+
+
+def groups_from_labels(labels):
+    """Index arrays of every label shared by two or more nodes"""
+    order = np.argsort(labels, kind='stable')
+    sorted_labels = labels[order]
+    boundaries = np.flatnonzero(np.diff(sorted_labels)) + 1
+    return [group for group in np.split(order, boundaries) if len(group) > 1]
+
+
+def near_duplicate_groups(hashes, radius=DEFAULT_RADIUS, chunks=None):
+    """Group indices of hashes connected by pairs within radius bits"""
+    hashes = np.ascontiguousarray(hashes, dtype=np.uint64)
+    if len(hashes) < 2:
+        return []
+    index = HashIndex(hashes, radius, chunks)
+    found = list(index.pairs())
+    i = np.concatenate([pair[0] for pair in found])
+    j = np.concatenate([pair[1] for pair in found])
+    if not len(i):
+        return []
+    return groups_from_labels(connected_components(len(hashes), i, j))
@@ -0,0 +1,232 @@
+"""Incremental re-scan of directory trees against the metadata cache
+
+The records table already holds the (size, mtime_ns, inode) snapshot of
+every file seen so far. A tree is walked in the same order as the table's
+primary key, so it can be merged against a single range scan without
+loading the snapshot into memory. Only new and changed files are
+extracted again, records of deleted files are dropped. Every file still
+gets one stat() call, the decoding cost follows the churn.
+
+watch() keeps following the trees with QFileSystemWatcher (inotify on
+Linux) after the initial pass.
+"""
+import os
+import signal
+import metadata
+import parallel
+from cache import file_key
+
+ADDED = 'added'
+MODIFIED = 'modified'
+DELETED = 'deleted'
+UNCHANGED = 'unchanged'
+
+# Directory events are gathered for this long before a re-scan
+WATCH_DELAY_MS = 200
+
+
+def walk_sorted(root, recursive=True, directories=None):
+    """Yield (path, key) for image files in primary key order of the cache
+
+    SQLite compares paths as UTF-8 bytes, which matches code point order.
+    Sorting a directory's subdirectories as "name/" puts their files where
+    the full paths sort. Visited directories are appended to directories
+    when a list is given.
+    """
+    try:
+        with os.scandir(root) as it:
+            entries = []
+            for entry in it:
+                try:
+                    is_dir = entry.is_dir(follow_symlinks=False)
+                except OSError:
+                    continue
+                if is_dir or metadata.is_image_file(entry.name):
+                    entries.append((entry.name + '/' if is_dir else entry.name, is_dir, entry))
+    except OSError:
+        return
+    if directories is not None:
+        directories.append(root)
+
+    entries.sort(key=lambda item: item[0])
+    for _, is_dir, entry in entries:
+        if is_dir:
+            if recursive:
+                yield from walk_sorted(os.path.join(root, entry.name), recursive, directories)
+            continue
+        try:
+            if not entry.is_file():
+                continue
+            stat = entry.stat()
+        except OSError:
+            continue
+        yield entry.path, (stat.st_size, stat.st_mtime_ns, stat.st_ino)
+
+
+def cached_keys(cache, root, recursive=True):
+    """Yield (path, key) for cached records under root in path order"""
+    prefix = root.rstrip(os.sep) + os.sep
+    # Everything starting with prefix sorts below prefix with its last character bumped
+    upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+    rows = cache.conn.execute(
+        "SELECT path, size, mtime_ns, inode FROM records WHERE path >= ? AND path < ? ORDER BY path",
+        (prefix, upper)
+    )
+    for path, size, mtime_ns, inode in rows:
+        if recursive or os.sep not in path[len(prefix):]:
+            yield path, (size, mtime_ns, inode)
+
+
+def diff_tree(cache, root, recursive=True, directories=None):
+    """Compare a directory with the cached records under it
+
+    Returns (changes, unchanged) where changes is a list of (status, path)
+    for added, modified and deleted files and unchanged is a count.
+    """
+    # scan() stores absolute paths in the cache, whatever spelling the user typed
+    root = os.path.abspath(root)
+    changes = []
+    unchanged = 0
+    disk = walk_sorted(root, recursive, directories)
+    cached = cached_keys(cache, root, recursive)
+    disk_item = next(disk, None)
+    cached_item = next(cached, None)
+
+    while disk_item is not None or cached_item is not None:
+        if cached_item is None or (disk_item is not None and disk_item[0] < cached_item[0]):
+            changes.append((ADDED, disk_item[0]))
+            disk_item = next(disk, None)
+        elif disk_item is None or cached_item[0] < disk_item[0]:
+            changes.append((DELETED, cached_item[0]))
+            cached_item = next(cached, None)
+        else:
+            if disk_item[1] != cached_item[1]:
+                changes.append((MODIFIED, disk_item[0]))
+            else:
+                unchanged += 1
+            disk_item = next(disk, None)
+            cached_item = next(cached, None)
+    return changes, unchanged
+
+
+def diff_file(cache, file_path):
+    """Status of a single file given explicitly"""
+    file_path = os.path.abspath(file_path)
+    row = cache.conn.execute(
+        "SELECT size, mtime_ns, inode FROM records WHERE path = ?", (file_path,)
+    ).fetchone()
+    try:
+        key = file_key(file_path)
+    except OSError:
+        return DELETED if row is not None else None
+    if row is None:
+        return ADDED
+    return UNCHANGED if tuple(row) == key else MODIFIED
+
+
+def collect_changes(cache, paths, recursive=True, directories=None, stats=None):
+    """Diff every path, returning the changes and counting them in stats"""
+    stats = stats if stats is not None else {}
+    changes = []
+    for path in map(os.path.abspath, paths):
+        # Directories, including ones removed since the last run
+        if os.path.isdir(path) or not os.path.exists(path) and not metadata.is_image_file(path):
+            path_changes, unchanged = diff_tree(cache, path, recursive, directories)
+        else:
+            status = diff_file(cache, path)
+            path_changes = [(status, path)] if status not in (None, UNCHANGED) else []
+            unchanged = int(status == UNCHANGED)
+        changes.extend(path_changes)
+        stats[UNCHANGED] = stats.get(UNCHANGED, 0) + unchanged
+    for status, _ in changes:
+        stats[status] = stats.get(status, 0) + 1
+    return changes
+
+
+def apply_changes(cache, changes, jobs=1, ordered=True):
+    """Drop deleted files and yield fresh records for added and changed ones"""
+    to_extract = []
+    for status, path in changes:
+        if status == DELETED:
+            cache.invalidate(path)
+        else:
+            to_extract.append(path)
+
+    if jobs > 1 and len(to_extract) > 1:
+        records = parallel.extract_parallel(to_extract, workers=jobs, ordered=ordered)
+    else:
+        records = map(metadata.extract, to_extract)
+    for record in records:
+        yield cache.put(record)
+    cache.commit()
+
+
+def rescan(cache, paths, jobs=1, ordered=True, stats=None, directories=None):
+    """Bring the cache up to date with the given trees
+
+    Yields records of new and changed files; stats, if given, receives
+    the number of added, modified, deleted and unchanged files.
+    """
+    changes = collect_changes(cache, paths, directories=directories, stats=stats)
+    yield from apply_changes(cache, changes, jobs, ordered)
+
+
+def watch(cache, directories, on_record, jobs=1, on_changes=None):
+    """Re-scan directories as they change until interrupted
+
+    directories are the ones collected by rescan(), so the trees are not
+    walked a second time to set up the watches.
+    A directory event only says something changed in that directory, so
+    it is diffed non-recursively; new subdirectories are scanned in full
+    and watched, removed ones drop their records. Files rewritten in place
+    without a rename are not reported by directory watches.
+    """
+    from PyQt6.QtCore import QCoreApplication, QFileSystemWatcher, QTimer
+
+    app = QCoreApplication.instance() or QCoreApplication([])
+    watcher = QFileSystemWatcher()
+    if directories:
+        watcher.addPaths(directories)
+
+    dirty = set()
+    timer = QTimer()
+    timer.setSingleShot(True)
+    timer.setInterval(WATCH_DELAY_MS)
+
+    def on_directory_changed(directory):
+        dirty.add(directory)
+        timer.start()
+
+    def process():
+        changes = []
+        for directory in sorted(dirty):
+            if not os.path.isdir(directory):
+                watcher.removePath(directory)
+                changes.extend(diff_tree(cache, directory)[0])
+                continue
+
+            changes.extend(diff_tree(cache, directory, recursive=False)[0])
+            watched = set(watcher.directories())
+            for name in os.listdir(directory):
+                subdirectory = os.path.join(directory, name)
+                if os.path.isdir(subdirectory) and not os.path.islink(subdirectory) and subdirectory not in watched:
+                    new_directories = []
+                    changes.extend(diff_tree(cache, subdirectory, directories=new_directories)[0])
+                    watcher.addPaths(new_directories)
+        dirty.clear()
+
+        for record in apply_changes(cache, changes, jobs):
+            on_record(record)
+        if on_changes and changes:
+            on_changes(changes)
+
+    watcher.directoryChanged.connect(on_directory_changed)
+    timer.timeout.connect(process)
+
+    # Let Python see Ctrl+C while the Qt event loop runs
+    signal.signal(signal.SIGINT, lambda *args: app.quit())
+    heartbeat = QTimer()
+    heartbeat.timeout.connect(lambda: None)
+    heartbeat.start(250)
+
+    app.exec()
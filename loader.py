@@ -0,0 +1,292 @@
+"""Background image loading for the viewer
+
+Everything here runs on QThreadPool workers and only touches thread-safe
+Qt classes (QImageReader, QImage). Results are handed back to the GUI
+thread through LoaderSignals. The NumPy-backed modules (tiled, hashes,
+analysis) are imported by the loads that need them.
+"""
+import threading
+from PyQt6.QtGui import QImage, QImageReader, QColorSpace, QPixelFormat
+from PyQt6.QtCore import Qt, QByteArray, QObject, QRunnable, pyqtSignal
+from PIL import Image
+import animation
+import metadata
+import preview
+import tracing
+
+# TIFF and BigTIFF; only these can need the tiled reader
+TIFF_SIGNATURES = (b'II*\x00', b'MM\x00*', b'II+\x00', b'MM\x00+')
+
+
+def probe_image(file_path):
+    """Read image properties from file headers without decoding pixels"""
+    reader = QImageReader(file_path)
+    if not reader.canRead():
+        return None
+
+    size = reader.size()
+    image_format = reader.imageFormat()
+    properties = {
+        'width': size.width(),
+        'height': size.height(),
+        'format': image_format,
+        'depth': None,
+        'color_space': None,
+        'alpha': False,
+        'dpi': None,
+    }
+
+    if image_format != QImage.Format.Format_Invalid:
+        pixel_format = QImage.toPixelFormat(image_format)
+        properties['depth'] = pixel_format.bitsPerPixel()
+        properties['alpha'] = pixel_format.alphaUsage() == QPixelFormat.AlphaUsage.UsesAlpha
+
+    # PIL only parses the header on open, pixel data stays on disk
+    try:
+        with Image.open(file_path) as img:
+            if not size.isValid():
+                properties['width'], properties['height'] = img.size
+            if image_format == QImage.Format.Format_Invalid:
+                properties['alpha'] = img.mode in ('RGBA', 'LA', 'PA', 'RGBa', 'La')
+
+            dpi = img.info.get('dpi')
+            if dpi and dpi[0] > 0:
+                properties['dpi'] = (float(dpi[0]), float(dpi[1]))
+
+            icc_profile = img.info.get('icc_profile')
+            if icc_profile:
+                color_space = QColorSpace.fromIccProfile(QByteArray(icc_profile))
+                if color_space.isValid():
+                    properties['color_space'] = color_space.description()
+            elif 'srgb' in img.info:
+                properties['color_space'] = QColorSpace(QColorSpace.NamedColorSpace.SRgb).description()
+    except Exception:
+        pass
+
+    return properties
+
+
+def tiled_properties(tiff):
+    """Image properties from a TiledTiff, for files Qt can't read the header of"""
+    return {
+        'width': tiff.width,
+        'height': tiff.height,
+        'format': f"TIFF ({tiff.mode}, tiled reader)",
+        'depth': 8 * len(tiff.mode),
+        'color_space': None,
+        'alpha': 'A' in tiff.mode,
+        'dpi': None,
+    }
+
+
+def pil_to_qimage(pil_image):
+    """Copy a PIL image into a QImage"""
+    if pil_image.mode not in ('RGB', 'RGBA'):
+        pil_image = pil_image.convert('RGBA' if 'A' in pil_image.getbands() else 'RGB')
+    if pil_image.mode == 'RGBA':
+        image_format, bytes_per_pixel = QImage.Format.Format_RGBA8888, 4
+    else:
+        image_format, bytes_per_pixel = QImage.Format.Format_RGB888, 3
+    data = pil_image.tobytes()
+    image = QImage(data, pil_image.width, pil_image.height, pil_image.width * bytes_per_pixel, image_format)
+    # QImage does not own the buffer, detach before it goes away
+    return image.copy()
+
+
+def read_preview(file_path, width, height, thumbnail_cache=None):
+    """Decode an image at a size that fits width × height
+
+    A persistent thumbnail cache is tried first. Then the embedded EXIF
+    thumbnail is used when it is large enough, and after that the Qt decoder
+    is asked for the scaled size directly (JPEG decodes at a reduced DCT
+    scale). PIL's reduced decoding covers formats Qt can't read.
+    """
+    if thumbnail_cache is not None:
+        try:
+            with tracing.span('thumbnail_cache'):
+                image = QImage.fromData(thumbnail_cache.get_or_create(file_path, width, height))
+            if not image.isNull():
+                return image
+        except Exception:
+            pass
+
+    try:
+        with tracing.span('exif_thumbnail'), Image.open(file_path) as img:
+            if not preview.fits_within(img.size, width, height):
+                thumbnail = preview.open_exif_thumbnail(img, width, height)
+                if thumbnail is not None:
+                    thumbnail.thumbnail((width, height), Image.Resampling.LANCZOS)
+                    return pil_to_qimage(thumbnail)
+    except Exception:
+        pass
+
+    with tracing.span('qt_decode'):
+        reader = QImageReader(file_path)
+        size = reader.size()
+        if size.isValid() and (size.width() > width or size.height() > height):
+            reader.setScaledSize(size.scaled(width, height, Qt.AspectRatioMode.KeepAspectRatio))
+        image = reader.read()
+    if not image.isNull():
+        return image
+
+    try:
+        with tracing.span('pil_preview'):
+            return pil_to_qimage(preview.load_preview(file_path, width, height, use_exif_thumbnail=False))
+    except Exception:
+        return QImage()
+
+
+def read_advanced_metadata(file_path):
+    """Collect PIL format details and EXIF data"""
+    try:
+        with tracing.span('pil_open'), Image.open(file_path) as img:
+            with tracing.span('exif'):
+                exif_entries = metadata.read_exif_entries(img)
+            advanced = {
+                'format': img.format,
+                'mode': img.mode,
+                'raw_exif': metadata.raw_exif_from_entries(exif_entries),
+                'exif': metadata.exif_from_entries(exif_entries),
+                'png_info': None,
+                'error': None,
+            }
+            if img.format == 'PNG' and hasattr(img, 'info'):
+                advanced['png_info'] = {k: v for k, v in img.info.items() if isinstance(k, str)}
+            return advanced
+    except Exception as e:
+        return {'error': str(e)}
+
+
+def is_tiff(file_path):
+    try:
+        with open(file_path, 'rb') as f:
+            return f.read(4) in TIFF_SIGNATURES
+    except OSError:
+        return False
+
+
+def open_tiled(file_path, properties):
+    """tiled.open_tiled, without importing it for files that aren't TIFFs"""
+    if not is_tiff(file_path):
+        return None
+    import tiled
+    return tiled.open_tiled(file_path, properties)
+
+
+def read_hashes(file_path):
+    """Content and perceptual hashes for the duplicate finder"""
+    import hashes
+    try:
+        result = hashes.file_hashes(file_path)
+    except Exception as e:
+        return {'error': str(e)}
+    result['error'] = None
+    return result
+
+
+def read_content_hash(file_path):
+    """Content hash only, for images too large to decode for perceptual hashes"""
+    import hashes
+    try:
+        return {'content_hash': hashes.content_hash(file_path), 'dhash': None, 'phash': None, 'error': None}
+    except Exception as e:
+        return {'error': str(e)}
+
+
+class LoaderSignals(QObject):
+    # request id, result dict
+    loaded = pyqtSignal(int, object)
+
+
+class ImageLoader(QRunnable):
+    """Probe, preview and metadata work for a single file"""
+
+    def __init__(self, request_id, file_path, preview_width, preview_height, thumbnail_cache=None,
+                 pixel_stats=False, hashes=False):
+        super().__init__()
+        self.request_id = request_id
+        self.file_path = file_path
+        self.preview_width = preview_width
+        self.preview_height = preview_height
+        self.thumbnail_cache = thumbnail_cache
+        # Full decode of the image, only when asked for
+        self.pixel_stats = pixel_stats
+        # Hashing reads the whole file and decodes it, also opt-in
+        self.hashes = hashes
+        self.signals = LoaderSignals()
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def is_cancelled(self):
+        return self._cancelled.is_set()
+
+    def run(self):
+        # The GUI thread keeps adding its own spans to the same tracer
+        tracer = tracing.Tracer()
+        result = {'file_path': self.file_path, 'properties': None, 'preview': None, 'advanced': None,
+                  'hashes': None, 'animation': None, 'pixel_stats': None, 'tiled': None,
+                  'trace': tracer}
+        with tracer.activate():
+            self.load(result)
+
+    def load(self, result):
+        with tracing.span('probe'):
+            result['properties'] = probe_image(self.file_path)
+        # Frame control blocks only, cheap even for thousands of frames
+        with tracing.span('animation'):
+            result['animation'] = animation.read_animation(self.file_path)
+        # Gigapixel TIFFs are shown tile by tile instead of decoding a preview
+        with tracing.span('tiled_probe'):
+            tiff = open_tiled(self.file_path, result['properties'])
+        if tiff is not None:
+            result['tiled'] = tiff
+            if result['properties'] is None or result['properties']['width'] <= 0:
+                result['properties'] = tiled_properties(tiff)
+        # Whoever gets the result closes the TIFF, close it here when nobody does
+        emitted = False
+        try:
+            if self.is_cancelled():
+                return
+            if result['properties'] is None:
+                emitted = True
+                self.signals.loaded.emit(self.request_id, result)
+                return
+
+            if tiff is None:
+                with tracing.span('preview'):
+                    result['preview'] = read_preview(self.file_path, self.preview_width, self.preview_height,
+                                                     self.thumbnail_cache)
+                if self.is_cancelled():
+                    return
+
+            with tracing.span('advanced'):
+                result['advanced'] = read_advanced_metadata(self.file_path)
+            if self.is_cancelled():
+                return
+
+            if self.hashes:
+                with tracing.span('hashes'):
+                    if tiff is None:
+                        result['hashes'] = read_hashes(self.file_path)
+                    else:
+                        result['hashes'] = read_content_hash(self.file_path)
+                if self.is_cancelled():
+                    return
+
+            if self.pixel_stats:
+                import analysis
+                with tracing.span('pixel_stats'):
+                    if tiff is None:
+                        result['pixel_stats'] = analysis.analyze_file(self.file_path)
+                    else:
+                        result['pixel_stats'] = analysis.analyze_tiff(tiff)
+                if self.is_cancelled():
+                    return
+
+            emitted = True
+            self.signals.loaded.emit(self.request_id, result)
+        finally:
+            if tiff is not None and not emitted:
+                tiff.close()
@@ -0,0 +1,509 @@
+"""GUI-free image metadata extraction shared by the viewer and batch tools"""
+import functools
+import os
+import time
+from collections import namedtuple
+import fast_reader
+import tracing
+
+# Same set of formats as the viewer's open dialog
+IMAGE_EXTENSIONS = ('.bmp', '.png', '.jpg', '.jpeg', '.gif', '.webp', '.tiff', '.heic')
+
+# Bits per pixel for PIL image modes
+MODE_DEPTHS = {
+    '1': 1, 'L': 8, 'P': 8, 'LA': 16, 'La': 16, 'PA': 16,
+    'RGB': 24, 'YCbCr': 24, 'LAB': 24, 'HSV': 24,
+    'RGBA': 32, 'RGBa': 32, 'RGBX': 32, 'CMYK': 32,
+    'I': 32, 'F': 32, 'I;16': 16, 'I;16L': 16, 'I;16B': 16, 'I;16N': 16,
+}
+
+# One EXIF tag as read from the file: raw value plus its decoded form
+ExifEntry = namedtuple('ExifEntry', ['ifd', 'tag_id', 'name', 'type', 'raw', 'decoded'])
+
+# IFD0 pointer tags to the Exif and GPS sub-IFDs, and the Exif IFD's pointer
+# to the Interoperability IFD
+EXIF_IFD = 0x8769
+GPS_IFD = 0x8825
+INTEROP_IFD = 0xA005
+
+# EXIF tags holding the capture time, best first
+TIME_TAGS = ('DateTimeOriginal', 'DateTimeDigitized', 'DateTime')
+EXIF_TIME_FORMAT = '%Y:%m:%d %H:%M:%S'
+
+# EXIF tags with their own catalog columns, the rest goes to its full-text index
+CATALOG_TAGS = ('Make', 'Model') + TIME_TAGS
+# Longer values (maker notes, embedded blobs) aren't worth indexing
+CATALOG_TEXT_MAX = 256
+
+
+def is_image_file(path):
+    """Check file extension against supported image formats"""
+    return path.lower().endswith(IMAGE_EXTENSIONS)
+
+
+def get_file_metadata(file_path):
+    """Collect filesystem metadata for a file"""
+    stat = os.stat(file_path)
+    return {
+        'path': file_path,
+        'name': os.path.basename(file_path),
+        'size': stat.st_size,
+        'created': getattr(stat, 'st_birthtime', None),
+        'modified': stat.st_mtime,
+        'accessed': stat.st_atime,
+        'mtime_ns': stat.st_mtime_ns,
+        'inode': stat.st_ino,
+    }
+
+
+def normalize_dpi(dpi):
+    """DPI pair as floats, None when missing or zero"""
+    return (float(dpi[0]), float(dpi[1])) if dpi and dpi[0] > 0 else None
+
+
+def get_image_metadata(pil_image):
+    """Collect image properties from PIL header fields"""
+    width, height = pil_image.size
+    return {
+        'width': width,
+        'height': height,
+        'depth': MODE_DEPTHS.get(pil_image.mode),
+        'format': pil_image.format,
+        'mode': pil_image.mode,
+        'alpha': pil_image.mode in ('RGBA', 'RGBa', 'LA', 'La', 'PA') or 'transparency' in pil_image.info,
+        'dpi': normalize_dpi(pil_image.info.get('dpi')),
+        'icc_profile': bool(pil_image.info.get('icc_profile')),
+    }
+
+
+def get_header_metadata(header):
+    """Collect image properties from a fast_reader header"""
+    return {
+        'width': header['width'],
+        'height': header['height'],
+        'depth': MODE_DEPTHS.get(header['mode']),
+        'format': header['format'],
+        'mode': header['mode'],
+        'alpha': header['alpha'],
+        'dpi': normalize_dpi(header['dpi']),
+        'icc_profile': header['icc_profile'],
+    }
+
+
+def extract(file_path, fast=True):
+    """Extract file, image and EXIF metadata into a single record
+
+    JPEG, PNG, WebP and TIFF go through the minimal-read parser in
+    fast_reader unless fast is False; everything else is opened with PIL.
+    """
+    return extract_record(file_path, fast)[0]
+
+
+def extract_many(file_paths, fast=True):
+    """extract() for a list of files, with one NumPy call for all GPS coordinates"""
+    records, gps_ifds = [], []
+    for file_path in file_paths:
+        record, gps = extract_record(file_path, fast, coordinates=False)
+        records.append(record)
+        gps_ifds.append(gps)
+    if not any(gps_ifds):
+        return records
+
+    import geo
+    with tracing.span('gps'):
+        latitudes, longitudes = geo.gps_coordinates(gps_ifds)
+    for record, lat, lon in zip(records, latitudes.tolist(), longitudes.tolist()):
+        gps_data = (record.get('exif') or {}).get('GPSInfo')
+        # NaN for files without (valid) coordinates
+        if isinstance(gps_data, dict) and 'Error' not in gps_data and lat == lat and lon == lon:
+            set_coordinates(gps_data, lat, lon)
+    return records
+
+
+def extract_record(file_path, fast=True, coordinates=True):
+    """extract() returning (record, GPS IFD or None)
+
+    With coordinates False, GPSInfo is left without the decimal
+    Latitude/Longitude so the caller can convert many files at once.
+    """
+    try:
+        with tracing.span('stat'):
+            record = get_file_metadata(file_path)
+    except OSError as e:
+        # Missing, deleted mid-scan or unreadable
+        return {'path': file_path, 'error': str(e)}, None
+    record['error'] = None
+
+    with tracing.span('header'):
+        header = fast_reader.read_header(file_path) if fast else None
+    if header is not None:
+        record.update(get_header_metadata(header))
+        with tracing.span('exif'):
+            entries = exif_entries(header['exif'], coordinates)
+            record['exif'] = exif_from_entries(entries)
+        return record, gps_ifd(entries)
+
+    # Pillow itself is only imported for files fast_reader doesn't handle
+    from PIL import Image
+    entries = None
+    try:
+        with tracing.span('pil_open'), Image.open(file_path) as img:
+            record.update(get_image_metadata(img))
+            with tracing.span('exif'):
+                entries = read_exif_entries(img, coordinates)
+                record['exif'] = exif_from_entries(entries)
+    except Exception as e:
+        record['error'] = str(e)
+    return record, gps_ifd(entries)
+
+
+def gps_ifd(entries):
+    """The raw GPS IFD among EXIF entries, or None"""
+    for entry in entries or ():
+        if entry.name == 'GPSInfo':
+            return entry.raw
+    return None
+
+
+def record_location(record):
+    """Return (latitude, longitude) from a record's GPS data, or None"""
+    gps = (record.get('exif') or {}).get('GPSInfo')
+    if not isinstance(gps, dict):
+        return None
+    latitude, longitude = gps.get('Latitude'), gps.get('Longitude')
+    if not isinstance(latitude, (int, float)) or not isinstance(longitude, (int, float)):
+        return None
+    # Also rejects NaN
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        return None
+    return (latitude, longitude)
+
+
+def catalog_entry(record):
+    """Column values of a record for the query catalog (see catalog.py)"""
+    exif = record.get('exif') if isinstance(record.get('exif'), dict) else {}
+    taken = exif_datetime(exif)
+    width, height = record.get('width'), record.get('height')
+    return {
+        'make': clean_text(exif.get('Make')),
+        'model': clean_text(exif.get('Model')),
+        'taken': time.strftime('%Y-%m-%d %H:%M:%S', taken) if taken is not None else None,
+        'width': width,
+        'height': height,
+        'pixels': width * height if isinstance(width, int) and isinstance(height, int) else None,
+        'format': record.get('format'),
+        'size': record.get('size'),
+        'gps': record_location(record) is not None,
+        'tags': catalog_text(exif),
+    }
+
+
+def clean_text(value):
+    """EXIF string without the NUL and space padding, None when empty"""
+    if not isinstance(value, str):
+        return None
+    return value.strip('\0 ') or None
+
+
+def catalog_text(exif, skip=CATALOG_TAGS):
+    """"Tag value" lines for the full-text index; nested IFDs (GPSInfo) are listed inline"""
+    lines = []
+    for tag, value in exif.items():
+        if tag in skip:
+            continue
+        if isinstance(value, dict):
+            lines.append(catalog_text(value, skip=()))
+            continue
+        if isinstance(value, (list, tuple)):
+            value = " ".join(str(item) for item in value)
+        elif not isinstance(value, (str, int, float)):
+            continue
+        value = str(value).strip('\0 ')
+        if value and len(value) <= CATALOG_TEXT_MAX:
+            lines.append(f"{tag} {value}")
+    return "\n".join(line for line in lines if line)
+
+
+def exif_datetime(exif):
+    """Capture time from a decoded EXIF dict as a time.struct_time, or None
+
+    Camera clocks have no time zone, the wall time is returned as is.
+    """
+    if not isinstance(exif, dict):
+        return None
+    for tag in TIME_TAGS:
+        value = exif.get(tag)
+        if isinstance(value, str):
+            try:
+                return time.strptime(value.strip('\0 ')[:19], EXIF_TIME_FORMAT)
+            except ValueError:
+                continue
+    return None
+
+
+def to_jsonable(value):
+    """Convert EXIF values (rationals, tuples, bytes) to JSON types"""
+    if value is None or isinstance(value, (str, int, float)):
+        return value
+    if isinstance(value, dict):
+        return {str(k): to_jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_jsonable(v) for v in value]
+    if isinstance(value, bytes):
+        return value.hex()
+    if hasattr(value, 'numerator') and hasattr(value, 'denominator'):
+        return float(value.numerator / value.denominator) if value.denominator else None
+    return str(value)
+
+
+def read_exif_entries(pil_image, coordinates=True):
+    """Walk the EXIF tags once and return structured entries
+
+    Every EXIF consumer (display, raw export, GPS) renders from these
+    entries instead of calling getexif() again. Returns None when the
+    image has no EXIF data.
+    """
+    try:
+        return exif_entries(pil_image.getexif(), coordinates)
+    except Exception:
+        return None
+
+
+def exif_entries(raw_exif, coordinates=True):
+    """Build entries from a PIL Exif or fast_reader.ExifData mapping
+
+    IFD0 only holds offsets to the Exif, GPS and Interop sub-IFDs. Those are
+    read with get_ifd() and their tags listed in place of the offsets, with
+    the GPS IFD kept as one GPSInfo entry.
+    """
+    try:
+        if not raw_exif:
+            return None
+
+        entries = []
+        # Tag id order, PIL's own iteration order is arbitrary
+        for tag_id, value in sorted(raw_exif.items(), key=lambda item: item[0]):
+            if tag_id == EXIF_IFD:
+                exif_ifd = raw_exif.get_ifd(EXIF_IFD)
+                entries.extend(ifd_entries('Exif', exif_ifd, skip=(INTEROP_IFD,)))
+                if INTEROP_IFD in exif_ifd:
+                    entries.extend(ifd_entries('Interop', raw_exif.get_ifd(INTEROP_IFD)))
+                continue
+            if tag_id == GPS_IFD and not isinstance(value, dict):
+                value = raw_exif.get_ifd(GPS_IFD)
+            entries.append(make_entry('IFD0', tag_id, value, coordinates))
+        return entries
+    except Exception:
+        return None
+
+
+def ifd_entries(ifd_name, ifd, skip=()):
+    """Entries for one sub-IFD in tag id order"""
+    return [make_entry(ifd_name, tag_id, value)
+            for tag_id, value in sorted(ifd.items(), key=lambda item: item[0])
+            if tag_id not in skip]
+
+
+@functools.cache
+def tag_names():
+    """PIL's EXIF and GPS tag name tables, imported on first use"""
+    from PIL.ExifTags import TAGS, GPSTAGS
+    return TAGS, GPSTAGS
+
+
+def make_entry(ifd_name, tag_id, value, coordinates=True):
+    tag_name = tag_names()[0].get(tag_id, tag_id)
+    return ExifEntry(
+        ifd_name,
+        tag_id,
+        tag_name,
+        type(value).__name__,
+        value,
+        decode_exif_value(tag_name, value, coordinates)
+    )
+
+
+def decode_exif_value(tag_name, value, coordinates=True):
+    """Decode a raw EXIF value for display"""
+    if tag_name == "GPSInfo":
+        with tracing.span('gps'):
+            return parse_gps_info(value, coordinates)
+    if isinstance(value, bytes):
+        try:
+            return value.decode('utf-8', errors='replace')
+        except Exception:
+            return str(value)
+    return value
+
+
+def exif_from_entries(entries):
+    """Map tag names to decoded values"""
+    if not entries:
+        return None
+    return {entry.name: entry.decoded for entry in entries}
+
+
+def raw_exif_from_entries(entries):
+    """Map tag names to stringified raw values for export"""
+    if not entries:
+        return None
+    raw = {}
+    gps_tags = tag_names()[1]
+    for entry in entries:
+        if isinstance(entry.raw, dict):
+            raw[entry.name] = {gps_tags.get(tag_id, tag_id): raw_value_string(value)
+                               for tag_id, value in sorted(entry.raw.items())}
+        else:
+            raw[entry.name] = raw_value_string(entry.raw)
+    return raw
+
+
+def raw_value_string(value):
+    return "binary/data" if isinstance(value, bytes) else str(value)
+
+
+def get_raw_exif_data(pil_image):
+    """Get complete raw EXIF data for export"""
+    return raw_exif_from_entries(read_exif_entries(pil_image))
+
+
+def get_exif_data(pil_image):
+    """Safe EXIF data extraction with GPS handling"""
+    return exif_from_entries(read_exif_entries(pil_image))
+
+
+def parse_gps_info(gps_info, coordinates=True):
+    """Robust GPS info parser
+
+    Takes the GPS IFD as a tag id -> value mapping (Exif.get_ifd(0x8825)).
+    Adds the decimal Latitude/Longitude when both coordinates are present,
+    unless coordinates is False (extract_many converts them in bulk).
+    """
+    if not gps_info:
+        return None
+    if not isinstance(gps_info, dict):
+        return {"Error": "GPS IFD was not read", "RawData": str(gps_info)}
+
+    try:
+        gps_data = {}
+        dms = {}
+        gps_tags = tag_names()[1]
+        # Ref tags sort right before their coordinate
+        for tag_id in sorted(gps_info):
+            tag_name = gps_tags.get(tag_id, f"Tag_{tag_id}")
+            value = gps_info[tag_id]
+
+            # Handle coordinate tuples
+            if tag_name in ['GPSLatitude', 'GPSLongitude']:
+                if isinstance(value, tuple) and len(value) == 3:
+                    gps_data[tag_name] = format_dms(value)
+                    dms[tag_name] = value
+                    gps_data.setdefault(tag_name + 'Ref', '?')
+                else:
+                    gps_data[tag_name] = f"Unsupported format: {value}"
+            else:
+                gps_data[tag_name] = value
+
+        # Convert to decimal coordinates if possible
+        if coordinates and 'GPSLatitude' in dms and 'GPSLongitude' in dms:
+            try:
+                # From the rationals, the formatted DMS strings are rounded
+                lat = dms_to_decimal(dms['GPSLatitude'],
+                                     gps_data.get('GPSLatitudeRef', 'N'))
+                lon = dms_to_decimal(dms['GPSLongitude'],
+                                     gps_data.get('GPSLongitudeRef', 'E'))
+
+                if lat is not None and lon is not None:
+                    set_coordinates(gps_data, lat, lon)
+            except Exception as e:
+                gps_data['DecodeError'] = f"Coord conversion failed: {str(e)}"
+
+        return gps_data
+    except Exception as e:
+        return {"Error": f"Full parsing failed: {str(e)}", 
+                "RawData": str(gps_info)}
+
+
+def set_coordinates(gps_data, lat, lon):
+    gps_data['Latitude'] = lat
+    gps_data['Longitude'] = lon
+    gps_data['Decoded'] = f"{lat:.6f}, {lon:.6f}"
+    gps_data['Map'] = f"https://www.google.com/maps?q={lat},{lon}"
+
+
+def format_dms(dms_tuple):
+    """Format degrees/minutes/seconds"""
+    if not isinstance(dms_tuple, tuple) or len(dms_tuple) != 3:
+        return str(dms_tuple)
+
+    # Handle rational numbers (common in EXIF)
+    def to_float(val):
+        return float(val.numerator / val.denominator) if hasattr(val, 'numerator') else float(val)
+
+    degrees = to_float(dms_tuple[0])
+    minutes = to_float(dms_tuple[1])
+    seconds = to_float(dms_tuple[2])
+
+    return f"{degrees:.0f}° {minutes:.0f}' {seconds:.2f}\""
+
+
+def dms_to_decimal(dms, ref):
+    """Convert DMS to decimal degrees"""
+    try:
+        # Handle string format (e.g. "45°30'12.34\"")
+        if isinstance(dms, str):
+            parts = dms.replace('°', ' ').replace('\'', ' ').replace('"', ' ').split()
+            degrees = float(parts[0])
+            minutes = float(parts[1]) if len(parts) > 1 else 0
+            seconds = float(parts[2]) if len(parts) > 2 else 0
+        # Handle tuple format (degrees, minutes, seconds)
+        elif isinstance(dms, tuple) and len(dms) == 3:
+            degrees = dms[0]
+            minutes = dms[1]
+            seconds = dms[2]
+
+            # Convert rational numbers to float if needed
+            if hasattr(degrees, 'numerator'):
+                degrees = float(degrees.numerator / degrees.denominator)
+            if hasattr(minutes, 'numerator'):
+                minutes = float(minutes.numerator / minutes.denominator)
+            if hasattr(seconds, 'numerator'):
+                seconds = float(seconds.numerator / seconds.denominator)
+        else:
+            return None
+
+        decimal = degrees + minutes/60 + seconds/3600
+        if ref in ('S', 'W'):
+            decimal = -decimal
+        return decimal
+    except Exception:
+        return None
+
+
+def format_gps_info(gps_data):
+    """Format GPS info for display"""
+    if not gps_data:
+        return "• GPS Info: No data\n"
+
+    if isinstance(gps_data, str):
+        return f"• GPS Info: {gps_data}\n"
+
+    info = ""
+    if 'Decoded' in gps_data:
+        info += f"• Coordinates: {gps_data['Decoded']}\n"
+        info += f"• Google Maps: {gps_data['Map']}\n"
+
+    for tag, value in gps_data.items():
+        if tag not in ('Decoded', 'Map', 'Latitude', 'Longitude'):
+            info += f"• GPS {tag}: {value}\n"
+
+    return info
+
+
+def format_size(bytes):
+    """Format file size in human-readable format"""
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if bytes < 1024.0:
+            return f"{bytes:.2f} {unit}"
+        bytes /= 1024.0
+    return f"{bytes:.2f} TB"
@@ -0,0 +1,57 @@
+"""Process-pool metadata extraction with bounded in-flight work"""
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from itertools import islice
+import metadata
+
+DEFAULT_CHUNK_SIZE = 32
+
+
+def extract_chunk(file_paths):
+    """Worker entry point: extract a chunk of files in one task"""
+    return metadata.extract_many(file_paths)
+
+
+def iter_chunks(iterable, size):
+    """Split an iterable into lists of at most size items"""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def extract_parallel(file_paths, workers=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                     max_pending=None, ordered=True, worker=extract_chunk):
+    """Extract records in worker processes and stream them back
+
+    At most max_pending chunks are submitted at once, so the input iterator
+    is consumed only as fast as workers finish. With ordered=False records
+    are yielded as chunks complete instead of in input order.
+    """
+    workers = workers or os.cpu_count() or 1
+    max_pending = max_pending or workers * 2
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        if ordered:
+            pending = deque()
+            for chunk in iter_chunks(file_paths, chunk_size):
+                pending.append(executor.submit(worker, chunk))
+                if len(pending) >= max_pending:
+                    yield from pending.popleft().result()
+            while pending:
+                yield from pending.popleft().result()
+        else:
+            pending = set()
+            for chunk in iter_chunks(file_paths, chunk_size):
+                pending.add(executor.submit(worker, chunk))
+                if len(pending) >= max_pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield from future.result()
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield from future.result()
@@ -0,0 +1,89 @@
+"""Reduced-size decoding for previews and thumbnails
+
+Decoders are asked for a smaller image up front (JPEG DCT scaling via
+draft(), JPEG 2000 resolution levels via reduce) so memory and time follow
+the requested size instead of the source resolution.
+"""
+import io
+from PIL import Image, ExifTags
+
+# Tags in IFD1 pointing at the embedded JPEG thumbnail
+THUMBNAIL_OFFSET = 0x0201
+THUMBNAIL_LENGTH = 0x0202
+
+
+def fits_within(image_size, width, height):
+    """Check whether an image of image_size fits in width × height"""
+    return image_size[0] <= width and image_size[1] <= height
+
+
+def exif_thumbnail_data(pil_image):
+    """Return the JPEG thumbnail bytes embedded in EXIF IFD1, if any"""
+    raw_exif = pil_image.info.get('exif')
+    if not raw_exif:
+        return None
+    try:
+        ifd1 = pil_image.getexif().get_ifd(ExifTags.IFD.IFD1)
+    except Exception:
+        return None
+
+    offset = ifd1.get(THUMBNAIL_OFFSET)
+    length = ifd1.get(THUMBNAIL_LENGTH)
+    if not offset or not length:
+        return None
+
+    # Offsets are relative to the TIFF header that follows the APP1 marker
+    if raw_exif.startswith(b'Exif\x00\x00'):
+        offset += 6
+    data = raw_exif[offset:offset + length]
+    return data if data.startswith(b'\xff\xd8') else None
+
+
+def open_exif_thumbnail(pil_image, width, height):
+    """Open the embedded thumbnail if it covers width × height
+
+    Thumbnails smaller than the target would have to be upscaled, so they
+    are only used when at least as large as the requested box on one side
+    while keeping the aspect ratio.
+    """
+    data = exif_thumbnail_data(pil_image)
+    if data is None:
+        return None
+    try:
+        thumbnail = Image.open(io.BytesIO(data))
+    except Exception:
+        return None
+    if thumbnail.width < width and thumbnail.height < height:
+        return None
+    return thumbnail
+
+
+def reduce_decoding(pil_image, width, height):
+    """Ask the decoder for the smallest image still covering width × height"""
+    if pil_image.format == 'JPEG':
+        pil_image.draft(None, (width, height))
+    elif pil_image.format == 'JPEG2000':
+        factor = 0
+        source_width, source_height = pil_image.size
+        while (source_width >> (factor + 1)) >= width and (source_height >> (factor + 1)) >= height:
+            factor += 1
+        pil_image.reduce = factor
+    return pil_image
+
+
+def load_preview(file_path, width, height, use_exif_thumbnail=True):
+    """Decode an image scaled to fit width × height
+
+    Returns a loaded PIL image detached from the file.
+    """
+    with Image.open(file_path) as img:
+        source = None
+        if use_exif_thumbnail and not fits_within(img.size, width, height):
+            source = open_exif_thumbnail(img, width, height)
+        if source is None:
+            source = reduce_decoding(img, width, height)
+
+        # Decode at the reduced size before resampling the rest of the way
+        source.load()
+        source.thumbnail((width, height), Image.Resampling.LANCZOS)
+        return source.copy() if source is img else source
@@ -0,0 +1,435 @@
+"""Metadata extraction from HTTP(S) and S3-style object stores by range reads
+
+Usage: python remote.py extract [--block-size BYTES] URL [URL ...]
+       python remote.py serve [--port PORT] DIR
+
+A byte source answers "give me bytes start..end" (local file, HTTP Range
+request). RangeReader turns one into a seekable file object with an LRU
+block cache; a read that needs several missing blocks in a row fetches
+them with a single request. PIL only reads headers and EXIF on open, so
+extracting a JPEG or TIFF from object storage costs a few KB per object.
+PIL reads WebP files whole.
+
+s3://bucket/key is fetched path-style from $AWS_ENDPOINT_URL (default
+https://s3.amazonaws.com) without request signing, so it covers public
+buckets and S3-compatible servers behind an authenticating proxy;
+presigned URLs work as plain https:// ones.
+
+serve runs a local HTTP server with Range support over a directory, as a
+stand-in object store for trying this out.
+"""
+import argparse
+import email.utils
+import http.client
+import io
+import json
+import os
+import re
+import sys
+import threading
+from collections import OrderedDict
+from urllib.parse import urlsplit, quote, unquote
+from PIL import Image
+import metadata
+
+DEFAULT_BLOCK_SIZE = 16 * 1024
+DEFAULT_MAX_BLOCKS = 256
+DEFAULT_S3_ENDPOINT = 'https://s3.amazonaws.com'
+TIMEOUT = 30
+
+CONTENT_RANGE = re.compile(r'bytes (\d+)-(\d+)/(\d+|\*)')
+
+
+class ConnectionPool:
+    """Keep-alive HTTP connections per (scheme, host, port), shared across threads"""
+
+    def __init__(self, max_idle=8):
+        self.max_idle = max_idle
+        self.idle = {}
+        self.lock = threading.Lock()
+
+    def acquire(self, scheme, netloc):
+        with self.lock:
+            connections = self.idle.get((scheme, netloc))
+            if connections:
+                return connections.pop(), True
+        connection_class = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+        return connection_class(netloc, timeout=TIMEOUT), False
+
+    def release(self, scheme, netloc, connection):
+        with self.lock:
+            connections = self.idle.setdefault((scheme, netloc), [])
+            if len(connections) < self.max_idle:
+                connections.append(connection)
+                return
+        connection.close()
+
+    def request(self, scheme, netloc, method, path, headers):
+        """Send a request and return (status, headers, body)
+
+        A reused connection the server has already closed is retried once
+        on a fresh one.
+        """
+        while True:
+            connection, reused = self.acquire(scheme, netloc)
+            try:
+                connection.request(method, path, headers=headers)
+                response = connection.getresponse()
+                body = response.read()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                connection.close()
+                if reused:
+                    continue
+                raise
+            except Exception:
+                connection.close()
+                raise
+            if response.will_close:
+                connection.close()
+            else:
+                self.release(scheme, netloc, connection)
+            return response.status, response.headers, body
+
+    def close(self):
+        with self.lock:
+            for connections in self.idle.values():
+                for connection in connections:
+                    connection.close()
+            self.idle = {}
+
+
+default_pool = ConnectionPool()
+
+
+class FileSource:
+    """Byte source over a local file"""
+
+    def __init__(self, path):
+        self.location = path
+        self.name = os.path.basename(path)
+        stat = os.stat(path)
+        self.size = stat.st_size
+        self.modified = stat.st_mtime
+        self.fd = os.open(path, os.O_RDONLY)
+
+    def fetch(self, start, end):
+        """Bytes start..end (exclusive)"""
+        return os.pread(self.fd, end - start, start)
+
+    def close(self):
+        os.close(self.fd)
+
+
+class HttpSource:
+    """Byte source over an HTTP(S) URL that honours Range requests
+
+    size and modified are filled from the first response, so no separate
+    HEAD request is made.
+    """
+
+    def __init__(self, url, pool=default_pool):
+        self.location = url
+        parts = urlsplit(url)
+        self.scheme, self.netloc = parts.scheme, parts.netloc
+        self.path = parts.path + ('?' + parts.query if parts.query else '')
+        self.name = unquote(os.path.basename(parts.path))
+        self.pool = pool
+        self.size = None
+        self.modified = None
+        # Servers that ignore Range send the whole object, it is kept here
+        self.body = None
+
+    def fetch(self, start, end):
+        if self.body is not None:
+            return self.body[start:end]
+        status, headers, body = self.pool.request(
+            self.scheme, self.netloc, 'GET', self.path, {'Range': f'bytes={start}-{end - 1}'})
+        if status == 416:
+            # Past the end, an empty object answers every range like this
+            match = re.fullmatch(r'bytes \*/(\d+)', headers.get('Content-Range', ''))
+            if match:
+                self.size = int(match[1])
+            return b''
+        if status not in (200, 206):
+            raise OSError(f"HTTP {status} for {self.location}")
+
+        modified = headers.get('Last-Modified')
+        if modified and self.modified is None:
+            try:
+                self.modified = email.utils.parsedate_to_datetime(modified).timestamp()
+            except (TypeError, ValueError):
+                pass
+        if status == 200:
+            self.body = body
+            self.size = len(body)
+            return body[start:end]
+
+        match = CONTENT_RANGE.match(headers.get('Content-Range', ''))
+        if match is None:
+            raise OSError(f"Bad Content-Range from {self.location}")
+        if match[3] != '*':
+            self.size = int(match[3])
+        return body
+
+    def close(self):
+        pass
+
+
+def s3_url(location, endpoint=None):
+    """Path-style HTTP(S) URL for s3://bucket/key"""
+    parts = urlsplit(location)
+    endpoint = (endpoint or os.environ.get('AWS_ENDPOINT_URL') or DEFAULT_S3_ENDPOINT).rstrip('/')
+    return f"{endpoint}/{parts.netloc}/{quote(parts.path.lstrip('/'))}"
+
+
+def open_source(location, pool=default_pool):
+    """Byte source for a local path, http(s):// URL or s3:// location"""
+    scheme = urlsplit(location).scheme
+    if scheme in ('http', 'https'):
+        return HttpSource(location, pool)
+    if scheme == 's3':
+        source = HttpSource(s3_url(location), pool)
+        source.location = location
+        return source
+    return FileSource(location)
+
+
+class RangeReader(io.RawIOBase):
+    """Seekable read-only file object over a byte source
+
+    Data is fetched in block_size blocks and the last max_blocks of them
+    are kept. requests and bytes_fetched count the range requests made and
+    the bytes they returned.
+    """
+
+    def __init__(self, source, block_size=DEFAULT_BLOCK_SIZE, max_blocks=DEFAULT_MAX_BLOCKS):
+        super().__init__()
+        self.source = source
+        # PIL names the file by this in its errors
+        self.name = source.location
+        self.block_size = block_size
+        self.max_blocks = max_blocks
+        self.blocks = OrderedDict()
+        self.position = 0
+        self.requests = 0
+        self.bytes_fetched = 0
+        if source.size is None:
+            # The first block also tells the object size
+            self.load_blocks(0, 1)
+            if source.size is None:
+                raise OSError(f"Size of {source.location} is unknown")
+
+    @property
+    def size(self):
+        return self.source.size
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        if offset < 0:
+            raise ValueError("Negative seek position")
+        self.position = offset
+        return offset
+
+    def load_blocks(self, first, last):
+        """Fetch blocks first..last (exclusive) with one request and return them"""
+        start = first * self.block_size
+        end = min(last * self.block_size, self.size) if self.size is not None else last * self.block_size
+        data = self.source.fetch(start, end)
+        self.requests += 1
+        self.bytes_fetched += len(data)
+        loaded = {}
+        for index in range(first, last):
+            offset = (index - first) * self.block_size
+            loaded[index] = self.blocks[index] = data[offset:offset + self.block_size]
+            self.blocks.move_to_end(index)
+        while len(self.blocks) > self.max_blocks:
+            self.blocks.popitem(last=False)
+        return loaded
+
+    def read_range(self, start, end):
+        """Bytes start..end, fetching missing blocks in coalesced runs"""
+        first = start // self.block_size
+        last = (end - 1) // self.block_size + 1
+        # Taken out up front, a long read may evict blocks it also needs
+        blocks = {}
+        for index in range(first, last):
+            block = self.blocks.get(index)
+            if block is not None:
+                self.blocks.move_to_end(index)
+                blocks[index] = block
+
+        missing_start = None
+        for index in range(first, last + 1):
+            missing = index < last and index not in blocks
+            if missing and missing_start is None:
+                missing_start = index
+            elif not missing and missing_start is not None:
+                blocks.update(self.load_blocks(missing_start, index))
+                missing_start = None
+
+        data = b''.join(blocks[index] for index in range(first, last))
+        offset = start - first * self.block_size
+        return data[offset:offset + end - start]
+
+    def read(self, size=-1):
+        end = self.size if size is None or size < 0 else min(self.position + size, self.size)
+        if self.position >= end:
+            return b''
+        data = self.read_range(self.position, end)
+        self.position += len(data)
+        return data
+
+    def readall(self):
+        return self.read()
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        if not self.closed:
+            self.source.close()
+        super().close()
+
+
+def extract(location, block_size=DEFAULT_BLOCK_SIZE, pool=default_pool):
+    """Extract a metadata record from a local path, URL or s3:// location
+
+    Same fields as metadata.extract; created, accessed and inode are None
+    for remote objects. Raises OSError when the object can't be fetched.
+    """
+    with RangeReader(open_source(location, pool), block_size) as reader:
+        source = reader.source
+        record = {
+            'path': location,
+            'name': source.name,
+            'size': source.size,
+            'created': None,
+            'modified': source.modified,
+            'accessed': None,
+            'mtime_ns': int(source.modified * 1e9) if source.modified is not None else None,
+            'inode': None,
+            'error': None,
+        }
+        try:
+            with Image.open(reader) as img:
+                record.update(metadata.get_image_metadata(img))
+                record['exif'] = metadata.get_exif_data(img)
+        except Exception as e:
+            record['error'] = str(e)
+        record['bytes_fetched'] = reader.bytes_fetched
+        record['requests'] = reader.requests
+    return record
+
+
+def make_range_handler(directory):
+    from http.server import SimpleHTTPRequestHandler
+
+    class RangeRequestHandler(SimpleHTTPRequestHandler):
+        """Static files with single-range GET support and keep-alive"""
+        protocol_version = 'HTTP/1.1'
+
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, directory=directory, **kwargs)
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            path = self.translate_path(self.path)
+            match = re.fullmatch(r'bytes=(\d*)-(\d*)', self.headers.get('Range', ''))
+            if match is None or not os.path.isfile(path):
+                return super().do_GET()
+
+            size = os.path.getsize(path)
+            if match[1]:
+                start, end = int(match[1]), int(match[2]) + 1 if match[2] else size
+            else:
+                start, end = max(0, size - int(match[2] or 0)), size
+            end = min(end, size)
+            if start >= size or start >= end:
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{size}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+
+            with open(path, 'rb') as f:
+                f.seek(start)
+                data = f.read(end - start)
+            self.send_response(206)
+            self.send_header('Content-Type', self.guess_type(path))
+            self.send_header('Content-Range', f'bytes {start}-{end - 1}/{size}')
+            self.send_header('Content-Length', str(len(data)))
+            self.send_header('Last-Modified', self.date_time_string(int(os.path.getmtime(path))))
+            self.end_headers()
+            self.wfile.write(data)
+
+    return RangeRequestHandler
+
+
+def serve(directory, port=8000):
+    from http.server import ThreadingHTTPServer
+
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_range_handler(os.path.abspath(directory)))
+    print(f"Serving {directory} on http://127.0.0.1:{server.server_address[1]}/", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Extract image metadata from object storage by range reads")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    extract_parser = commands.add_parser("extract", help="print records for URLs as JSON lines")
+    extract_parser.add_argument("locations", nargs="+", metavar="URL",
+                                help="http(s)://, s3:// or local paths")
+    extract_parser.add_argument("--block-size", type=int, default=DEFAULT_BLOCK_SIZE,
+                                help=f"bytes per range request block (default: {DEFAULT_BLOCK_SIZE})")
+
+    serve_parser = commands.add_parser("serve", help="serve a directory with HTTP Range support")
+    serve_parser.add_argument("directory")
+    serve_parser.add_argument("--port", type=int, default=8000)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.command == "serve":
+        serve(args.directory, args.port)
+        return 0
+
+    status = 0
+    fetched = 0
+    for location in args.locations:
+        try:
+            record = extract(location, args.block_size)
+        except OSError as e:
+            print(f"{location}: {str(e)}", file=sys.stderr)
+            status = 1
+            continue
+        fetched += record['bytes_fetched']
+        print(json.dumps(metadata.to_jsonable(record), ensure_ascii=False))
+    print(f"Fetched {metadata.format_size(fetched)} for {len(args.locations)} objects", file=sys.stderr)
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,175 @@
+"""Spatial queries over the GPS coordinates in the metadata cache
+
+MetadataCache mirrors the coordinates of every geotagged record into an
+SQLite R*Tree. Bounding-box queries go straight to the index; radius and
+nearest-neighbour queries use it to narrow down candidates and compute
+great-circle distances for those only, so no files are reopened.
+
+Usage: python spatial.py DB bbox MIN_LAT MIN_LON MAX_LAT MAX_LON
+       python spatial.py DB radius LAT LON KM
+       python spatial.py DB nearest LAT LON [-k COUNT]
+       python spatial.py DB reindex
+"""
+import argparse
+import json
+import math
+import sqlite3
+import sys
+import numpy as np
+import geo
+from cache import MetadataCache
+
+# Nearest-neighbour search starts with this radius and widens it until enough
+# points are found or the whole globe is covered
+INITIAL_RADIUS_KM = 1.0
+RADIUS_GROWTH = 8
+MAX_RADIUS_KM = math.pi * geo.EARTH_RADIUS_KM
+
+QUERY = """
+SELECT l.path, l.latitude, l.longitude
+FROM location_index i JOIN locations l ON l.id = i.id
+WHERE i.max_lat >= ? AND i.min_lat <= ? AND i.max_lon >= ? AND i.min_lon <= ?
+"""
+
+
+def longitude_ranges(min_lon, max_lon):
+    """Split a longitude range crossing the antimeridian in two"""
+    if min_lon <= max_lon:
+        return [(min_lon, max_lon)]
+    return [(min_lon, 180.0), (-180.0, max_lon)]
+
+
+def radius_bbox(latitude, longitude, radius_km):
+    """Bounding box (min_lat, min_lon, max_lat, max_lon) of a circle
+
+    min_lon > max_lon when the box crosses the antimeridian.
+    """
+    angle = radius_km / geo.EARTH_RADIUS_KM
+    dlat = math.degrees(angle)
+    min_lat, max_lat = latitude - dlat, latitude + dlat
+    # Circles over a pole cover every longitude
+    if min_lat <= -90 or max_lat >= 90 or angle >= math.pi / 2:
+        return max(min_lat, -90.0), -180.0, min(max_lat, 90.0), 180.0
+
+    dlon = math.degrees(math.asin(min(1.0, math.sin(angle) / math.cos(math.radians(latitude)))))
+    min_lon, max_lon = longitude - dlon, longitude + dlon
+    if max_lon - min_lon >= 360:
+        return min_lat, -180.0, max_lat, 180.0
+    if min_lon < -180:
+        min_lon += 360
+    if max_lon > 180:
+        max_lon -= 360
+    return min_lat, min_lon, max_lat, max_lon
+
+
+class SpatialIndex:
+    def __init__(self, cache):
+        self.conn = cache.conn
+
+    def count(self):
+        return self.conn.execute("SELECT COUNT(*) FROM locations").fetchone()[0]
+
+    def candidates(self, min_lat, min_lon, max_lat, max_lon):
+        """(path, latitude, longitude) rows whose index box meets the bbox"""
+        rows = []
+        for lon_from, lon_to in longitude_ranges(min_lon, max_lon):
+            rows.extend(self.conn.execute(QUERY, (min_lat, max_lat, lon_from, lon_to)))
+        return rows
+
+    def within_bbox(self, min_lat, min_lon, max_lat, max_lon):
+        """Locations inside a bounding box, which may cross the antimeridian"""
+        ranges = longitude_ranges(min_lon, max_lon)
+        # The R*Tree stores 32-bit floats rounded outwards, check exact values
+        return [
+            {'path': path, 'latitude': lat, 'longitude': lon}
+            for path, lat, lon in self.candidates(min_lat, min_lon, max_lat, max_lon)
+            if min_lat <= lat <= max_lat and any(lon_from <= lon <= lon_to for lon_from, lon_to in ranges)
+        ]
+
+    def within_radius(self, latitude, longitude, radius_km):
+        """Locations within radius_km of a point, nearest first"""
+        rows = self.candidates(*radius_bbox(latitude, longitude, radius_km))
+        if not rows:
+            return []
+        latitudes = np.fromiter((row[1] for row in rows), dtype=np.float64, count=len(rows))
+        longitudes = np.fromiter((row[2] for row in rows), dtype=np.float64, count=len(rows))
+        distances = geo.haversine_km(latitude, longitude, latitudes, longitudes)
+
+        inside = np.flatnonzero(distances <= radius_km)
+        inside = inside[np.argsort(distances[inside], kind='stable')]
+        return [
+            {'path': rows[i][0], 'latitude': rows[i][1], 'longitude': rows[i][2],
+             'distance_km': float(distances[i])}
+            for i in inside
+        ]
+
+    def nearest(self, latitude, longitude, count=10):
+        """The count locations closest to a point, nearest first"""
+        radius = INITIAL_RADIUS_KM
+        while True:
+            found = self.within_radius(latitude, longitude, radius)
+            # Anything outside the radius is farther than everything inside it
+            if len(found) >= count or radius >= MAX_RADIUS_KM:
+                return found[:count]
+            radius = min(radius * RADIUS_GROWTH, MAX_RADIUS_KM)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Query geotagged images in a metadata cache")
+    parser.add_argument("db", help="SQLite metadata cache written by batch.py --cache")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    bbox = commands.add_parser("bbox", help="images inside a bounding box")
+    for name in ("min_lat", "min_lon", "max_lat", "max_lon"):
+        bbox.add_argument(name, type=float)
+
+    radius = commands.add_parser("radius", help="images within a distance of a point")
+    radius.add_argument("lat", type=float)
+    radius.add_argument("lon", type=float)
+    radius.add_argument("km", type=float)
+
+    nearest = commands.add_parser("nearest", help="images closest to a point")
+    nearest.add_argument("lat", type=float)
+    nearest.add_argument("lon", type=float)
+    nearest.add_argument("-k", "--count", type=int, default=10, help="number of images (default: 10)")
+
+    commands.add_parser("reindex", help="rebuild the spatial index from cached records")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    try:
+        cache = MetadataCache(args.db, readonly=args.command != "reindex")
+    except sqlite3.Error as e:
+        print(f"Query error: {args.db}: {str(e)}", file=sys.stderr)
+        return 1
+
+    with cache:
+        if args.command == "reindex":
+            cache.rebuild_locations()
+            print(f"Indexed {SpatialIndex(cache).count()} locations", file=sys.stderr)
+            return 0
+
+        index = SpatialIndex(cache)
+        try:
+            if args.command == "bbox":
+                results = index.within_bbox(args.min_lat, args.min_lon, args.max_lat, args.max_lon)
+            elif args.command == "radius":
+                results = index.within_radius(args.lat, args.lon, args.km)
+            else:
+                results = index.nearest(args.lat, args.lon, args.count)
+        except sqlite3.Error as e:
+            # Caches written before the spatial index existed need a reindex
+            print(f"Query error: {str(e)}", file=sys.stderr)
+            return 1
+
+    for result in results:
+        print(json.dumps(result, ensure_ascii=False))
+    print(f"Found {len(results)} images", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
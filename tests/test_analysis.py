@@ -0,0 +1,34 @@
+import os
+import sys
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import analysis
+
+
+def test_clipping_of_white_and_black_images():
+    for mode in ('RGB', 'L'):
+        white = analysis.analyze_pil(Image.new(mode, (64, 64), 'white'))
+        assert white['clipped_highlights'] == 1.0
+        assert white['clipped_shadows'] == 0.0
+        assert white['sharpness'] == 0.0
+
+        black = analysis.analyze_pil(Image.new(mode, (64, 64), 'black'))
+        assert black['clipped_highlights'] == 0.0
+        assert black['clipped_shadows'] == 1.0
+
+
+def test_luma_does_not_wrap():
+    pixels = np.full((2, 2, 3), 255, dtype=np.uint8)
+    luma = analysis.StatsAccumulator(('R', 'G', 'B')).luma(pixels)
+    assert luma.dtype == np.uint8
+    assert (luma == 255).all()
+
+
+def test_sharpness_of_checkerboard():
+    board = (np.indices((32, 32)).sum(axis=0) % 2 * 255).astype(np.uint8)
+    gray = analysis.analyze_pil(Image.fromarray(board, 'L'))
+    rgb = analysis.analyze_pil(Image.fromarray(np.dstack([board] * 3), 'RGB'))
+    assert gray['sharpness'] > 0
+    assert rgb['sharpness'] == gray['sharpness']
@@ -0,0 +1,24 @@
+import os
+import sys
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import animation
+
+
+def test_summary_has_fixed_size(tmp_path):
+    durations = [10, 20, 30, 100, 150, 2000] * 20
+    frames = [Image.new('L', (8, 8), index % 2 * 255) for index in range(len(durations))]
+    path = str(tmp_path / "anim.gif")
+    frames[0].save(path, save_all=True, append_images=frames[1:], duration=durations, loop=0)
+
+    summary = animation.read_animation(path, frame_limit=5)
+    assert summary['frame_count'] == len(durations)
+    assert summary['total_duration'] == sum(durations)
+    assert summary['min_duration'] == 10 and summary['max_duration'] == 2000
+    assert len(summary['frames']) == 5
+    # 0, 20, 50, 100, 200, 500, 1000 ms and longer
+    assert summary['duration_histogram'] == [0, 40, 20, 20, 20, 0, 0, 20]
+    assert animation.format_duration_histogram(summary['duration_histogram']) == \
+        "≤20 ms: 40, ≤50 ms: 20, ≤100 ms: 20, ≤200 ms: 20, >1000 ms: 20"
+    assert 'durations' not in summary
@@ -0,0 +1,127 @@
+import os
+import struct
+import sys
+import warnings
+import pytest
+from PIL import Image
+from PIL.TiffImagePlugin import IFDRational
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import fast_reader
+import metadata
+
+FORMATS = [('JPEG', 'jpg', 'RGB'), ('TIFF', 'tiff', 'RGB'), ('PNG', 'png', 'RGBA'), ('WEBP', 'webp', 'RGB')]
+
+
+def make_exif():
+    exif = Image.Exif()
+    exif[0x010F] = 'Canon'
+    exif[0x0110] = 'EOS 5D'
+    exif[0x0112] = 6
+    exif[0x0132] = '2024:05:06 07:08:09'
+    exif.get_ifd(metadata.EXIF_IFD).update({0x9003: '2024:05:06 07:08:09', 0x829A: IFDRational(1, 250), 0x8827: 200})
+    exif.get_ifd(metadata.GPS_IFD).update({
+        1: 'S', 2: (IFDRational(55, 1), IFDRational(45, 1), IFDRational(1234, 100)),
+        3: 'W', 4: (IFDRational(37, 1), IFDRational(37, 1), IFDRational(5999, 100)),
+    })
+    return exif
+
+
+def extract_both(path):
+    """(fast, PIL) records without the access time, which reading may move"""
+    records = []
+    for fast in (True, False):
+        with warnings.catch_warnings():
+            # PIL warns about the corrupt EXIF it skips
+            warnings.simplefilter('ignore')
+            record = metadata.extract(path, fast=fast)
+        record.pop('accessed', None)
+        records.append(record)
+    return records
+
+
+@pytest.mark.parametrize('image_format, extension, mode', FORMATS)
+def test_fast_matches_pil(tmp_path, image_format, extension, mode):
+    path = str(tmp_path / f"exif.{extension}")
+    Image.new(mode, (16, 12)).save(path, image_format, exif=make_exif())
+    assert fast_reader.read_header(path) is not None
+
+    fast, pil = extract_both(path)
+    assert fast == pil
+    assert fast['exif']['Model'] == 'EOS 5D'
+    if image_format != 'TIFF':
+        # PIL's TIFF writer leaves out the Exif and GPS sub-IFDs
+        assert fast['exif']['GPSInfo']['Latitude'] < 0
+
+
+def jpeg_with_exif(tmp_path):
+    path = str(tmp_path / "source.jpg")
+    Image.new('RGB', (16, 12)).save(path, exif=make_exif())
+    with open(path, 'rb') as f:
+        data = f.read()
+    # Start of the TIFF block inside APP1
+    tiff = data.index(b'Exif\x00\x00') + 6
+    return data, tiff
+
+
+def endian(data, tiff):
+    return '<' if data[tiff:tiff + 2] == b'II' else '>'
+
+
+def corrupt_variants(data, tiff):
+    order = endian(data, tiff)
+    ifd0 = tiff + struct.unpack_from(order + 'L', data, tiff + 4)[0]
+    count = struct.unpack_from(order + 'H', data, ifd0)[0]
+
+    # Entry table running past the end of the EXIF block
+    too_many = bytearray(data)
+    struct.pack_into(order + 'H', too_many, ifd0, 0xFFFF)
+    yield 'entry count', bytes(too_many)
+
+    # Each IFD0 value (or sub-IFD offset) pointing past the end
+    for index in range(count):
+        bad = bytearray(data)
+        struct.pack_into(order + 'L', bad, ifd0 + 2 + 12 * index + 8, 0x7FFFFFF0)
+        yield f'entry {index} offset', bytes(bad)
+
+    bad_header = bytearray(data)
+    bad_header[tiff + 2:tiff + 4] = b'\x00\x00'
+    yield 'TIFF magic', bytes(bad_header)
+    yield 'truncated in IFD0', data[:ifd0 + 30]
+    yield 'truncated file', data[:len(data) // 2]
+
+
+def test_corrupt_exif_falls_back_to_pil(tmp_path):
+    data, tiff = jpeg_with_exif(tmp_path)
+    for name, variant in corrupt_variants(data, tiff):
+        path = str(tmp_path / "corrupt.jpg")
+        with open(path, 'wb') as f:
+            f.write(variant)
+        fast, pil = extract_both(path)
+        assert fast == pil, name
+
+
+def test_truncated_ifd_is_not_read_fast(tmp_path):
+    data, tiff = jpeg_with_exif(tmp_path)
+    order = endian(data, tiff)
+    ifd0 = tiff + struct.unpack_from(order + 'L', data, tiff + 4)[0]
+    bad = bytearray(data)
+    # First tag (Make, 6 bytes) stored past the end
+    struct.pack_into(order + 'L', bad, ifd0 + 2 + 8, 0x7FFFFFF0)
+    path = str(tmp_path / "corrupt.jpg")
+    with open(path, 'wb') as f:
+        f.write(bytes(bad))
+    assert fast_reader.read_header(path) is None
+
+
+def test_truncated_tiff(tmp_path):
+    path = str(tmp_path / "source.tiff")
+    Image.new('RGB', (64, 64)).save(path, exif=make_exif())
+    with open(path, 'rb') as f:
+        data = f.read()
+    for size in (8, 16, len(data) - 200, len(data) - 20):
+        truncated = str(tmp_path / f"truncated{size}.tiff")
+        with open(truncated, 'wb') as f:
+            f.write(data[:size])
+        fast, pil = extract_both(truncated)
+        assert fast == pil, size
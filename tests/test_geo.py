@@ -0,0 +1,67 @@
+import math
+import os
+import sys
+from PIL import Image
+from PIL.TiffImagePlugin import IFDRational
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import geo
+import metadata
+
+
+def dms(degrees, minutes, seconds):
+    return (IFDRational(degrees, 1), IFDRational(minutes, 1), IFDRational(seconds, 100))
+
+
+LATITUDE = dms(55, 45, 1234)
+LONGITUDE = dms(37, 37, 5999)
+
+
+def gps_ifd(latitude_ref=None, longitude_ref=None):
+    ifd = {geo.GPS_LATITUDE: LATITUDE, geo.GPS_LONGITUDE: LONGITUDE}
+    if latitude_ref is not None:
+        ifd[geo.GPS_LATITUDE_REF] = latitude_ref
+    if longitude_ref is not None:
+        ifd[geo.GPS_LONGITUDE_REF] = longitude_ref
+    return ifd
+
+
+def test_gps_coordinates_match_dms_to_decimal():
+    refs = [('N', 'E'), ('S', 'W'), ('N', 'W'), ('S', 'E'), (None, None), ('S', None), (None, 'W')]
+    latitudes, longitudes = geo.gps_coordinates(gps_ifd(*pair) for pair in refs)
+    for (latitude_ref, longitude_ref), lat, lon in zip(refs, latitudes.tolist(), longitudes.tolist()):
+        assert lat == metadata.dms_to_decimal(LATITUDE, latitude_ref or 'N')
+        assert lon == metadata.dms_to_decimal(LONGITUDE, longitude_ref or 'E')
+
+
+def test_gps_coordinates_without_valid_coordinates_are_nan():
+    ifds = [None, {}, {geo.GPS_LATITUDE: LATITUDE}, {geo.GPS_LATITUDE: LATITUDE, geo.GPS_LONGITUDE: (1, 2)},
+            {geo.GPS_LATITUDE: LATITUDE, geo.GPS_LONGITUDE: dms(1, 0, 0)[:2] + (IFDRational(1, 0),)}]
+    latitudes, longitudes = geo.gps_coordinates(ifds)
+    for lat, lon in zip(latitudes.tolist(), longitudes.tolist()):
+        assert math.isnan(lat) or math.isnan(lon)
+
+
+def without_atime(record):
+    record.pop('accessed', None)
+    return record
+
+
+def test_extract_many_matches_extract(tmp_path):
+    paths = []
+    for index, refs in enumerate([('S', 'W'), ('N', 'E'), (None, None)]):
+        exif = Image.Exif()
+        exif.get_ifd(metadata.GPS_IFD).update(gps_ifd(*refs))
+        path = str(tmp_path / f"gps{index}.jpg")
+        Image.new('RGB', (8, 8)).save(path, exif=exif)
+        paths.append(path)
+    plain = str(tmp_path / "plain.png")
+    Image.new('RGB', (8, 8)).save(plain)
+    paths += [plain, str(tmp_path / "missing.jpg")]
+
+    for fast in (True, False):
+        # Reading a file may move its access time
+        records = [without_atime(record) for record in metadata.extract_many(paths, fast=fast)]
+        assert records == [without_atime(metadata.extract(path, fast=fast)) for path in paths]
+        assert records[0]['exif']['GPSInfo']['Latitude'] < 0
+        assert records[1]['exif']['GPSInfo']['Longitude'] > 0
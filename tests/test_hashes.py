@@ -0,0 +1,44 @@
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import hashes
+
+
+def brute_force_pairs(values, radius):
+    distances = hashes.hamming_distance(values[:, None], values[None, :])
+    i, j = np.nonzero(np.triu(distances <= radius, k=1))
+    return set(zip(i.tolist(), j.tolist()))
+
+
+def index_pairs(index):
+    found = set()
+    for i, j, _ in index.pairs():
+        found.update(zip(i.tolist(), j.tolist()))
+    return found
+
+
+def test_bucket_table_with_one_hash_per_chunk_value_plus_one():
+    # 8 chunks of 8 bits: 2**8 + 1 hashes give a bucket table as long as order
+    rng = np.random.default_rng(0)
+    count = 2 ** 8 + 1
+    base = rng.integers(0, 2 ** 63, count // 2, dtype=np.uint64)
+    flipped = base ^ (np.uint64(1) << rng.integers(0, 64, len(base)).astype(np.uint64))
+    values = np.concatenate([base, flipped, base[:1]])
+    assert len(values) == count
+
+    index = hashes.HashIndex(values, radius=4, chunks=8)
+    assert all(buckets is not None and len(buckets) == len(order)
+               for _, _, _, _, buckets, order, _ in index.tables)
+    assert index_pairs(index) == brute_force_pairs(values, 4)
+
+
+def test_query_matches_brute_force():
+    rng = np.random.default_rng(1)
+    values = rng.integers(0, 2 ** 63, 1000, dtype=np.uint64)
+    values[500] = values[10] ^ np.uint64(0b101)
+    index = hashes.HashIndex(values, radius=4)
+    found, distances = index.query(values[10])
+    assert sorted(found.tolist()) == [10, 500]
+    assert sorted(distances.tolist()) == [0, 2]
@@ -0,0 +1,69 @@
+import os
+import sys
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import batch
+import incremental
+from cache import MetadataCache
+
+
+def make_tree(root):
+    os.makedirs(os.path.join(root, 'sub'))
+    for name in ('a.png', 'b.png', 'c.png', os.path.join('sub', 'd.png')):
+        Image.new('RGB', (4, 4)).save(os.path.join(root, name))
+
+
+def changes_by_status(changes):
+    found = {}
+    for status, path in changes:
+        found.setdefault(status, []).append(os.path.basename(path))
+    return {status: sorted(names) for status, names in found.items()}
+
+
+def test_diff_after_changes(tmp_path, monkeypatch):
+    root = tmp_path / 'photos'
+    make_tree(str(root))
+    monkeypatch.chdir(tmp_path)
+    with MetadataCache(str(tmp_path / 'cache.db')) as cache:
+        # Built with a relative spelling
+        assert len(list(batch.scan(['./photos'], cache=cache))) == 4
+
+        for spelling in (str(root), './photos/', 'photos', str(tmp_path / 'photos' / '..' / 'photos')):
+            stats = {}
+            assert incremental.collect_changes(cache, [spelling], stats=stats) == []
+            assert stats == {incremental.UNCHANGED: 4}
+
+        Image.new('RGB', (8, 8)).save(str(root / 'a.png'))
+        os.remove(str(root / 'b.png'))
+        Image.new('RGB', (4, 4)).save(str(root / 'sub' / 'e.png'))
+
+        for spelling in (str(root), './photos'):
+            stats = {}
+            changes = incremental.collect_changes(cache, [spelling], stats=stats)
+            assert changes_by_status(changes) == {
+                incremental.ADDED: ['e.png'], incremental.MODIFIED: ['a.png'], incremental.DELETED: ['b.png'],
+            }
+            assert stats[incremental.UNCHANGED] == 2
+
+        records = list(incremental.rescan(cache, ['photos']))
+        assert sorted(os.path.basename(record['path']) for record in records) == ['a.png', 'e.png']
+        assert all(os.path.isabs(record['path']) for record in records)
+        assert incremental.collect_changes(cache, [str(root)]) == []
+
+
+def test_single_files_and_non_recursive_diff(tmp_path, monkeypatch):
+    root = tmp_path / 'photos'
+    make_tree(str(root))
+    monkeypatch.chdir(root)
+    with MetadataCache(str(tmp_path / 'cache.db')) as cache:
+        list(batch.scan(['.'], cache=cache))
+        assert incremental.diff_file(cache, 'a.png') == incremental.UNCHANGED
+        assert incremental.diff_file(cache, str(root / 'sub' / 'd.png')) == incremental.UNCHANGED
+        assert incremental.diff_file(cache, 'missing.png') is None
+
+        os.remove('c.png')
+        assert incremental.diff_file(cache, './c.png') == incremental.DELETED
+        changes, unchanged = incremental.diff_tree(cache, '.', recursive=False)
+        assert changes == [(incremental.DELETED, str(root / 'c.png'))]
+        assert unchanged == 2
@@ -0,0 +1,64 @@
+import json
+import os
+import sys
+from PIL import Image
+from PIL.TiffImagePlugin import IFDRational
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import metadata
+import records
+
+
+def make_files(root):
+    exif = Image.Exif()
+    exif[0x010F] = 'Canon'
+    exif[0x0110] = 'EOS 5D'
+    exif.get_ifd(metadata.EXIF_IFD)[0x9003] = '2024:05:06 07:08:09'
+    exif.get_ifd(metadata.GPS_IFD).update({
+        1: 'S', 2: (IFDRational(55, 1), IFDRational(45, 1), IFDRational(1234, 100)),
+        3: 'W', 4: (IFDRational(37, 1), IFDRational(37, 1), IFDRational(5999, 100)),
+    })
+    paths = []
+    for name, kwargs in (('gps.jpg', {'exif': exif}), ('plain.png', {}), ('dpi.tiff', {'dpi': (300, 300)})):
+        path = os.path.join(root, name)
+        Image.new('RGB', (16, 12)).save(path, **kwargs)
+        paths.append(path)
+    broken = os.path.join(root, 'broken.gif')
+    with open(broken, 'wb') as f:
+        f.write(b'GIF89a not really')
+    return paths + [broken, os.path.join(root, 'missing.jpg')]
+
+
+def sample_records(root):
+    extracted = [metadata.extract(path) for path in make_files(root)]
+    # The cache and JSON Lines hand back lists and floats instead of tuples and rationals
+    decoded = [json.loads(json.dumps(metadata.to_jsonable(record))) for record in extracted]
+    # Every field None, and keys other tools add
+    empty = dict.fromkeys(records.FIELDS)
+    empty['path'] = os.path.join(root, 'empty.jpg')
+    extra = dict(decoded[0], pixel_stats={'pixels': 192}, bytes_fetched=None)
+    return extracted + decoded + [empty, extra]
+
+
+def test_record_round_trip(tmp_path):
+    samples = sample_records(str(tmp_path))
+    # Error records: one without a stat result, one PIL couldn't open
+    assert set(samples[-3]) == {'path', 'error'} and samples[-3]['error']
+    assert samples[3]['error'] and samples[3]['size'] is not None
+    for record in samples:
+        assert records.Record.from_dict(record).to_dict() == record
+
+
+def test_batch_round_trip(tmp_path):
+    samples = sample_records(str(tmp_path))
+    batch = records.RecordBatch(samples)
+    assert len(batch) == len(samples)
+    assert list(batch) == samples
+    assert batch[-1] == samples[-1]
+    assert batch.paths() == [record['path'] for record in samples]
+
+    # Rows keep their values through take, sort and filter
+    order = batch.order('path')
+    assert list(batch.take(order)) == [samples[row] for row in order]
+    wide = batch.filter(batch.column('width') > 0)
+    assert list(wide) == [record for record in samples if (record.get('width') or 0) > 0]
@@ -0,0 +1,129 @@
+import os
+import sys
+import zlib
+import numpy as np
+import pytest
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import tiled
+
+WIDTH, HEIGHT = 100, 70
+TILE = 32
+
+
+def sample_pixels():
+    y, x = np.mgrid[:HEIGHT, :WIDTH]
+    return np.dstack([x * 2, y * 3, (x + y) % 256]).astype(np.uint8)
+
+
+def write_tiled(path, pixels, compress=False):
+    """RGB TIFF in 32×32 tiles, which PIL can't write"""
+    height, width, samples = pixels.shape
+    tiles = []
+    for top in range(0, height, TILE):
+        for left in range(0, width, TILE):
+            # Edge tiles are stored at full size
+            tile = np.zeros((TILE, TILE, samples), dtype=np.uint8)
+            part = pixels[top:top + TILE, left:left + TILE]
+            tile[:part.shape[0], :part.shape[1]] = part
+            tiles.append(zlib.compress(tile.tobytes()) if compress else tile.tobytes())
+
+    def entries(offsets):
+        return [
+            (tiled.IMAGE_WIDTH, 4, [width]), (tiled.IMAGE_LENGTH, 4, [height]),
+            (tiled.BITS_PER_SAMPLE, 3, [8] * samples), (tiled.COMPRESSION, 3, [8 if compress else 1]),
+            (tiled.PHOTOMETRIC, 3, [2]), (tiled.SAMPLES_PER_PIXEL, 3, [samples]),
+            (tiled.TILE_WIDTH, 4, [TILE]), (tiled.TILE_LENGTH, 4, [TILE]),
+            (tiled.TILE_OFFSETS, 4, offsets), (tiled.TILE_BYTE_COUNTS, 4, [len(tile) for tile in tiles]),
+        ]
+
+    # Offsets don't change the header size, lay it out once to find where the tiles start
+    start = len(tiled.build_tiff(entries([0] * len(tiles))))
+    offsets = list(np.cumsum([start] + [len(tile) for tile in tiles[:-1]]))
+    with open(path, 'wb') as f:
+        f.write(tiled.build_tiff(entries(offsets)) + b''.join(tiles))
+
+
+def read_all(path):
+    tiff = tiled.TiledTiff(path)
+    try:
+        page = tiff.pages[0]
+        full = tiff.read_region(page, 0, 0, tiff.width, tiff.height)
+        # A region crossing tile and strip boundaries
+        part = tiff.read_region(page, 30, 20, 50, 40)
+        return page, full, part
+    finally:
+        tiff.close()
+
+
+@pytest.mark.parametrize('compression', [None, 'tiff_deflate'])
+@pytest.mark.parametrize('rows_per_strip', [16, HEIGHT])
+def test_strip_round_trip(tmp_path, compression, rows_per_strip):
+    pixels = sample_pixels()
+    path = str(tmp_path / "strips.tiff")
+    Image.fromarray(pixels).save(path, compression=compression, tiffinfo={tiled.ROWS_PER_STRIP: rows_per_strip})
+    page, full, part = read_all(path)
+    assert not page.tiled and page.rows == -(-HEIGHT // rows_per_strip)
+    assert np.array_equal(full, pixels)
+    assert np.array_equal(part, pixels[20:60, 30:80])
+
+
+@pytest.mark.parametrize('compress', [False, True])
+def test_tiled_round_trip(tmp_path, compress):
+    pixels = sample_pixels()
+    path = str(tmp_path / "tiles.tiff")
+    write_tiled(path, pixels, compress)
+    page, full, part = read_all(path)
+    assert page.tiled and (page.columns, page.rows) == (4, 3)
+    assert np.array_equal(full, pixels)
+    assert np.array_equal(part, pixels[20:60, 30:80])
+
+
+@pytest.mark.parametrize('layout', ['strips', 'tiles', 'deflate tiles'])
+def test_truncated_data_raises(tmp_path, layout):
+    path = str(tmp_path / "source.tiff")
+    if layout == 'strips':
+        Image.fromarray(sample_pixels()).save(path, tiffinfo={tiled.ROWS_PER_STRIP: 16})
+    else:
+        write_tiled(path, sample_pixels(), compress=layout == 'deflate tiles')
+    with open(path, 'rb') as f:
+        data = f.read()
+    tiff = tiled.TiledTiff(path)
+    # Cut into the last tile or strip; both writers put the IFD before the pixel data
+    last = int(np.argmax(tiff.pages[0].offsets))
+    cut = int(tiff.pages[0].offsets[last]) + 10
+    tiff.close()
+    truncated = str(tmp_path / "truncated.tiff")
+    with open(truncated, 'wb') as f:
+        f.write(data[:cut])
+
+    tiff = tiled.TiledTiff(truncated)
+    try:
+        with pytest.raises(ValueError):
+            tiff.read_region(tiff.pages[0], 0, 0, tiff.width, tiff.height)
+    finally:
+        tiff.close()
+
+
+def test_short_strip_byte_count_raises(tmp_path):
+    # Byte count covering half the rows of the only strip, the file itself is complete
+    pixels = sample_pixels()
+    data = pixels.tobytes()
+    entries = [
+        (tiled.IMAGE_WIDTH, 4, [WIDTH]), (tiled.IMAGE_LENGTH, 4, [HEIGHT]),
+        (tiled.BITS_PER_SAMPLE, 3, [8, 8, 8]), (tiled.COMPRESSION, 3, [1]), (tiled.PHOTOMETRIC, 3, [2]),
+        (tiled.SAMPLES_PER_PIXEL, 3, [3]), (tiled.ROWS_PER_STRIP, 4, [HEIGHT]),
+        (tiled.STRIP_OFFSETS, 4, [0]), (tiled.STRIP_BYTE_COUNTS, 4, [len(data) // 2]),
+    ]
+    header = tiled.build_tiff(entries)
+    path = str(tmp_path / "short.tiff")
+    with open(path, 'wb') as f:
+        f.write(tiled.patch_strip_offset(header, '<', len(header)) + data)
+
+    tiff = tiled.TiledTiff(path)
+    try:
+        with pytest.raises(ValueError):
+            tiff.read_region(tiff.pages[0], 0, 0, WIDTH, HEIGHT)
+    finally:
+        tiff.close()
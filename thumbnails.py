@@ -0,0 +1,138 @@
+"""Persistent on-disk thumbnail store
+
+Thumbnails are small WebP (or JPEG) files named after a hash of the source
+path, size, mtime and requested box, sharded into 256 subdirectories. A
+file's mtime doubles as its last access time, and the least recently used
+entries are evicted once the store grows past its byte budget.
+"""
+import hashlib
+import io
+import os
+import tempfile
+import threading
+from PIL import features
+import preview
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+DEFAULT_QUALITY = 80
+
+# Evict down to this fraction of the budget so eviction doesn't run on every put
+EVICT_TARGET = 0.9
+
+
+def default_cache_dir():
+    """Per-user thumbnail directory following XDG conventions"""
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'image_info', 'thumbnails')
+
+
+class ThumbnailCache:
+    def __init__(self, root=None, max_bytes=DEFAULT_MAX_BYTES, quality=DEFAULT_QUALITY, image_format=None):
+        self.root = root or default_cache_dir()
+        self.max_bytes = max_bytes
+        self.quality = quality
+        self.image_format = image_format or ('WEBP' if features.check('webp') else 'JPEG')
+        self.extension = '.webp' if self.image_format == 'WEBP' else '.jpg'
+        self.total_bytes = None
+        # Loader threads share one store
+        self.lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+
+    def key(self, file_path, width, height):
+        """Hash identifying a thumbnail of the file's current contents"""
+        stat = os.stat(file_path)
+        source = f"{os.path.abspath(file_path)}\0{stat.st_size}\0{stat.st_mtime_ns}\0{width}x{height}"
+        return hashlib.sha1(source.encode('utf-8', errors='surrogateescape')).hexdigest()
+
+    def entry_path(self, key):
+        return os.path.join(self.root, key[:2], key + self.extension)
+
+    def get(self, file_path, width, height):
+        """Return cached thumbnail bytes, or None on a miss"""
+        try:
+            path = self.entry_path(self.key(file_path, width, height))
+            with open(path, 'rb') as f:
+                data = f.read()
+            # Mark as recently used
+            os.utime(path)
+            return data
+        except OSError:
+            return None
+
+    def put(self, file_path, width, height, data):
+        """Store encoded thumbnail bytes for a file"""
+        path = self.entry_path(self.key(file_path, width, height))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Write to a temporary file first so readers never see a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        with self.lock:
+            if self.total_bytes is None:
+                self.total_bytes = self.disk_usage()
+            else:
+                self.total_bytes += len(data)
+            if self.total_bytes > self.max_bytes:
+                self.evict()
+
+    def encode(self, pil_image):
+        """Encode a PIL image in the store's format"""
+        if self.image_format == 'JPEG' and pil_image.mode not in ('RGB', 'L'):
+            pil_image = pil_image.convert('RGB')
+        elif pil_image.mode not in ('RGB', 'RGBA', 'L', 'LA'):
+            pil_image = pil_image.convert('RGBA' if 'A' in pil_image.getbands() else 'RGB')
+        buffer = io.BytesIO()
+        pil_image.save(buffer, self.image_format, quality=self.quality)
+        return buffer.getvalue()
+
+    def get_or_create(self, file_path, width, height):
+        """Return thumbnail bytes, decoding and storing them on a miss"""
+        data = self.get(file_path, width, height)
+        if data is None:
+            data = self.encode(preview.load_preview(file_path, width, height))
+            self.put(file_path, width, height, data)
+        return data
+
+    def iter_entries(self):
+        """Yield (path, size, last access) for every stored thumbnail"""
+        for shard in os.scandir(self.root):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith(self.extension):
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    yield entry.path, stat.st_size, stat.st_mtime
+
+    def disk_usage(self):
+        return sum(size for _, size, _ in self.iter_entries())
+
+    def evict(self):
+        """Delete least recently used thumbnails until under budget"""
+        entries = sorted(self.iter_entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * EVICT_TARGET
+        for path, size, _ in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                continue
+        self.total_bytes = total
+
+    def clear(self):
+        for path, _, _ in list(self.iter_entries()):
+            os.remove(path)
+        self.total_bytes = 0
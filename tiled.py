@@ -0,0 +1,563 @@
+"""Tile-level access to large TIFF and BigTIFF files with a resolution pyramid
+
+TiledTiff parses the IFDs itself (classic and BigTIFF) and decodes one
+tile or strip at a time. Uncompressed tiles are read straight out of a
+memory map. Compressed ones are wrapped in a one-tile TIFF in memory and
+handed to PIL, so every codec PIL supports keeps working.
+
+Pyramid serves any region at 1/2^k resolution. Reduced-resolution pages
+stored in the file are used as they are. Missing levels are built once,
+each by halving the previous one band by band, and cached on disk as .npy
+files, so memory use doesn't depend on the image size.
+"""
+import hashlib
+import io
+import mmap
+import os
+import shutil
+import struct
+import threading
+from collections import OrderedDict
+import numpy as np
+from PIL import Image
+
+# Images above this many pixels get the tiled viewer instead of one preview
+TILED_MIN_PIXELS = 64 * 1024 * 1024
+# Decoded source tiles kept in memory per file
+TILE_CACHE_BYTES = 64 * 1024 * 1024
+# Levels are built down to this size on the longer side
+MIN_LEVEL_SIZE = 512
+DEFAULT_MAX_BYTES = 4 * 1024 * 1024 * 1024
+# Rows handled per step when halving a cached level
+BUILD_BAND_ROWS = 1024
+
+NEW_SUBFILE_TYPE = 254
+IMAGE_WIDTH = 256
+IMAGE_LENGTH = 257
+BITS_PER_SAMPLE = 258
+COMPRESSION = 259
+PHOTOMETRIC = 262
+STRIP_OFFSETS = 273
+SAMPLES_PER_PIXEL = 277
+ROWS_PER_STRIP = 278
+STRIP_BYTE_COUNTS = 279
+PLANAR_CONFIGURATION = 284
+PREDICTOR = 317
+TILE_WIDTH = 322
+TILE_LENGTH = 323
+TILE_OFFSETS = 324
+TILE_BYTE_COUNTS = 325
+SUB_IFDS = 330
+EXTRA_SAMPLES = 338
+SAMPLE_FORMAT = 339
+JPEG_TABLES = 347
+YCBCR_SUBSAMPLING = 530
+
+# TIFF field type -> NumPy type code; rationals are read as integer pairs
+FIELD_TYPES = {
+    1: 'u1', 2: 'u1', 3: 'u2', 4: 'u4', 5: 'u4', 6: 'i1', 7: 'u1', 8: 'i2', 9: 'i4',
+    10: 'i4', 11: 'f4', 12: 'f8', 13: 'u4', 16: 'u8', 17: 'i8', 18: 'u8',
+}
+RATIONAL_TYPES = (5, 10)
+
+# Tags copied into the one-tile TIFF used for decoding
+DECODE_TAGS = (BITS_PER_SAMPLE, COMPRESSION, PHOTOMETRIC, SAMPLES_PER_PIXEL, PLANAR_CONFIGURATION,
+               PREDICTOR, EXTRA_SAMPLES, SAMPLE_FORMAT, JPEG_TABLES, YCBCR_SUBSAMPLING)
+
+
+def default_cache_dir():
+    """Per-user pyramid directory next to the thumbnail store"""
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'image_info', 'pyramids')
+
+
+def read_ifd(buf, offset, endian, big):
+    """Tags of one IFD as {tag: (field type, values array)}, plus the next IFD offset"""
+    if big:
+        count = struct.unpack_from(endian + 'Q', buf, offset)[0]
+        position, entry_format, entry_size, pointer = offset + 8, 'HHQ', 20, 'Q'
+    else:
+        count = struct.unpack_from(endian + 'H', buf, offset)[0]
+        position, entry_format, entry_size, pointer = offset + 2, 'HHI', 12, 'I'
+    inline_size = struct.calcsize(pointer)
+
+    tags = {}
+    for _ in range(count):
+        tag, field_type, value_count = struct.unpack_from(endian + entry_format, buf, position)
+        code = FIELD_TYPES.get(field_type)
+        if code is not None:
+            items = value_count * (2 if field_type in RATIONAL_TYPES else 1)
+            dtype = np.dtype(code).newbyteorder(endian)
+            value_field = position + entry_size - inline_size
+            if items * dtype.itemsize > inline_size:
+                value_field = struct.unpack_from(endian + pointer, buf, value_field)[0]
+            # Copied, the map can't close while arrays point into it
+            tags[tag] = (field_type, np.frombuffer(buf, dtype=dtype, count=items, offset=value_field).copy())
+        position += entry_size
+
+    next_offset = struct.unpack_from(endian + pointer, buf, position)[0]
+    return tags, next_offset
+
+
+def tag_value(tags, tag, default=None):
+    if tag not in tags:
+        return default
+    return int(tags[tag][1][0])
+
+
+def page_mode(tags):
+    """PIL mode a page decodes to, or None when the tiled reader can't handle it"""
+    bits = tags.get(BITS_PER_SAMPLE, (None, [1]))[1]
+    samples = tag_value(tags, SAMPLES_PER_PIXEL, 1)
+    photometric = tag_value(tags, PHOTOMETRIC)
+    compression = tag_value(tags, COMPRESSION, 1)
+    if any(int(b) != 8 for b in bits) or tag_value(tags, SAMPLE_FORMAT, 1) != 1:
+        return None
+    if tag_value(tags, PLANAR_CONFIGURATION, 1) != 1:
+        return None
+    if photometric in (0, 1):
+        return {1: 'L', 2: 'LA'}.get(samples)
+    if photometric == 2:
+        return {3: 'RGB', 4: 'RGBA'}.get(samples)
+    if photometric == 6 and compression == 7 and samples == 3:
+        # JPEG-compressed YCbCr, converted to RGB by the decoder
+        return 'RGB'
+    return None
+
+
+def build_tiff(entries, endian='<'):
+    """Classic TIFF with one IFD of (tag, type, values) entries; values are arrays"""
+    header = struct.pack(endian + '2sHI', b'II' if endian == '<' else b'MM', 42, 8)
+    ifd_size = 2 + 12 * len(entries) + 4
+    data_offset = 8 + ifd_size
+    ifd = [struct.pack(endian + 'H', len(entries))]
+    extra = []
+    for tag, field_type, values in sorted(entries, key=lambda entry: entry[0]):
+        raw = np.ascontiguousarray(values).astype(np.dtype(FIELD_TYPES[field_type]).newbyteorder(endian)).tobytes()
+        count = len(values) // (2 if field_type in RATIONAL_TYPES else 1)
+        if len(raw) <= 4:
+            field = raw.ljust(4, b'\0')
+        else:
+            field = struct.pack(endian + 'I', data_offset)
+            extra.append(raw)
+            data_offset += len(raw) + (len(raw) & 1)
+            if len(raw) & 1:
+                extra.append(b'\0')
+        ifd.append(struct.pack(endian + 'HHI', tag, field_type, count) + field)
+    ifd.append(struct.pack(endian + 'I', 0))
+    return header + b''.join(ifd) + b''.join(extra)
+
+
+class Page:
+    """One full-image IFD split into tiles (strips count as full-width tiles)"""
+
+    def __init__(self, tags, endian):
+        self.tags = tags
+        self.endian = endian
+        self.width = tag_value(tags, IMAGE_WIDTH)
+        self.height = tag_value(tags, IMAGE_LENGTH)
+        self.mode = page_mode(tags)
+        self.samples = tag_value(tags, SAMPLES_PER_PIXEL, 1)
+        self.compression = tag_value(tags, COMPRESSION, 1)
+        self.photometric = tag_value(tags, PHOTOMETRIC)
+        self.reduced = bool(tag_value(tags, NEW_SUBFILE_TYPE, 0) & 1)
+        if TILE_OFFSETS in tags:
+            self.tile_width = tag_value(tags, TILE_WIDTH)
+            self.tile_height = tag_value(tags, TILE_LENGTH)
+            self.offsets = tags[TILE_OFFSETS][1]
+            self.byte_counts = tags[TILE_BYTE_COUNTS][1]
+        else:
+            self.tile_width = self.width
+            self.tile_height = min(tag_value(tags, ROWS_PER_STRIP, self.height), self.height)
+            self.offsets = tags[STRIP_OFFSETS][1]
+            self.byte_counts = tags[STRIP_BYTE_COUNTS][1]
+        self.columns = -(-self.width // self.tile_width)
+        self.rows = -(-self.height // self.tile_height)
+
+    @property
+    def tiled(self):
+        return TILE_OFFSETS in self.tags
+
+    def decode_entries(self, width, height, size):
+        entries = [(IMAGE_WIDTH, 4, [width]), (IMAGE_LENGTH, 4, [height]),
+                   (ROWS_PER_STRIP, 4, [height]), (STRIP_BYTE_COUNTS, 4, [size])]
+        for tag in DECODE_TAGS:
+            if tag in self.tags:
+                field_type, values = self.tags[tag]
+                entries.append((tag, field_type, values))
+        return entries
+
+
+class TiledTiff:
+    """Random access to the tiles of a TIFF or BigTIFF file
+
+    Raises ValueError when the file isn't a TIFF whose first page the
+    tiled reader can decode (8-bit gray or RGB, chunky samples).
+    """
+
+    def __init__(self, file_path, cache_bytes=TILE_CACHE_BYTES):
+        self.file_path = file_path
+        with open(file_path, 'rb') as f:
+            try:
+                self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise ValueError("Empty file") from None
+        try:
+            self.pages = self.read_pages()
+        except (struct.error, IndexError, KeyError, TypeError) as e:
+            self.map.close()
+            raise ValueError(f"Damaged TIFF: {str(e)}") from None
+        if not self.pages or self.pages[0].mode is None:
+            self.map.close()
+            raise ValueError("Unsupported TIFF layout for tiled viewing")
+        self.width, self.height = self.pages[0].width, self.pages[0].height
+        self.mode = self.pages[0].mode
+        self.cache = OrderedDict()
+        self.cache_bytes = cache_bytes
+        self.cached_bytes = 0
+        self.lock = threading.Lock()
+
+    def read_pages(self):
+        buf = self.map
+        order = bytes(buf[:2])
+        if order == b'II':
+            endian = '<'
+        elif order == b'MM':
+            endian = '>'
+        else:
+            raise ValueError("Not a TIFF file")
+        version = struct.unpack_from(endian + 'H', buf, 2)[0]
+        if version == 42:
+            big = False
+            offset = struct.unpack_from(endian + 'I', buf, 4)[0]
+        elif version == 43:
+            big = True
+            offset = struct.unpack_from(endian + 'Q', buf, 8)[0]
+        else:
+            raise ValueError("Not a TIFF file")
+
+        pages = []
+        seen = set()
+        pending = [offset]
+        while pending:
+            offset = pending.pop(0)
+            # Stop at loops and at the end of the chain
+            if not offset or offset in seen or offset >= len(buf):
+                continue
+            seen.add(offset)
+            tags, next_offset = read_ifd(buf, offset, endian, big)
+            if IMAGE_WIDTH in tags and IMAGE_LENGTH in tags and (TILE_OFFSETS in tags or STRIP_OFFSETS in tags):
+                pages.append(Page(tags, endian))
+            if SUB_IFDS in tags:
+                pending.extend(int(sub) for sub in tags[SUB_IFDS][1])
+            pending.append(next_offset)
+        return pages
+
+    def reduced_pages(self):
+        """Decodable reduced-resolution pages with the main page's aspect ratio"""
+        main = self.pages[0]
+        found = []
+        for page in self.pages[1:]:
+            if page.mode != main.mode or page.width >= main.width:
+                continue
+            if abs(page.width / main.width - page.height / main.height) * max(main.width, main.height) > 2:
+                continue
+            found.append(page)
+        return found
+
+    def close(self):
+        with self.lock:
+            self.cache.clear()
+        try:
+            self.map.close()
+        except BufferError:
+            # Tiles still reference the map, it closes once they are collected
+            pass
+
+    def raw_tile(self, page, column, row):
+        """Uncompressed tile as a view into the map, cropped at the image edge, not yet inverted
+
+        Raises ValueError when the file holds fewer bytes than the visible rows need.
+        """
+        index = row * page.columns + column
+        offset, size = int(page.offsets[index]), int(page.byte_counts[index])
+        width = min(page.tile_width, page.width - column * page.tile_width)
+        height = min(page.tile_height, page.height - row * page.tile_height)
+        needed = height * page.tile_width * page.samples
+        if size < needed or offset + needed > len(self.map):
+            raise ValueError(f"Truncated tile at column {column}, row {row}")
+        pixels = np.frombuffer(self.map, dtype=np.uint8, count=needed,
+                               offset=offset).reshape(height, page.tile_width, page.samples)
+        return pixels[:, :width]
+
+    def decode_tile(self, page, column, row):
+        """Decoded compressed tile as a (rows, columns, samples) uint8 array, cropped at the image edge
+
+        Raises ValueError for tiles cut short by the end of the file or that don't decode.
+        """
+        index = row * page.columns + column
+        offset, size = int(page.offsets[index]), int(page.byte_counts[index])
+        width = min(page.tile_width, page.width - column * page.tile_width)
+        height = min(page.tile_height, page.height - row * page.tile_height)
+        channels = len(page.mode)
+        if offset + size > len(self.map):
+            raise ValueError(f"Truncated tile at column {column}, row {row}")
+        # Tiles are stored at full tile size even at the edges
+        stored_height = page.tile_height if page.tiled else height
+        data = build_tiff(page.decode_entries(page.tile_width, stored_height, size) +
+                          [(STRIP_OFFSETS, 4, [0])], page.endian)
+        # The strip goes right after the header, patch its offset in
+        data = patch_strip_offset(data, page.endian, len(data)) + self.map[offset:offset + size]
+        try:
+            with Image.open(io.BytesIO(data)) as img:
+                if img.mode != page.mode:
+                    img = img.convert(page.mode)
+                pixels = np.asarray(img)
+        except OSError as e:
+            raise ValueError(f"Damaged tile at column {column}, row {row}: {str(e)}") from None
+        if channels == 1:
+            pixels = pixels[..., None]
+        if pixels.shape[0] < height or pixels.shape[1] < width:
+            raise ValueError(f"Short tile at column {column}, row {row}")
+        return pixels[:height, :width]
+
+    def tile(self, page, column, row):
+        key = (id(page), column, row)
+        with self.lock:
+            pixels = self.cache.get(key)
+            if pixels is not None:
+                self.cache.move_to_end(key)
+                return pixels
+        pixels = self.decode_tile(page, column, row)
+        with self.lock:
+            self.cache[key] = pixels
+            self.cached_bytes += pixels.nbytes
+            while self.cached_bytes > self.cache_bytes and len(self.cache) > 1:
+                _, evicted = self.cache.popitem(last=False)
+                self.cached_bytes -= evicted.nbytes
+        return pixels
+
+    def read_region(self, page, x, y, width, height):
+        """Pixels of a page region as a (height, width, channels) uint8 array"""
+        channels = len(page.mode)
+        region = np.empty((height, width, channels), dtype=np.uint8)
+        first_column, last_column = x // page.tile_width, (x + width - 1) // page.tile_width
+        first_row, last_row = y // page.tile_height, (y + height - 1) // page.tile_height
+        for row in range(first_row, last_row + 1):
+            for column in range(first_column, last_column + 1):
+                # Uncompressed tiles and strips are sliced in the map, so a
+                # band of a single-strip image only touches the band's rows
+                raw = page.compression == 1
+                pixels = self.raw_tile(page, column, row) if raw else self.tile(page, column, row)
+                tile_x, tile_y = column * page.tile_width, row * page.tile_height
+                left, top = max(x, tile_x), max(y, tile_y)
+                right = min(x + width, tile_x + pixels.shape[1])
+                bottom = min(y + height, tile_y + pixels.shape[0])
+                pixels = pixels[top - tile_y:bottom - tile_y, left - tile_x:right - tile_x, :channels]
+                if raw and page.photometric == 0:
+                    pixels = 255 - pixels
+                region[top - y:bottom - y, left - x:right - x] = pixels
+        return region
+
+
+def patch_strip_offset(data, endian, strip_offset):
+    """Point the StripOffsets entry of a build_tiff() result at strip_offset"""
+    count = struct.unpack_from(endian + 'H', data, 8)[0]
+    for index in range(count):
+        position = 10 + 12 * index
+        if struct.unpack_from(endian + 'H', data, position)[0] == STRIP_OFFSETS:
+            return data[:position + 8] + struct.pack(endian + 'I', strip_offset) + data[position + 12:]
+    return data
+
+
+def release(mapping):
+    """Unmap the resident pages of a read-only or flushed file mapping
+
+    The data stays in the page cache, it just stops counting towards the
+    process's RSS until it is touched again.
+    """
+    advice = getattr(mmap, 'MADV_DONTNEED', None)
+    if mapping is None or advice is None:
+        return
+    try:
+        mapping.madvise(advice)
+    except (OSError, ValueError):
+        pass
+
+
+def halve(pixels):
+    """Downscale a (rows, columns, channels) array by two with a 2×2 box filter"""
+    height, width = pixels.shape[:2]
+    if height % 2 or width % 2:
+        # Repeat the last row or column so edge pixels average with themselves
+        pixels = np.pad(pixels, ((0, height % 2), (0, width % 2), (0, 0)), mode='edge')
+    summed = pixels.reshape(pixels.shape[0] // 2, 2, pixels.shape[1] // 2, 2, -1).sum(axis=(1, 3), dtype=np.uint16)
+    return ((summed + 2) >> 2).astype(np.uint8)
+
+
+def level_size(width, height, level):
+    return -(-width // (1 << level)), -(-height // (1 << level))
+
+
+class Pyramid:
+    """Regions of a TiledTiff at 1/2^level resolution
+
+    Levels come from reduced pages in the file when their size matches and
+    otherwise from .npy files under cache_dir, made by build().
+    """
+
+    def __init__(self, tiff, cache_dir=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.tiff = tiff
+        self.cache_root = cache_dir or default_cache_dir()
+        self.max_bytes = max_bytes
+        self.level_count = 1
+        while max(level_size(tiff.width, tiff.height, self.level_count - 1)) > MIN_LEVEL_SIZE:
+            self.level_count += 1
+
+        # level -> Page or memory-mapped array
+        self.levels = {0: tiff.pages[0]}
+        for page in tiff.reduced_pages():
+            for level in range(1, self.level_count):
+                if level_size(tiff.width, tiff.height, level) == (page.width, page.height):
+                    self.levels.setdefault(level, page)
+
+        stat = os.stat(tiff.file_path)
+        source = f"{os.path.abspath(tiff.file_path)}\0{stat.st_size}\0{stat.st_mtime_ns}"
+        self.directory = os.path.join(
+            self.cache_root, hashlib.sha1(source.encode('utf-8', errors='surrogateescape')).hexdigest())
+        for level in range(1, self.level_count):
+            if level not in self.levels:
+                path = self.level_path(level)
+                if os.path.exists(path):
+                    self.levels[level] = np.load(path, mmap_mode='r')
+        if self.complete() and os.path.isdir(self.directory):
+            # Mark as recently used for eviction
+            os.utime(self.directory)
+
+    def level_path(self, level):
+        return os.path.join(self.directory, f"level{level}.npy")
+
+    def size(self, level):
+        return level_size(self.tiff.width, self.tiff.height, level)
+
+    def available(self, level):
+        return level in self.levels
+
+    def complete(self):
+        return len(self.levels) == self.level_count
+
+    def region(self, level, x, y, width, height):
+        """Pixels of a level region, clipped to the level size"""
+        level_width, level_height = self.size(level)
+        width, height = min(width, level_width - x), min(height, level_height - y)
+        source = self.levels[level]
+        if isinstance(source, Page):
+            return self.tiff.read_region(source, x, y, width, height)
+        return np.asarray(source[y:y + height, x:x + width])
+
+    def mapping(self, level):
+        """The mmap a level is read from"""
+        source = self.levels.get(level)
+        if isinstance(source, Page):
+            return self.tiff.map
+        return getattr(source, '_mmap', None)
+
+    def band_rows(self, level):
+        source = self.levels.get(level)
+        if isinstance(source, Page):
+            # Whole tile rows, so every source tile is decoded once, but
+            # never more than BUILD_BAND_ROWS (single-strip files are one tall tile)
+            rows = source.tile_height
+            while rows < 64:
+                rows *= 2
+            return min(rows + rows % 2, BUILD_BAND_ROWS)
+        return BUILD_BAND_ROWS
+
+    def build(self, progress=None, cancelled=None):
+        """Create the missing levels; progress(done, total) is called per band
+
+        Returns False when cancelled() turned true before the end.
+        """
+        missing = [level for level in range(1, self.level_count) if level not in self.levels]
+        if not missing:
+            return True
+        os.makedirs(self.directory, exist_ok=True)
+        total = sum(-(-self.size(level - 1)[1] // self.band_rows(level - 1)) for level in missing)
+        done = 0
+        channels = len(self.tiff.mode)
+
+        for level in range(1, self.level_count):
+            if level in self.levels:
+                continue
+            width, height = self.size(level)
+            source_width, source_height = self.size(level - 1)
+            tmp_path = self.level_path(level) + '.tmp.npy'
+            target = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.uint8, shape=(height, width, channels))
+            step = self.band_rows(level - 1)
+            try:
+                for top in range(0, source_height, step):
+                    if cancelled is not None and cancelled():
+                        return False
+                    band = self.region(level - 1, 0, top, source_width, step)
+                    halved = halve(band)
+                    target[top // 2:top // 2 + halved.shape[0]] = halved
+                    del band
+                    # Each source row is read once, don't keep it mapped
+                    release(self.mapping(level - 1))
+                    done += 1
+                    if progress is not None:
+                        progress(done, total)
+                target.flush()
+                release(getattr(target, '_mmap', None))
+                del target
+                os.replace(tmp_path, self.level_path(level))
+            finally:
+                # Cancelled or failed half way, leave no partial level behind
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+            self.levels[level] = np.load(self.level_path(level), mmap_mode='r')
+
+        evict(self.cache_root, self.max_bytes, keep=self.directory)
+        return True
+
+
+def evict(root, max_bytes, keep=None):
+    """Drop the least recently used pyramids until root fits in max_bytes"""
+    try:
+        entries = [os.path.join(root, name) for name in os.listdir(root)]
+    except OSError:
+        return
+    sizes = []
+    for directory in entries:
+        try:
+            size = sum(entry.stat().st_size for entry in os.scandir(directory))
+            sizes.append((os.stat(directory).st_mtime, size, directory))
+        except OSError:
+            continue
+    total = sum(size for _, size, _ in sizes)
+    for _, size, directory in sorted(sizes):
+        if total <= max_bytes:
+            break
+        if directory == keep:
+            continue
+        shutil.rmtree(directory, ignore_errors=True)
+        total -= size
+
+
+def open_tiled(file_path, properties=None):
+    """TiledTiff for a file too large for a single preview, else None"""
+    # Qt reports -1 × -1 for headers it can't parse, so only trust positive sizes
+    if (properties is not None and properties['width'] > 0 and properties['height'] > 0
+            and properties['width'] * properties['height'] < TILED_MIN_PIXELS):
+        return None
+    try:
+        with open(file_path, 'rb') as f:
+            if f.read(4) not in (b'II*\x00', b'MM\x00*', b'II+\x00', b'MM\x00+'):
+                return None
+        tiff = TiledTiff(file_path)
+    except (OSError, ValueError):
+        return None
+    if tiff.width * tiff.height < TILED_MIN_PIXELS:
+        tiff.close()
+        return None
+    return tiff
@@ -0,0 +1,299 @@
+"""Zoomable tile viewer for images too large for a single QPixmap
+
+Only the 512 px display tiles inside the viewport are decoded, at the
+pyramid level matching the zoom, on a thread pool of their own. Tiles
+still loading are drawn from coarser tiles already in the cache, so
+panning and zooming never wait on the decoder. Decoded tiles are kept in
+a bounded LRU, the pyramid levels are memory-mapped files.
+"""
+import math
+import threading
+from collections import OrderedDict
+import numpy as np
+from PyQt6.QtWidgets import QWidget
+from PyQt6.QtGui import QImage, QPainter, QColor
+from PyQt6.QtCore import Qt, QObject, QRunnable, QThreadPool, QRectF, pyqtSignal
+import tiled
+
+DISPLAY_TILE = 512
+IMAGE_CACHE_BYTES = 128 * 1024 * 1024
+# Levels this much coarser than the one shown are tried as stand-ins
+FALLBACK_LEVELS = 4
+# Drawing from a finer level than the zoom calls for is capped at this many tiles
+MAX_VISIBLE_TILES = 64
+ZOOM_STEP = 1.25
+MAX_SCALE = 8.0
+
+
+def array_to_qimage(pixels):
+    """Copy a (rows, columns, channels) uint8 array into a QImage"""
+    height, width, channels = pixels.shape
+    if channels == 2:
+        # No gray + alpha QImage format
+        gray, alpha = pixels[..., :1], pixels[..., 1:]
+        pixels = np.concatenate([gray, gray, gray, alpha], axis=2)
+        channels = 4
+    image_format = {1: QImage.Format.Format_Grayscale8, 3: QImage.Format.Format_RGB888,
+                    4: QImage.Format.Format_RGBA8888}[channels]
+    pixels = np.ascontiguousarray(pixels)
+    image = QImage(pixels.data, width, height, width * channels, image_format)
+    # QImage does not own the buffer, detach before it goes away
+    return image.copy()
+
+
+class TileSignals(QObject):
+    # generation, (level, column, row), QImage
+    loaded = pyqtSignal(int, object, object)
+
+
+class TileLoader(QRunnable):
+    """Decode one display tile from the pyramid"""
+
+    def __init__(self, view, generation, key):
+        super().__init__()
+        self.view = view
+        self.generation = generation
+        self.key = key
+        self.pyramid = view.pyramid
+        self.signals = TileSignals()
+
+    def run(self):
+        # Scrolled out of view while queued
+        if self.generation != self.view.generation or self.key not in self.view.wanted:
+            self.signals.loaded.emit(self.generation, self.key, None)
+            return
+        level, column, row = self.key
+        try:
+            pixels = self.pyramid.region(level, column * DISPLAY_TILE, row * DISPLAY_TILE, DISPLAY_TILE, DISPLAY_TILE)
+            image = array_to_qimage(pixels)
+        except Exception:
+            image = None
+        self.signals.loaded.emit(self.generation, self.key, image)
+
+
+class BuildSignals(QObject):
+    # generation, done, total
+    progress = pyqtSignal(int, int, int)
+    finished = pyqtSignal(int, bool)
+
+
+class PyramidBuilder(QRunnable):
+    """Create the missing pyramid levels in the background"""
+
+    def __init__(self, pyramid, generation):
+        super().__init__()
+        self.pyramid = pyramid
+        self.generation = generation
+        self.signals = BuildSignals()
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def run(self):
+        try:
+            done = self.pyramid.build(
+                progress=lambda current, total: self.signals.progress.emit(self.generation, current, total),
+                cancelled=self._cancelled.is_set)
+        except (OSError, ValueError):
+            done = False
+        self.signals.finished.emit(self.generation, done)
+
+
+class TiledImageView(QWidget):
+    """Pan (drag) and zoom (wheel) view over a tiled.TiledTiff; double-click fits"""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setMouseTracking(False)
+        self.setFocusPolicy(Qt.FocusPolicy.WheelFocus)
+        self.thread_pool = QThreadPool(self)
+        self.thread_pool.setMaxThreadCount(max(2, QThreadPool.globalInstance().maxThreadCount() - 1))
+        self.pyramid = None
+        self.builder = None
+        self.build_progress = None
+        self.generation = 0
+        self.images = OrderedDict()
+        self.image_bytes = 0
+        self.pending = set()
+        self.wanted = frozenset()
+        # Screen pixels per full-resolution pixel, and the full-resolution point at the top left
+        self.scale = 1.0
+        self.origin_x = 0.0
+        self.origin_y = 0.0
+        self.drag_start = None
+        # Refit on resize until the user pans or zooms
+        self.fitted = False
+
+    def set_image(self, tiff):
+        """Show a TiledTiff, or nothing for None"""
+        self.clear()
+        if tiff is None:
+            return
+        self.pyramid = tiled.Pyramid(tiff)
+        if not self.pyramid.complete():
+            self.build_progress = (0, 1)
+            self.builder = PyramidBuilder(self.pyramid, self.generation)
+            self.builder.signals.progress.connect(self.on_build_progress)
+            self.builder.signals.finished.connect(self.on_build_finished)
+            self.thread_pool.start(self.builder)
+        self.fit()
+
+    def clear(self):
+        if self.builder is not None:
+            self.builder.cancel()
+            self.builder = None
+        self.generation += 1
+        self.pyramid = None
+        self.build_progress = None
+        self.images.clear()
+        self.image_bytes = 0
+        self.pending.clear()
+        self.wanted = frozenset()
+        self.update()
+
+    def fit(self):
+        if self.pyramid is None:
+            return
+        width, height = self.pyramid.size(0)
+        self.scale = max(min(self.width() / width, self.height() / height), 1e-6)
+        self.origin_x = (width - self.width() / self.scale) / 2
+        self.origin_y = (height - self.height() / self.scale) / 2
+        self.fitted = True
+        self.update()
+
+    def on_build_progress(self, generation, done, total):
+        if generation == self.generation:
+            self.build_progress = (done, total)
+            self.update()
+
+    def on_build_finished(self, generation, done):
+        if generation == self.generation:
+            self.build_progress = None
+            self.builder = None
+            self.update()
+
+    def on_tile_loaded(self, generation, key, image):
+        if generation != self.generation:
+            return
+        self.pending.discard(key)
+        if image is None:
+            return
+        self.images[key] = image
+        self.image_bytes += image.sizeInBytes()
+        while self.image_bytes > IMAGE_CACHE_BYTES and len(self.images) > 1:
+            _, evicted = self.images.popitem(last=False)
+            self.image_bytes -= evicted.sizeInBytes()
+        self.update()
+
+    def level_for_scale(self):
+        """Pyramid level to draw: the coarsest one still at least screen resolution"""
+        wanted = max(0, min(self.pyramid.level_count - 1, int(math.floor(math.log2(1 / self.scale))) if self.scale < 1 else 0))
+        level = wanted
+        while not self.pyramid.available(level):
+            level -= 1
+        return level, wanted
+
+    def visible_tiles(self, level):
+        """(column, row) of the level's display tiles inside the viewport"""
+        span = DISPLAY_TILE * (1 << level)
+        level_width, level_height = self.pyramid.size(level)
+        columns, rows = -(-level_width // DISPLAY_TILE), -(-level_height // DISPLAY_TILE)
+        first_column = max(0, int(self.origin_x // span))
+        first_row = max(0, int(self.origin_y // span))
+        last_column = min(columns - 1, int((self.origin_x + self.width() / self.scale) // span))
+        last_row = min(rows - 1, int((self.origin_y + self.height() / self.scale) // span))
+        return [(column, row) for row in range(first_row, last_row + 1)
+                for column in range(first_column, last_column + 1)]
+
+    def tile_rect(self, level, column, row, image):
+        factor = (1 << level) * self.scale
+        x = (column * DISPLAY_TILE * (1 << level) - self.origin_x) * self.scale
+        y = (row * DISPLAY_TILE * (1 << level) - self.origin_y) * self.scale
+        return QRectF(x, y, image.width() * factor, image.height() * factor)
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), QColor(48, 48, 48))
+        if self.pyramid is None:
+            return
+        painter.setRenderHint(QPainter.RenderHint.SmoothPixmapTransform)
+
+        level, wanted_level = self.level_for_scale()
+        tiles = self.visible_tiles(level)
+        if level < wanted_level and len(tiles) > MAX_VISIBLE_TILES:
+            # The coarse level is still being built, finer ones would need too many tiles
+            tiles = []
+
+        # Coarser tiles already decoded stand in for the ones still loading
+        for coarser in range(min(self.pyramid.level_count - 1, level + FALLBACK_LEVELS), level, -1):
+            for column, row in self.visible_tiles(coarser):
+                image = self.images.get((coarser, column, row))
+                if image is not None:
+                    painter.drawImage(self.tile_rect(coarser, column, row, image), image)
+
+        wanted = set()
+        for column, row in tiles:
+            key = (level, column, row)
+            wanted.add(key)
+            image = self.images.get(key)
+            if image is not None:
+                self.images.move_to_end(key)
+                painter.drawImage(self.tile_rect(level, column, row, image), image)
+            elif key not in self.pending:
+                self.pending.add(key)
+                loader = TileLoader(self, self.generation, key)
+                loader.signals.loaded.connect(self.on_tile_loaded)
+                self.thread_pool.start(loader)
+        self.wanted = frozenset(wanted)
+
+        if self.build_progress is not None:
+            done, total = self.build_progress
+            painter.setPen(QColor(230, 230, 230))
+            painter.drawText(self.rect().adjusted(8, 8, -8, -8),
+                             Qt.AlignmentFlag.AlignLeft | Qt.AlignmentFlag.AlignTop,
+                             f"Building pyramid… {done * 100 // max(total, 1)}%")
+
+    def zoom(self, factor, anchor_x, anchor_y):
+        """Scale by factor keeping the full-resolution point under (anchor_x, anchor_y) in place"""
+        if self.pyramid is None:
+            return
+        width, height = self.pyramid.size(0)
+        minimum = min(self.width() / width, self.height() / height) / 2
+        scale = max(minimum, min(MAX_SCALE, self.scale * factor))
+        point_x = self.origin_x + anchor_x / self.scale
+        point_y = self.origin_y + anchor_y / self.scale
+        self.scale = scale
+        self.origin_x = point_x - anchor_x / scale
+        self.origin_y = point_y - anchor_y / scale
+        self.fitted = False
+        self.update()
+
+    def wheelEvent(self, event):
+        steps = event.angleDelta().y() / 120
+        position = event.position()
+        self.zoom(ZOOM_STEP ** steps, position.x(), position.y())
+
+    def mousePressEvent(self, event):
+        if event.button() == Qt.MouseButton.LeftButton:
+            self.drag_start = (event.position(), self.origin_x, self.origin_y)
+
+    def mouseMoveEvent(self, event):
+        if self.drag_start is None:
+            return
+        start, origin_x, origin_y = self.drag_start
+        delta = event.position() - start
+        self.origin_x = origin_x - delta.x() / self.scale
+        self.origin_y = origin_y - delta.y() / self.scale
+        self.fitted = False
+        self.update()
+
+    def mouseReleaseEvent(self, event):
+        self.drag_start = None
+
+    def mouseDoubleClickEvent(self, event):
+        self.fit()
+
+    def resizeEvent(self, event):
+        if self.pyramid is not None and self.fitted:
+            self.fit()
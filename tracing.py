@@ -0,0 +1,177 @@
+"""Timing spans for the viewer and the batch pipeline
+
+Code marks its stages with `with tracing.span('name'):`. Spans are only
+recorded while a Tracer is active in the current context (thread or
+asyncio task), otherwise span() costs a context variable lookup. A tracer
+can render its spans as a per-stage summary, Chrome trace-event JSON
+(chrome://tracing, Perfetto) or feed Prometheus-style histograms.
+"""
+import contextvars
+import json
+import os
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+
+Span = namedtuple('Span', ['name', 'start_ns', 'duration_ns', 'pid', 'tid', 'args'])
+
+# Histogram bucket upper bounds in seconds
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_current = contextvars.ContextVar('tracer', default=None)
+
+
+@contextmanager
+def span(name, **args):
+    """Time the enclosed block under name in the active tracer, if any"""
+    tracer = _current.get()
+    if tracer is None:
+        yield
+        return
+    start = time.perf_counter_ns()
+    try:
+        yield
+    finally:
+        tracer.add(name, start, time.perf_counter_ns() - start, args)
+
+
+def current():
+    return _current.get()
+
+
+class Tracer:
+    """Collects spans; with metrics, each span is observed as it closes
+
+    keep=False drops spans once observed, so a long run that only wants
+    histograms does not hold every span in memory.
+    """
+
+    def __init__(self, metrics=None, keep=True):
+        self.metrics = metrics
+        self.keep = keep
+        self.spans = []
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def activate(self):
+        """Record spans from this context into the tracer"""
+        token = _current.set(self)
+        try:
+            yield self
+        finally:
+            _current.reset(token)
+
+    def add(self, name, start_ns, duration_ns, args=None):
+        item = Span(name, start_ns, duration_ns, os.getpid(), threading.get_ident(), args or {})
+        with self.lock:
+            self.record(item)
+
+    def extend(self, spans):
+        with self.lock:
+            for item in spans:
+                self.record(Span(*item))
+
+    def record(self, item):
+        if self.metrics is not None:
+            self.metrics.observe(item.name, item.duration_ns / 1e9)
+        if self.keep:
+            self.spans.append(item)
+
+    def clear(self):
+        with self.lock:
+            self.spans = []
+
+    def summary(self):
+        """Per-stage (count, total ns) in order of first appearance"""
+        stages = {}
+        for item in self.spans:
+            count, total = stages.get(item.name, (0, 0))
+            stages[item.name] = (count + 1, total + item.duration_ns)
+        return stages
+
+    def chrome_trace(self):
+        """Spans as Chrome trace-event JSON complete ('X') events"""
+        events = [
+            {
+                'name': item.name, 'ph': 'X', 'pid': item.pid, 'tid': item.tid,
+                'ts': item.start_ns / 1000, 'dur': item.duration_ns / 1000,
+                'args': {key: str(value) for key, value in item.args.items()},
+            }
+            for item in self.spans
+        ]
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def write_chrome_trace(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.chrome_trace(), f)
+
+
+def traced_chunk(worker, file_paths):
+    """Process pool entry point: run worker per file and return (item, spans) pairs
+
+    Spans recorded in the worker process travel back with each result so
+    the parent tracer sees the whole pipeline.
+    """
+    results = []
+    for file_path in file_paths:
+        tracer = Tracer()
+        with tracer.activate(), span('extract'):
+            items = worker([file_path])
+        results.extend((item, tracer.spans) for item in items)
+    return results
+
+
+class Metrics:
+    """Prometheus-style counters and per-stage latency histograms"""
+
+    def __init__(self, prefix='image_info', buckets=DEFAULT_BUCKETS):
+        self.prefix = prefix
+        self.buckets = buckets
+        self.counters = {}
+        # stage -> [bucket counts..., +Inf count], sum in seconds
+        self.histograms = {}
+        self.sums = {}
+
+    def inc(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, stage, seconds):
+        counts = self.histograms.get(stage)
+        if counts is None:
+            counts = self.histograms[stage] = [0] * (len(self.buckets) + 1)
+            self.sums[stage] = 0.0
+        for index, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                counts[index] += 1
+                break
+        else:
+            counts[-1] += 1
+        self.sums[stage] += seconds
+
+    def render(self):
+        """Text exposition format"""
+        lines = []
+        for name, value in self.counters.items():
+            metric = f"{self.prefix}_{name}_total"
+            lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric} {value}")
+
+        metric = f"{self.prefix}_stage_duration_seconds"
+        if self.histograms:
+            lines.append(f"# HELP {metric} Time spent per pipeline stage")
+            lines.append(f"# TYPE {metric} histogram")
+        for stage, counts in self.histograms.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f'{metric}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            cumulative += counts[-1]
+            lines.append(f'{metric}_bucket{{stage="{stage}",le="+Inf"}} {cumulative}')
+            lines.append(f'{metric}_sum{{stage="{stage}"}} {self.sums[stage]:.9f}')
+            lines.append(f'{metric}_count{{stage="{stage}"}} {cumulative}')
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(self.render())
@@ -0,0 +1,494 @@
+"""Main window of the metadata viewer
+
+Started through img_info.py. Modules only needed once a file is open
+(the loader, the tile viewer and through them NumPy) are imported on
+first use, and preload() pulls them in on a background thread after the
+window is up, so it appears without waiting for them.
+"""
+import os
+import sqlite3
+import threading
+import time
+from importlib import import_module
+from PyQt6.QtWidgets import (QMainWindow, QLabel, QVBoxLayout, 
+                            QWidget, QPushButton, QFileDialog, QTextEdit, 
+                            QScrollArea, QHBoxLayout, QDockWidget, QCheckBox,
+                            QInputDialog)
+from PyQt6.QtGui import QPixmap, QMovie
+from PyQt6.QtCore import Qt, QSize, QFileInfo, QThreadPool, QFileSystemWatcher, QTimer
+import json
+import animation
+import metadata
+import tracing
+from thumbnails import ThumbnailCache
+from browser import FolderBrowser
+
+# Imported by preload() once the window is shown
+DEFERRED_MODULES = ('loader', 'tiled_view', 'catalog')
+
+
+def preload():
+    """Import DEFERRED_MODULES on a background thread"""
+    def run():
+        for name in DEFERRED_MODULES:
+            import_module(name)
+    thread = threading.Thread(target=run, name="preload", daemon=True)
+    thread.start()
+    return thread
+
+
+class ImageInfoApp(QMainWindow):
+    # Parsing helpers live in the GUI-free metadata module
+    get_raw_exif_data = staticmethod(metadata.get_raw_exif_data)
+    get_exif_data = staticmethod(metadata.get_exif_data)
+    parse_gps_info = staticmethod(metadata.parse_gps_info)
+    format_dms = staticmethod(metadata.format_dms)
+    dms_to_decimal = staticmethod(metadata.dms_to_decimal)
+    format_gps_info = staticmethod(metadata.format_gps_info)
+    format_size = staticmethod(metadata.format_size)
+
+    def __init__(self):
+        super().__init__()
+        self.setWindowTitle("Advanced Image Metadata Viewer")
+        self.setGeometry(100, 100, 1000, 800)
+        self.current_file_path = None
+        self.catalog_path = None
+        self.catalog_filters = ""
+        
+        # Central widget and layout
+        central_widget = QWidget()
+        self.setCentralWidget(central_widget)
+        main_layout = QVBoxLayout(central_widget)
+        
+        # Image preview
+        self.image_label = QLabel()
+        self.image_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        self.image_label.setFixedHeight(350)
+        self.image_label.setStyleSheet("border: 1px solid black;")
+        main_layout.addWidget(self.image_label)
+        
+        # Stands in for the preview label when a gigapixel TIFF is open,
+        # created with the first one
+        self.tiled_view = None
+        self.main_layout = main_layout
+        
+        # Button row
+        button_layout = QHBoxLayout()
+        
+        self.load_button = QPushButton("Load Image")
+        self.load_button.clicked.connect(self.load_image)
+        button_layout.addWidget(self.load_button)
+        
+        self.folder_button = QPushButton("Open Folder")
+        self.folder_button.clicked.connect(self.open_folder)
+        button_layout.addWidget(self.folder_button)
+        
+        self.catalog_button = QPushButton("Query Catalog")
+        self.catalog_button.clicked.connect(self.query_catalog)
+        button_layout.addWidget(self.catalog_button)
+        
+        self.export_button = QPushButton("Export Raw Data")
+        self.export_button.clicked.connect(self.export_raw_data)
+        self.export_button.setEnabled(False)
+        button_layout.addWidget(self.export_button)
+        
+        self.timings_checkbox = QCheckBox("Show Timings")
+        self.timings_checkbox.toggled.connect(self.on_load_option_toggled)
+        button_layout.addWidget(self.timings_checkbox)
+        
+        self.pixel_stats_checkbox = QCheckBox("Analyze Pixels")
+        self.pixel_stats_checkbox.toggled.connect(self.on_load_option_toggled)
+        button_layout.addWidget(self.pixel_stats_checkbox)
+        
+        self.hashes_checkbox = QCheckBox("Compute Hashes")
+        self.hashes_checkbox.toggled.connect(self.on_load_option_toggled)
+        button_layout.addWidget(self.hashes_checkbox)
+        
+        main_layout.addLayout(button_layout)
+        
+        # Text area for image info
+        self.info_text = QTextEdit()
+        self.info_text.setReadOnly(True)
+        self.info_text.setStyleSheet("""
+            font-family: Consolas, monospace; 
+            font-size: 12px;
+            color: #333;
+        """)
+        
+        # Add scroll area
+        scroll = QScrollArea()
+        scroll.setWidget(self.info_text)
+        scroll.setWidgetResizable(True)
+        main_layout.addWidget(scroll)
+        
+        # Initialize variables
+        self.current_image = None
+        self.current_tiff = None
+        self.current_movie = None
+        self.raw_exif_data = None
+        
+        # Background loading
+        self.thread_pool = QThreadPool.globalInstance()
+        self.current_loader = None
+        self.load_request_id = 0
+        self.load_started_ns = None
+        self.thumbnail_cache = ThumbnailCache()
+        
+        # Folder browser, shown once a folder is opened
+        self.folder_browser = FolderBrowser(self.thumbnail_cache)
+        self.folder_browser.file_selected.connect(self.open_file)
+        self.browser_dock = QDockWidget("Folder", self)
+        self.browser_dock.setWidget(self.folder_browser)
+        self.addDockWidget(Qt.DockWidgetArea.LeftDockWidgetArea, self.browser_dock)
+        self.browser_dock.hide()
+        
+        # Reload the shown file when it changes on disk
+        self.file_watcher = QFileSystemWatcher(self)
+        self.file_watcher.fileChanged.connect(self.on_file_changed)
+        self.reload_timer = QTimer(self)
+        self.reload_timer.setSingleShot(True)
+        self.reload_timer.setInterval(300)
+        self.reload_timer.timeout.connect(self.reload_current_file)
+    
+    def load_image(self):
+        file_dialog = QFileDialog()
+        file_path, _ = file_dialog.getOpenFileName(
+            self, 
+            "Open Image File", 
+            "", 
+            "Images (" + " ".join("*" + ext for ext in metadata.IMAGE_EXTENSIONS) + ")"
+        )
+        
+        if file_path:
+            self.open_file(file_path)
+    
+    def open_folder(self):
+        folder = QFileDialog.getExistingDirectory(self, "Open Folder")
+        if folder:
+            self.folder_browser.set_folder(folder)
+            self.browser_dock.show()
+    
+    def query_catalog(self):
+        if not self.catalog_path:
+            path, _ = QFileDialog.getOpenFileName(
+                self, "Open Metadata Cache", "", "SQLite databases (*.db *.sqlite);;All files (*)")
+            if not path:
+                return
+            self.catalog_path = path
+        
+        filters, ok = QInputDialog.getText(
+            self, "Query Catalog",
+            'Filters, e.g. --model "EOS 5D" --min-mp 20 --year 2023 --no-gps',
+            text=self.catalog_filters)
+        if not ok:
+            return
+        self.catalog_filters = filters
+        
+        import catalog
+        from cache import MetadataCache
+        try:
+            with MetadataCache(self.catalog_path, readonly=True) as cache:
+                files = catalog.Catalog(cache).paths(**catalog.parse_filters(filters))
+        except (ValueError, sqlite3.Error) as e:
+            self.info_text.setText(f"Catalog query error: {str(e)}")
+            return
+        
+        self.folder_browser.set_files(files, f"{os.path.basename(self.catalog_path)}: {filters or 'all'} ({len(files)})")
+        self.browser_dock.show()
+    
+    def open_file(self, file_path):
+        self.current_file_path = file_path
+        self.watch_file(file_path)
+        self.display_image_info(file_path)
+        self.export_button.setEnabled(True)
+    
+    def watch_file(self, file_path):
+        if self.file_watcher.files():
+            self.file_watcher.removePaths(self.file_watcher.files())
+        self.file_watcher.addPath(file_path)
+    
+    def on_file_changed(self, file_path):
+        # Writers often replace the file, which drops it from the watcher
+        if file_path == self.current_file_path:
+            self.reload_timer.start()
+    
+    def reload_current_file(self):
+        file_path = self.current_file_path
+        if file_path and os.path.exists(file_path):
+            self.watch_file(file_path)
+            self.display_image_info(file_path)
+    
+    def export_raw_data(self):
+        if not self.current_file_path or not self.raw_exif_data:
+            return
+            
+        file_dialog = QFileDialog()
+        save_path, _ = file_dialog.getSaveFileName(
+            self,
+            "Save Raw Data",
+            "",
+            "Text Files (*.txt)"
+        )
+        
+        if save_path:
+            try:
+                with open(save_path, 'w') as f:
+                    f.write(f"Image Path: {self.current_file_path}\n")
+                    f.write("="*50 + "\n")
+                    f.write("RAW EXIF DATA:\n")
+                    f.write(json.dumps(self.raw_exif_data, indent=4))
+                self.info_text.append("\nRaw data exported successfully!")
+            except Exception as e:
+                self.info_text.append(f"\nExport error: {str(e)}")
+    
+    def display_image_info(self, file_path):
+        self.info_text.clear()
+        self.raw_exif_data = None
+        
+        # Stop animation if any
+        if self.current_movie:
+            self.current_movie.stop()
+            self.image_label.setMovie(None)
+            self.current_movie = None
+        
+        # Drop whatever is still loading for the previous file
+        if self.current_loader:
+            self.current_loader.cancel()
+        
+        self.load_request_id += 1
+        self.load_started_ns = time.perf_counter_ns()
+        self.image_label.clear()
+        self.show_tiled(None)
+        self.info_text.setText(f"Loading {os.path.basename(file_path)}...")
+        
+        from loader import ImageLoader
+        self.current_loader = ImageLoader(
+            self.load_request_id,
+            file_path,
+            self.image_label.width(),
+            self.image_label.height(),
+            self.thumbnail_cache,
+            self.pixel_stats_checkbox.isChecked(),
+            self.hashes_checkbox.isChecked()
+        )
+        self.current_loader.signals.loaded.connect(self.on_image_loaded)
+        self.thread_pool.start(self.current_loader)
+    
+    def on_image_loaded(self, request_id, result):
+        if request_id != self.load_request_id:
+            # Superseded, nothing will show the tile viewer's TIFF
+            if result['tiled'] is not None:
+                result['tiled'].close()
+            return
+        self.current_loader = None
+        self.info_text.clear()
+        
+        # The loader's tracer also collects the GUI thread stages
+        tracer = result['trace']
+        with tracer.activate():
+            self.show_result(result)
+        tracer.add('display_image_info', self.load_started_ns, time.perf_counter_ns() - self.load_started_ns)
+        if self.timings_checkbox.isChecked():
+            self.show_performance(tracer)
+    
+    def show_result(self, result):
+        file_path = result['file_path']
+        animation_info = result['animation']
+        if result['properties'] is None:
+            if animation_info is not None and file_path.lower().endswith('.gif'):
+                with tracing.span('movie'):
+                    self.handle_gif_file(file_path, animation_info)
+                return
+            self.info_text.setText("Failed to load image.")
+            return
+        
+        if result['tiled'] is not None:
+            with tracing.span('tiled_view'):
+                self.show_tiled(result['tiled'])
+        else:
+            with tracing.span('pixmap'):
+                self.show_image_preview(result['preview'])
+        if animation_info is not None and animation_info['animated']:
+            with tracing.span('movie'):
+                self.play_animation(file_path, animation_info)
+        with tracing.span('render_info'):
+            self.show_file_metadata(file_path)
+            self.show_image_metadata(result['properties'])
+            if animation_info is not None and animation_info['animated']:
+                self.show_animation_info(animation_info)
+            self.show_advanced_metadata(result['advanced'])
+            if result['hashes'] is not None:
+                self.show_hashes(result['hashes'])
+            if result['pixel_stats'] is not None:
+                self.show_pixel_stats(result['pixel_stats'])
+    
+    def on_load_option_toggled(self, checked):
+        # Timings, pixel statistics and hashes are taken per load, so show them for a fresh one
+        if self.current_file_path:
+            self.display_image_info(self.current_file_path)
+    
+    def handle_gif_file(self, file_path, animation_info):
+        if self.play_animation(file_path, animation_info):
+            self.show_animation_info(animation_info)
+        else:
+            self.info_text.setText("Failed to load GIF animation.")
+
+    def play_animation(self, file_path, animation_info):
+        movie = QMovie(file_path)
+        if not movie.isValid():
+            return False
+        # Fit the label like static previews, the canvas size is already known
+        size = QSize(animation_info['width'], animation_info['height'])
+        movie.setScaledSize(size.scaled(self.image_label.width(), self.image_label.height(),
+                                        Qt.AspectRatioMode.KeepAspectRatio))
+        self.current_movie = movie
+        self.image_label.setMovie(movie)
+        movie.start()
+        return True
+
+    def show_image_preview(self, preview):
+        # Decoded and scaled by the loader, only the pixmap upload is left
+        self.current_image = preview
+        if preview is None or preview.isNull():
+            self.image_label.clear()
+            return
+        
+        self.image_label.setPixmap(QPixmap.fromImage(preview))
+
+    def show_tiled(self, tiff):
+        # Swap the preview label for the tile viewer and back
+        if self.current_tiff is not None:
+            self.tiled_view.set_image(None)
+            self.current_tiff.close()
+        self.current_tiff = tiff
+        if tiff is None:
+            if self.tiled_view is not None:
+                self.tiled_view.hide()
+            self.image_label.show()
+            return
+        if self.tiled_view is None:
+            from tiled_view import TiledImageView
+            self.tiled_view = TiledImageView()
+            self.tiled_view.setFixedHeight(350)
+            self.tiled_view.setStyleSheet("border: 1px solid black;")
+            self.main_layout.insertWidget(self.main_layout.indexOf(self.image_label) + 1, self.tiled_view)
+        self.image_label.hide()
+        self.tiled_view.show()
+        self.tiled_view.set_image(tiff)
+
+    def show_file_metadata(self, file_path):
+        file_info = QFileInfo(file_path)
+        info = "=== FILE METADATA ===\n"
+        info += f"• Path: {file_path}\n"
+        info += f"• Name: {os.path.basename(file_path)}\n"
+        info += f"• Size: {self.format_size(file_info.size())}\n"
+        info += f"• Created: {file_info.birthTime().toString() if file_info.birthTime().isValid() else 'Unknown'}\n"
+        info += f"• Modified: {file_info.lastModified().toString()}\n"
+        info += f"• Accessed: {file_info.lastRead().toString()}\n\n"
+        self.info_text.insertPlainText(info)
+
+    def show_image_metadata(self, properties):
+        info = "=== IMAGE PROPERTIES ===\n"
+        info += f"• Dimensions: {properties['width']} × {properties['height']} px\n"
+        if properties['depth'] is not None:
+            info += f"• Color depth: {properties['depth']} bits\n"
+        info += f"• Format: {str(properties['format'])}\n"
+        
+        if properties['color_space']:
+            info += f"• Color space: {properties['color_space']}\n"
+        
+        info += f"• Alpha channel: {'Yes' if properties['alpha'] else 'No'}\n"
+        
+        if properties['dpi']:
+            dpi_x, dpi_y = properties['dpi']
+            info += f"• Resolution: {dpi_x:.1f} × {dpi_y:.1f} DPI\n"
+        
+        self.info_text.insertPlainText(info)
+
+    def show_advanced_metadata(self, advanced):
+        if advanced.get('error'):
+            self.info_text.insertPlainText(f"\nMETADATA ERROR: {advanced['error']}\n")
+            return
+        
+        info = "\n=== ADVANCED METADATA ===\n"
+        info += f"• PIL format: {advanced['format']}\n"
+        info += f"• Color mode: {advanced['mode']}\n"
+        
+        # Keep raw EXIF data for export
+        self.raw_exif_data = advanced['raw_exif']
+        
+        # EXIF data processing
+        exif = advanced['exif']
+        if exif:
+            info += "\nEXIF DATA:\n"
+            for tag, value in exif.items():
+                if tag == "GPSInfo":
+                    info += self.format_gps_info(value)
+                else:
+                    info += f"• {tag}: {value}\n"
+        
+        # Format-specific metadata
+        if advanced['png_info'] is not None:
+            info += "\nPNG METADATA:\n"
+            for k, v in advanced['png_info'].items():
+                info += f"• {k}: {v}\n"
+        
+        self.info_text.insertPlainText(info)
+
+    def show_hashes(self, file_hashes):
+        if file_hashes.get('error'):
+            self.info_text.insertPlainText(f"\nHASH ERROR: {file_hashes['error']}\n")
+            return
+        
+        import hashes
+        info = "\n=== HASHES ===\n"
+        info += f"• Content (BLAKE2b): {file_hashes['content_hash']}\n"
+        info += f"• dHash: {hashes.format_hash(file_hashes['dhash']) or 'N/A'}\n"
+        info += f"• pHash: {hashes.format_hash(file_hashes['phash']) or 'N/A'}\n"
+        self.info_text.insertPlainText(info)
+
+    def show_pixel_stats(self, stats):
+        if stats.get('error'):
+            self.info_text.insertPlainText(f"\nPIXEL STATISTICS ERROR: {stats['error']}\n")
+            return
+        
+        import analysis
+        info = "\n=== PIXEL STATISTICS ===\n"
+        info += analysis.format_stats(stats)
+        self.info_text.insertPlainText(info)
+
+    def show_animation_info(self, animation_info):
+        # Read by the loader in one pass over the frame control blocks
+        frame_count = animation_info['frame_count']
+        info = "\n=== ANIMATION ===\n"
+        info += f"• Format: {animation_info['format']}\n"
+        info += f"• Canvas: {animation_info['width']} × {animation_info['height']} px\n"
+        info += f"• Frame count: {animation_info['frame_count']}\n"
+        info += f"• Loop: {animation.format_loop_count(animation_info['loop_count'])}\n"
+        info += f"• Total duration: {animation_info['total_duration'] / 1000:.2f} s\n"
+        if frame_count:
+            info += (f"• Frame duration: {animation_info['min_duration']:g}–{animation_info['max_duration']:g} ms "
+                     f"(average {animation_info['total_duration'] / frame_count:.1f} ms)\n")
+            info += f"• Durations: {animation.format_duration_histogram(animation_info['duration_histogram'])}\n"
+        info += "• Disposal: " + ", ".join(f"{k}: {v}" for k, v in animation_info['disposal'].items()) + "\n"
+        if animation_info['blend']:
+            info += "• Blend: " + ", ".join(f"{k}: {v}" for k, v in animation_info['blend'].items()) + "\n"
+        
+        info += "\nFRAMES:\n"
+        for frame in animation_info['frames']:
+            info += (f"• #{frame['index']}: {frame['duration']:g} ms, "
+                     f"{frame['width']} × {frame['height']} at ({frame['x']}, {frame['y']}), "
+                     f"dispose {frame['disposal']}\n")
+        remaining = animation_info['frame_count'] - len(animation_info['frames'])
+        if remaining > 0:
+            info += f"• … {remaining} more frames\n"
+        
+        self.info_text.insertPlainText(info)
+
+    def show_performance(self, tracer):
+        # Nested stages (exif within pil_open) count towards their parent too
+        info = "\n=== PERFORMANCE ===\n"
+        for name, (count, total_ns) in tracer.summary().items():
+            info += f"• {name}: {total_ns / 1e6:.2f} ms"
+            info += f" ({count} calls)\n" if count > 1 else "\n"
+        self.info_text.insertPlainText(info)